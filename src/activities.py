@@ -1,114 +1,215 @@
 from temporalio import activity
 import os
-from openai import AsyncOpenAI
-from typing import Dict
+from typing import Optional
 import logging
 import json
-from data import ScrapedData
+import asyncio
+import random
+from concurrency import get_limiter, is_overload_error
+from data import AnalyzedContent, Content, ScrapedData, SentimentResults
 from prompt import create_sentiment_analysis_prompt
-from sheets_util import SheetsClient
+from sinks import get_sinks, primary_sink_name, required_fields
+from spool import SpoolFullError
 
 logger = logging.getLogger(__name__)
 
+def _content_source(scraped_data: ScrapedData, content: Content) -> Optional[str]:
+    """Subreddit or search query an item was scraped from."""
+    metadata = scraped_data.metadata or {}
+    platform_specific_data = content.platform_specific_data or {}
+    return metadata.get("subreddit") or platform_specific_data.get("query") or metadata.get("query")
+
+# Attempts per item when OpenAI reports overload (429) or times out
+MAX_COMPLETION_ATTEMPTS = 3
+
+async def _create_completion(client, limiter, prompt: str):
+    """Request one analysis through the adaptive limiter, retrying on overload."""
+    for attempt in range(MAX_COMPLETION_ATTEMPTS):
+        try:
+            async with limiter.slot():
+                return await client.chat.completions.create(
+                    model="gpt-4o-mini",
+                    messages=[
+                        {"role": "system", "content": "You are a sentiment analysis expert. Analyze content thoroughly and provide analysis in the requested JSON format only."},
+                        {"role": "user", "content": prompt}
+                    ],
+                    temperature=0.3,
+                    response_format={"type": "json_object"}
+                )
+        except Exception as e:
+            if not is_overload_error(e) or attempt == MAX_COMPLETION_ATTEMPTS - 1:
+                raise
+            # Back off with jitter; the limiter has already reduced concurrency
+            delay = (2 ** attempt) + random.random()
+            logger.warning(f"OpenAI overloaded ({type(e).__name__}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
 @activity.defn
-async def analyze_sentiment(scraped_data: ScrapedData) -> Dict:
-    """Analyze sentiment of scraped content using OpenAI."""
-    # Initialize OpenAI client
-    client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+async def analyze_sentiment(scraped_data: ScrapedData, include_content: bool = False) -> SentimentResults:
+    """
+    Analyze sentiment of scraped content using OpenAI.
+    
+    Each analyzed post is an AnalyzedContent record projected to the fields the
+    configured result sinks need (see sinks.required_fields), so the payload
+    does not grow with author, reply and engagement data nobody reads. Fields
+    outside the projection are left as None.
+    
+    Callers inside workflows pass both arguments, so each is decoded to its
+    declared type.
+    
+    Args:
+        scraped_data: Content to analyze
+        include_content: Also return the full scraped content of every post
+    """
+    # Imported here so workers without analysis activities never load openai
+    from openai import AsyncOpenAI
+    
+    # Initialize OpenAI client. Its own retries are disabled so every 429 and
+    # timeout reaches the adaptive limiter (see _create_completion).
+    client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+    limiter = get_limiter("openai")
+    
+    fields = required_fields()
+    if include_content:
+        fields.add("content")
     
     analyzed_posts = []
-    total_sentiment = 0
+    scores = []
+    completed_ids = set()
+    
+    # Resume from the last checkpoint if this is a retry
+    heartbeat_details = activity.info().heartbeat_details
+    if heartbeat_details:
+        checkpoint = heartbeat_details[0]
+        analyzed_posts = [AnalyzedContent.model_validate(post) for post in checkpoint["analyzed_posts"]]
+        scores = checkpoint["scores"]
+        completed_ids = set(checkpoint["completed_ids"])
+        logger.info(f"Resuming sentiment analysis after {len(completed_ids)} completed items")
     
-    for content in scraped_data.items:
+    async def analyze_item(content: Content) -> None:
         # Create prompt for sentiment analysis
         prompt = create_sentiment_analysis_prompt(content)
         
+        record = AnalyzedContent(
+            id=content.id,
+            platform=content.platform,
+            source=_content_source(scraped_data, content),
+            title=content.title,
+            text=content.text,
+            created_at=content.created_at,
+            url=content.url,
+            content=content if include_content else None
+        )
+        
         try:
             # Get analysis from OpenAI
-            response = await client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": "You are a sentiment analysis expert. Analyze content thoroughly and provide analysis in the requested JSON format only."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.3,
-                response_format={"type": "json_object"}
-            )
+            response = await _create_completion(client, limiter, prompt)
             
             # Parse the response
             try:
                 # Parse the LLM response and extract sentiment analysis
                 sentiment_data = json.loads(response.choices[0].message.content)
                 
-                # Update the content object with sentiment analysis results
-                content_dict = content.model_dump()
-                if "platform_specific_data" not in content_dict:
-                    content_dict["platform_specific_data"] = {}
-                
-                content_dict["platform_specific_data"]["sentiment_analysis"] = sentiment_data["sentiment_analysis"]
-                content_dict["platform_specific_data"]["summary"] = sentiment_data["summary"]
+                # Record the sentiment analysis results
+                record.sentiment_analysis = sentiment_data["sentiment_analysis"]
+                record.sentiment_score = sentiment_data["sentiment_analysis"]["sentiment_score"]
+                record.summary = sentiment_data["summary"]
                 
-                # Add to analyzed posts and update total sentiment
-                analyzed_posts.append(content_dict)
-                total_sentiment += sentiment_data["sentiment_analysis"]["sentiment_score"]
-                
-                logger.info(f"Analyzed {content.platform} content {content.id} with sentiment score {sentiment_data['sentiment_analysis']['sentiment_score']}")
+                logger.info(f"Analyzed {content.platform} content {content.id} with sentiment score {record.sentiment_score}")
                 
             except (json.JSONDecodeError, KeyError) as e:
                 logger.error(f"Error parsing analysis JSON: {e}")
-                analyzed_posts.append(content.model_dump())
-                total_sentiment += 0.5
                 
         except Exception as e:
             logger.error(f"Error analyzing content {content.id}: {e}")
-            analyzed_posts.append(content.model_dump())
-            total_sentiment += 0.5
-    
-    # Calculate average sentiment
-    avg_sentiment = total_sentiment / len(scraped_data.items) if scraped_data.items else 0.5
-    
-    # Create sentiment distribution buckets
-    sentiment_distribution = {
-        "positive": len([p for p in analyzed_posts if p.get("platform_specific_data", {}).get("sentiment_analysis", {}).get("sentiment_score", 0.5) > 0.6]),
-        "neutral": len([p for p in analyzed_posts if 0.4 <= p.get("platform_specific_data", {}).get("sentiment_analysis", {}).get("sentiment_score", 0.5) <= 0.6]),
-        "negative": len([p for p in analyzed_posts if p.get("platform_specific_data", {}).get("sentiment_analysis", {}).get("sentiment_score", 0.5) < 0.4])
-    }
-    
-    return {
-        "analyzed_posts": analyzed_posts,
-        "distribution": sentiment_distribution,
-        "average_sentiment": avg_sentiment,
-        "platform": scraped_data.platform,
-        "metadata": {
+        
+        analyzed_posts.append(AnalyzedContent.model_validate(record.model_dump(include=fields)))
+        scores.append(record.sentiment_score)
+        completed_ids.add(content.id)
+        
+        # Checkpoint progress so a retry doesn't repeat the LLM calls made so far
+        activity.heartbeat({
+            "completed_ids": list(completed_ids),
+            "analyzed_posts": [post.model_dump(exclude_none=True) for post in analyzed_posts],
+            "scores": scores
+        })
+    
+    # Items are analyzed concurrently; the shared limiter decides how many
+    # requests are in flight across every running analysis
+    await asyncio.gather(*(
+        analyze_item(content) for content in scraped_data.items
+        if content.id not in completed_ids
+    ))
+    
+    # Keep the posts in the order they were scraped
+    order = {content.id: index for index, content in enumerate(scraped_data.items)}
+    analyzed_posts.sort(key=lambda post: order.get(post.id, len(order)))
+    
+    # Calculate average sentiment, counting failed analyses as neutral
+    scores = [0.5 if score is None else score for score in scores]
+    avg_sentiment = sum(scores) / len(scores) if scores else 0.5
+    
+    # Create sentiment distribution buckets in a single pass
+    sentiment_distribution = {"positive": 0, "neutral": 0, "negative": 0}
+    for score in scores:
+        if score > 0.6:
+            sentiment_distribution["positive"] += 1
+        elif score >= 0.4:
+            sentiment_distribution["neutral"] += 1
+        else:
+            sentiment_distribution["negative"] += 1
+    
+    return SentimentResults(
+        analyzed_posts=analyzed_posts,
+        distribution=sentiment_distribution,
+        average_sentiment=avg_sentiment,
+        platform=scraped_data.platform,
+        metadata={
             "original_metadata": scraped_data.metadata,
             "analysis_timestamp": scraped_data.timestamp
         }
-    }
+    )
 
 @activity.defn
-async def store_results_in_sheets(sentiment_results: Dict) -> bool:
+async def store_results_in_sheets(sentiment_results: SentimentResults) -> bool:
     """
-    Activity to store sentiment analysis results in Google Sheets.
+    Activity to store sentiment analysis results in the configured result sinks.
+    
+    The local results store is written first; Google Sheets is kept as an
+    optional downstream mirror (see sinks.get_sinks). A failure of the primary
+    store, or a full Google Sheets spool, is raised so the activity is retried
+    instead of losing the batch; other mirror failures are best-effort.
     
     Args:
-        sentiment_results: Dictionary containing sentiment analysis results
+        sentiment_results: Results returned by analyze_sentiment
         
     Returns:
-        bool: True if successful, False otherwise
+        bool: True if every sink succeeded, False if a mirror failed
     """
-    try:
-        # Initialize the Google Sheets client
-        sheets_client = SheetsClient()
+    loop = asyncio.get_event_loop()
+    success = True
+    sinks = get_sinks()
+    primary = primary_sink_name()
+    if primary and primary not in [sink.name for sink in sinks]:
+        raise RuntimeError(f"Primary result sink '{primary}' is not available")
+    
+    for sink in sinks:
+        try:
+            # Sinks do blocking I/O, so run them in an executor
+            stored = await loop.run_in_executor(None, sink.write, sentiment_results)
+        except Exception as e:
+            logger.error(f"Error storing sentiment results in sink '{sink.name}': {e}")
+            if sink.name == primary or isinstance(e, SpoolFullError):
+                raise
+            stored = False
         
-        # Store the results
-        success = sheets_client.append_sentiment_results(sentiment_results)
+        if not stored and sink.name == primary:
+            raise RuntimeError(f"Primary result sink '{primary}' failed to store the results")
         
-        if success:
-            logger.info("Successfully stored sentiment results in Google Sheets")
+        if stored:
+            logger.info(f"Successfully stored sentiment results in sink '{sink.name}'")
         else:
-            logger.error("Failed to store sentiment results in Google Sheets")
-            
-        return success
-    except Exception as e:
-        logger.error(f"Error storing sentiment results in Google Sheets: {e}")
-        return False
+            logger.error(f"Failed to store sentiment results in sink '{sink.name}'")
+        success = success and stored
+    
+    return success
@@ -0,0 +1,374 @@
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SNAPSHOT_PATH = "data/aggregates.json"
+
+# Window name -> (window length in seconds, number of slots per window). The
+# slot width bounds how precisely a sliding window follows the clock.
+WINDOWS: Dict[str, Tuple[int, int]] = {
+    "1m": (60, 60),
+    "1h": (3600, 60),
+    "1d": (86400, 24),
+}
+
+# Sentiment scores are in [0, 1]; the histogram splits that range evenly.
+HISTOGRAM_BINS = 10
+
+SNAPSHOT_VERSION = 3
+# Snapshots from before each post's counted score was tracked still load,
+# without any post ids
+COMPATIBLE_SNAPSHOT_VERSIONS = (1, 2, 3)
+
+
+class WindowRing:
+    """
+    Ring of time slots holding counts, score sums and histograms.
+
+    The ring keeps two windows worth of slots so that both the sliding window
+    ending now and the last complete tumbling window can be answered. Each
+    post id is counted once in the whole ring: a post analyzed again (e.g.
+    while it stays hot) moves from the slot of its earlier analysis to the
+    new one, with its new score, instead of being counted twice.
+    """
+
+    def __init__(self, window_seconds: int, slots_per_window: int, bins: int):
+        self.window_seconds = window_seconds
+        self.slots_per_window = slots_per_window
+        self.slot_width = window_seconds / slots_per_window
+        self.size = 2 * slots_per_window
+        self.bins = bins
+        self.slot_ids = np.full(self.size, -1, dtype=np.int64)
+        self.counts = np.zeros(self.size, dtype=np.int64)
+        self.sums = np.zeros(self.size, dtype=np.float64)
+        self.histograms = np.zeros((self.size, bins), dtype=np.int64)
+        # Post ids counted in each slot, and the timestamp, score and
+        # histogram bin each one is counted with
+        self.seen: List[Set[str]] = [set() for _ in range(self.size)]
+        self.counted: Dict[str, Tuple[float, float, int]] = {}
+
+    def update(
+        self,
+        timestamps: np.ndarray,
+        scores: np.ndarray,
+        bin_index: np.ndarray,
+        ids: Optional[np.ndarray] = None,
+    ) -> int:
+        """
+        Add a batch of observations; cost is O(batch + ring size).
+
+        Args:
+            ids: Post id of each observation, or None where unknown. An id
+                already counted replaces its earlier observation, unless that
+                one is more recent.
+
+        Returns:
+            int: Number of observations counted that didn't replace another
+        """
+        if timestamps.size == 0:
+            return 0
+        slot_ids = np.floor(timestamps / self.slot_width).astype(np.int64)
+
+        # Anything older than the ring can hold relative to the newest slot is
+        # dropped, which also guarantees each ring position maps to one slot id.
+        newest = max(int(slot_ids.max()), int(self.slot_ids.max()))
+        keep = slot_ids > newest - self.size
+        timestamps, slot_ids = timestamps[keep], slot_ids[keep]
+        scores, bin_index = scores[keep], bin_index[keep]
+        if slot_ids.size == 0:
+            return 0
+        positions = slot_ids % self.size
+
+        incoming = np.full(self.size, -1, dtype=np.int64)
+        np.maximum.at(incoming, positions, slot_ids)
+        touched = incoming >= 0
+        stale = touched & (self.slot_ids != incoming)
+        self.counts[stale] = 0
+        self.sums[stale] = 0.0
+        self.histograms[stale] = 0
+        for position in np.flatnonzero(stale):
+            for post_id in self.seen[position]:
+                del self.counted[post_id]
+            self.seen[position] = set()
+        self.slot_ids[touched] = incoming[touched]
+
+        replaced = 0
+        if ids is not None:
+            fresh = np.ones(positions.size, dtype=bool)
+            observations = zip(
+                timestamps.tolist(), positions.tolist(), scores.tolist(),
+                bin_index.tolist(), ids[keep],
+            )
+            for i, (timestamp, position, score, bin_, post_id) in enumerate(observations):
+                if post_id is None:
+                    continue
+                previous = self.counted.get(post_id)
+                if previous is not None:
+                    previous_time, previous_score, previous_bin = previous
+                    if previous_time > timestamp:
+                        # Older than the analysis already counted
+                        fresh[i] = False
+                        continue
+                    # Take the earlier observation out; this one is added below
+                    previous_position = self._position(previous_time)
+                    self.counts[previous_position] -= 1
+                    self.sums[previous_position] -= previous_score
+                    self.histograms[previous_position, previous_bin] -= 1
+                    self.seen[previous_position].discard(post_id)
+                    replaced += 1
+                self.counted[post_id] = (timestamp, score, bin_)
+                self.seen[position].add(post_id)
+            positions, scores, bin_index = positions[fresh], scores[fresh], bin_index[fresh]
+
+        np.add.at(self.counts, positions, 1)
+        np.add.at(self.sums, positions, scores)
+        np.add.at(self.histograms, (positions, bin_index), 1)
+        return int(positions.size) - replaced
+
+    def _position(self, timestamp: float) -> int:
+        return int(np.floor(timestamp / self.slot_width)) % self.size
+
+    def mask(self, first_slot: int, last_slot: int) -> np.ndarray:
+        """Ring positions holding slot ids in [first_slot, last_slot]."""
+        return (self.slot_ids >= first_slot) & (self.slot_ids <= last_slot)
+
+    def sliding_range(self, now: float) -> Tuple[int, int]:
+        current = int(np.floor(now / self.slot_width))
+        return current - self.slots_per_window + 1, current
+
+    def tumbling_range(self, now: float) -> Tuple[int, int]:
+        """Slot range of the last complete tumbling window before now."""
+        window_index = int(np.floor(now / self.window_seconds)) - 1
+        first = window_index * self.slots_per_window
+        return first, first + self.slots_per_window - 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "slot_ids": self.slot_ids.tolist(),
+            "counts": self.counts.tolist(),
+            "sums": self.sums.tolist(),
+            "histograms": self.histograms.tolist(),
+            "counted": {post_id: list(entry) for post_id, entry in self.counted.items()},
+        }
+
+    def load_dict(self, data: Dict[str, Any]) -> None:
+        self.slot_ids = np.asarray(data["slot_ids"], dtype=np.int64)
+        self.counts = np.asarray(data["counts"], dtype=np.int64)
+        self.sums = np.asarray(data["sums"], dtype=np.float64)
+        self.histograms = np.asarray(data["histograms"], dtype=np.int64)
+        # Older snapshots don't have the counted scores, without which an
+        # earlier observation can't be replaced; their ids are dropped
+        counted = data.get("counted", {})
+        self.counted = {
+            post_id: (float(timestamp), float(score), int(bin_))
+            for post_id, (timestamp, score, bin_) in counted.items()
+        }
+        self.seen = [set() for _ in range(self.size)]
+        for post_id, (timestamp, _, _) in self.counted.items():
+            self.seen[self._position(timestamp)].add(post_id)
+
+
+class SentimentAggregator:
+    """Incremental rolling sentiment aggregates per platform and source."""
+
+    def __init__(
+        self,
+        windows: Optional[Dict[str, Tuple[int, int]]] = None,
+        bins: int = HISTOGRAM_BINS,
+    ):
+        self.windows = windows or WINDOWS
+        self.bins = bins
+        self._rings: Dict[Tuple[str, str], Dict[str, WindowRing]] = {}
+        self._lock = threading.Lock()
+
+    def update(
+        self,
+        platform: str,
+        source: Optional[str],
+        timestamps: Iterable[float],
+        scores: Iterable[float],
+        ids: Optional[Sequence[Optional[str]]] = None,
+    ) -> int:
+        """
+        Add a batch of scored observations for one platform and source.
+
+        An observation with a post id already counted replaces the earlier
+        one, so every post counts once per window with its latest score.
+
+        Returns:
+            int: The most new posts counted by any window
+        """
+        ts = np.asarray(list(timestamps), dtype=np.float64)
+        sc = np.clip(np.asarray(list(scores), dtype=np.float64), 0.0, 1.0)
+        bin_index = np.minimum((sc * self.bins).astype(np.int64), self.bins - 1)
+        post_ids = None
+        if ids is not None:
+            post_ids = np.empty(len(ids), dtype=object)
+            post_ids[:] = list(ids)
+        with self._lock:
+            rings = self._rings_for(platform, source or "").values()
+            return max(ring.update(ts, sc, bin_index, post_ids) for ring in rings)
+
+    def update_records(self, records: Iterable[Dict[str, Any]]) -> int:
+        """Add flat records (see sinks.extract_records), grouped per key."""
+        groups: Dict[Tuple[str, str], Tuple[List[float], List[float], List[Optional[str]]]] = {}
+        for record in records:
+            score = record.get("sentiment_score")
+            if score is None:
+                continue
+            key = (record["platform"], record.get("source") or "")
+            timestamps, scores, ids = groups.setdefault(key, ([], [], []))
+            timestamps.append(record.get("analyzed_at") or time.time())
+            scores.append(score)
+            ids.append(record.get("content_id") or None)
+
+        added = 0
+        for (platform, source), (timestamps, scores, ids) in groups.items():
+            added += self.update(platform, source, timestamps, scores, ids)
+        return added
+
+    def query(
+        self,
+        platform: Optional[str] = None,
+        source: Optional[str] = None,
+        window: str = "1h",
+        mode: str = "sliding",
+        now: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        """
+        Aggregate sentiment over one window.
+
+        Args:
+            platform: Platform to include, or None for all platforms
+            source: Subreddit or query to include, or None for all sources
+            window: One of the configured window names (1m, 1h, 1d)
+            mode: "sliding" for the window ending now, "tumbling" for the last
+                complete aligned window
+            now: Reference time in seconds, defaults to the current time
+
+        Returns:
+            Dict[str, Any]: count, mean, histogram and the window bounds
+        """
+        if window not in self.windows:
+            raise ValueError(f"Unknown window '{window}'")
+        if mode not in ("sliding", "tumbling"):
+            raise ValueError(f"Unknown window mode '{mode}'")
+        now = time.time() if now is None else now
+
+        count = 0
+        total = 0.0
+        histogram = np.zeros(self.bins, dtype=np.int64)
+        first = last = 0
+        ring_width = 0.0
+        with self._lock:
+            for (ring_platform, ring_source), rings in self._rings.items():
+                if platform is not None and ring_platform != platform:
+                    continue
+                if source is not None and ring_source != source:
+                    continue
+                ring = rings[window]
+                if mode == "sliding":
+                    first, last = ring.sliding_range(now)
+                else:
+                    first, last = ring.tumbling_range(now)
+                ring_width = ring.slot_width
+                mask = ring.mask(first, last)
+                count += int(ring.counts[mask].sum())
+                total += float(ring.sums[mask].sum())
+                histogram += ring.histograms[mask].sum(axis=0)
+
+        return {
+            "window": window,
+            "mode": mode,
+            "start": first * ring_width if ring_width else None,
+            "end": (last + 1) * ring_width if ring_width else None,
+            "count": count,
+            "mean": total / count if count else None,
+            "histogram": histogram.tolist(),
+        }
+
+    def keys(self) -> List[Tuple[str, str]]:
+        with self._lock:
+            return list(self._rings.keys())
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "version": SNAPSHOT_VERSION,
+                "windows": {name: list(spec) for name, spec in self.windows.items()},
+                "bins": self.bins,
+                "series": [
+                    {
+                        "platform": platform,
+                        "source": source,
+                        "rings": {name: ring.to_dict() for name, ring in rings.items()},
+                    }
+                    for (platform, source), rings in self._rings.items()
+                ],
+            }
+
+    def restore(self, snapshot: Dict[str, Any]) -> None:
+        """Load a snapshot; series for windows no longer configured are ignored."""
+        if snapshot.get("version") not in COMPATIBLE_SNAPSHOT_VERSIONS or snapshot.get("bins") != self.bins:
+            logger.warning("Ignoring incompatible sentiment aggregates snapshot")
+            return
+        saved_windows = {name: tuple(spec) for name, spec in snapshot["windows"].items()}
+        with self._lock:
+            self._rings.clear()
+            for series in snapshot["series"]:
+                rings = self._rings_for(series["platform"], series["source"])
+                for name, ring in rings.items():
+                    if saved_windows.get(name) == self.windows[name] and name in series["rings"]:
+                        ring.load_dict(series["rings"][name])
+
+    def save(self, path: str) -> None:
+        """Atomically write a JSON snapshot."""
+        target = Path(path)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp = target.with_suffix(target.suffix + ".tmp")
+        tmp.write_text(json.dumps(self.snapshot()))
+        os.replace(tmp, target)
+
+    @classmethod
+    def load(cls, path: str) -> "SentimentAggregator":
+        aggregator = cls()
+        if Path(path).exists():
+            aggregator.restore(json.loads(Path(path).read_text()))
+        return aggregator
+
+    def _rings_for(self, platform: str, source: str) -> Dict[str, WindowRing]:
+        key = (platform, source)
+        rings = self._rings.get(key)
+        if rings is None:
+            rings = {
+                name: WindowRing(seconds, slots, self.bins)
+                for name, (seconds, slots) in self.windows.items()
+            }
+            self._rings[key] = rings
+        return rings
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Query rolling sentiment aggregates")
+    parser.add_argument("--snapshot", default=os.getenv("AGGREGATES_SNAPSHOT_PATH", DEFAULT_SNAPSHOT_PATH))
+    parser.add_argument("--platform", default=None)
+    parser.add_argument("--source", default=None)
+    parser.add_argument("--window", default="1h", choices=list(WINDOWS))
+    parser.add_argument("--mode", default="sliding", choices=["sliding", "tumbling"])
+    args = parser.parse_args()
+
+    aggregator = SentimentAggregator.load(args.snapshot)
+    print(json.dumps(
+        aggregator.query(args.platform, args.source, args.window, args.mode),
+        indent=2,
+    ))
@@ -0,0 +1,270 @@
+import heapq
+import math
+import os
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from data import Content, ScrapedData
+
+# Used from inside SentimentAnalyzerWorkflow: everything here must be
+# deterministic, with the current time always passed in from workflow.now().
+
+
+@dataclass
+class AnalysisBudget:
+    """LLM spend limits and priority weights for one analyzer partition."""
+
+    # Sustained LLM requests per minute (one request per analyzed item)
+    requests_per_minute: float = 30
+    # Largest number of requests that can be made at once after an idle period
+    burst: int = 10
+    # Beyond this many queued items, the lowest-priority ones are shed
+    max_queue_size: int = 500
+    # Items deferred longer than this are shed instead of analyzed late
+    max_deferral_seconds: float = 6 * 60 * 60
+    # Age at which an item's recency factor halves
+    recency_half_life_seconds: float = 6 * 60 * 60
+    platform_weights: Dict[str, float] = field(
+        default_factory=lambda: {"reddit": 1.0, "twitter": 1.0}
+    )
+
+    def __post_init__(self) -> None:
+        # Either being zero would stall the analyzer forever (or divide by zero)
+        if self.requests_per_minute <= 0:
+            raise ValueError(f"requests_per_minute must be > 0, got {self.requests_per_minute}")
+        if self.burst < 1:
+            raise ValueError(f"burst must be at least 1, got {self.burst}")
+
+
+def budget_from_env(partitions: int = 1) -> AnalysisBudget:
+    """
+    Build the per-partition budget. ANALYSIS_REQUESTS_PER_MINUTE is the total
+    across all partitions and is split evenly between them.
+    """
+    default = AnalysisBudget()
+    total_rpm = float(os.getenv("ANALYSIS_REQUESTS_PER_MINUTE", default.requests_per_minute))
+    return AnalysisBudget(
+        requests_per_minute=total_rpm / max(1, partitions),
+        burst=int(os.getenv("ANALYSIS_BURST", default.burst)),
+        max_queue_size=int(os.getenv("ANALYSIS_MAX_QUEUE_SIZE", default.max_queue_size)),
+        max_deferral_seconds=float(
+            os.getenv("ANALYSIS_MAX_DEFERRAL_SECONDS", default.max_deferral_seconds)
+        ),
+        recency_half_life_seconds=default.recency_half_life_seconds,
+        platform_weights=default.platform_weights,
+    )
+
+
+def content_priority(content: Content, now: float, budget: AnalysisBudget) -> float:
+    """
+    Priority of a content item: log-scaled engagement, decayed by age and
+    weighted per platform. Higher is more important.
+    """
+    metrics = content.engagement_metrics or {}
+    # Counts such as likes, retweets and comments; ratios such as upvote_ratio
+    # (at most 1) are left out
+    engagement = max(0, content.score) + sum(
+        value for value in metrics.values()
+        if isinstance(value, (int, float)) and not isinstance(value, bool) and value > 1
+    )
+    age = max(0.0, now - content.created_at)
+    recency = 0.5 ** (age / budget.recency_half_life_seconds)
+    weight = budget.platform_weights.get(content.platform, 1.0)
+    return weight * (1 + math.log1p(engagement)) * recency
+
+
+@dataclass
+class DrainedBatch:
+    """Items drained from an AnalysisScheduler, with their queue state by content id."""
+
+    scraped_data: ScrapedData
+    queued_at: Dict[str, float] = field(default_factory=dict)
+    priority: Dict[str, float] = field(default_factory=dict)
+
+
+@dataclass(order=True)
+class _QueuedItem:
+    sort_key: Tuple[float, int]
+    content: Content = field(compare=False)
+    parent: int = field(compare=False)
+    priority: float = field(compare=False)
+    queued_at: float = field(compare=False)
+
+
+class AnalysisScheduler:
+    """
+    Priority queue of content awaiting analysis, drained under a token bucket.
+
+    Items that don't fit in the budget stay queued (deferred). Items are shed
+    when the queue is over max_queue_size or has been deferred for too long.
+    """
+
+    def __init__(self, budget: AnalysisBudget):
+        self.budget = budget
+        self._heap: List[_QueuedItem] = []
+        self._seq = 0
+        # Platform, timestamp and metadata of each received batch, by parent id
+        self._parents: Dict[int, ScrapedData] = {}
+        self._tokens = float(budget.burst)
+        self._last_refill: Optional[float] = None
+        self.shed_total = 0
+        self._recently_shed: Deque[Dict[str, Any]] = deque(maxlen=50)
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def set_budget(self, budget: AnalysisBudget, now: float) -> None:
+        """Switch to a new budget, e.g. after a rebalance changed the per-partition share."""
+        self._refill(now)
+        self.budget = budget
+        self._tokens = min(self._tokens, float(budget.burst))
+
+    def push(
+        self, scraped_data: ScrapedData, now: float, drained: Optional[DrainedBatch] = None
+    ) -> None:
+        """
+        Queue a batch of content.
+
+        Args:
+            drained: Where the items were drained from this scheduler (see
+                drain), to keep their priority and queueing time
+        """
+        parent = self._seq
+        self._parents[parent] = scraped_data.model_copy(update={"items": []})
+        for content in scraped_data.items:
+            self._seq += 1
+            if drained and content.id in drained.queued_at:
+                priority = drained.priority[content.id]
+                queued_at = drained.queued_at[content.id]
+            else:
+                priority = content_priority(content, now, self.budget)
+                queued_at = now
+            heapq.heappush(
+                self._heap,
+                _QueuedItem((-priority, self._seq), content, parent, priority, queued_at),
+            )
+        self._seq += 1
+        self._shed(now)
+
+    def next_batches(self, now: float) -> List[ScrapedData]:
+        """
+        Take the highest-priority items the budget allows right now, grouped
+        back into one ScrapedData per received batch.
+        """
+        self._refill(now)
+        self._shed(now)
+        count = min(int(self._tokens), self.budget.burst, len(self._heap))
+        self._tokens -= count
+        taken = [heapq.heappop(self._heap) for _ in range(count)]
+        return self._group(taken)
+
+    def seconds_until_available(self, now: float) -> float:
+        """Time until the budget allows at least one more request."""
+        self._refill(now)
+        if self._tokens >= 1:
+            return 0.0
+        return (1 - self._tokens) * 60 / self.budget.requests_per_minute
+
+    def drain(self) -> List[DrainedBatch]:
+        """
+        Remove and return every queued item, e.g. to re-route on rebalance.
+        Items pushed back with their DrainedBatch keep their place in the queue.
+        """
+        taken, self._heap = sorted(self._heap), []
+        drained = [
+            DrainedBatch(
+                self._parents[parent].model_copy(update={"items": [item.content for item in items]}),
+                queued_at={item.content.id: item.queued_at for item in items},
+                priority={item.content.id: item.priority for item in items},
+            )
+            for parent, items in self._by_parent(taken).items()
+        ]
+        self._forget_unused_parents()
+        return drained
+
+    def stats(self, now: float) -> Dict[str, Any]:
+        # Read-only (it backs workflow queries), so the bucket isn't refilled
+        tokens = self._projected_tokens(now)
+        return {
+            "queued": len(self._heap),
+            "deferred": max(0, len(self._heap) - int(tokens)),
+            "available_requests": int(tokens),
+            "requests_per_minute": self.budget.requests_per_minute,
+            "shed_total": self.shed_total,
+        }
+
+    def deferred_items(self, now: float, limit: int = 50) -> Dict[str, Any]:
+        """Highest-priority queued items and the most recently shed ones."""
+        return {
+            "queued": [
+                self._describe(item, now) for item in heapq.nsmallest(limit, self._heap)
+            ],
+            "recently_shed": list(self._recently_shed),
+        }
+
+    def _projected_tokens(self, now: float) -> float:
+        """Tokens the bucket would hold if it were refilled at now."""
+        if self._last_refill is None:
+            return self._tokens
+        elapsed = max(0.0, now - self._last_refill)
+        return min(
+            float(self.budget.burst),
+            self._tokens + elapsed * self.budget.requests_per_minute / 60,
+        )
+
+    def _refill(self, now: float) -> None:
+        self._tokens = self._projected_tokens(now)
+        self._last_refill = now
+
+    def _shed(self, now: float) -> None:
+        expired = [
+            item for item in self._heap
+            if now - item.queued_at > self.budget.max_deferral_seconds
+        ]
+        kept = [
+            item for item in self._heap
+            if now - item.queued_at <= self.budget.max_deferral_seconds
+        ]
+        if len(kept) > self.budget.max_queue_size:
+            kept.sort()
+            expired.extend(kept[self.budget.max_queue_size:])
+            kept = kept[:self.budget.max_queue_size]
+        if not expired:
+            return
+
+        self._heap = kept
+        heapq.heapify(self._heap)
+        self.shed_total += len(expired)
+        for item in expired:
+            self._recently_shed.append(self._describe(item, now))
+        self._forget_unused_parents()
+
+    def _group(self, items: List[_QueuedItem]) -> List[ScrapedData]:
+        batches = [
+            self._parents[parent].model_copy(update={"items": [item.content for item in grouped]})
+            for parent, grouped in self._by_parent(items).items()
+        ]
+        self._forget_unused_parents()
+        return batches
+
+    @staticmethod
+    def _by_parent(items: List[_QueuedItem]) -> Dict[int, List[_QueuedItem]]:
+        grouped: Dict[int, List[_QueuedItem]] = {}
+        for item in items:
+            grouped.setdefault(item.parent, []).append(item)
+        return grouped
+
+    def _forget_unused_parents(self) -> None:
+        in_use = {item.parent for item in self._heap}
+        for parent in [p for p in self._parents if p not in in_use]:
+            del self._parents[parent]
+
+    @staticmethod
+    def _describe(item: _QueuedItem, now: float) -> Dict[str, Any]:
+        return {
+            "id": item.content.id,
+            "platform": item.content.platform,
+            "priority": round(item.priority, 4),
+            "waiting_seconds": round(now - item.queued_at, 1),
+        }
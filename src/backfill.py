@@ -0,0 +1,270 @@
+import argparse
+import asyncio
+import os
+from dataclasses import dataclass, field, replace
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from temporalio import activity
+from temporalio.exceptions import ApplicationError
+
+from data import ScrapedData
+from partitioning import DEFAULT_PARTITIONS, partitions_from_env
+
+# Used from inside BackfillWorkflow: chunking must be deterministic. The
+# platform clients are only imported when the chunk activity runs.
+
+DEFAULT_CHUNK_SECONDS = 6 * 60 * 60
+DEFAULT_MAX_CONCURRENCY = 4
+
+# Items handed to the analyzers per minute across the whole backfill. Kept
+# below the analyzers' LLM budget (ANALYSIS_REQUESTS_PER_MINUTE) so live
+# content still gets analyzed while a backfill runs.
+DEFAULT_ANALYSIS_ITEMS_PER_MINUTE = 10
+
+# Items per batch sent to the analyzers
+ANALYZE_BATCH_SIZE = 20
+
+# Chunks started per workflow run before continuing as new, which keeps the
+# event history of long backfills bounded
+MAX_CHUNKS_PER_RUN = 100
+
+
+@dataclass
+class BackfillChunk:
+    """One source and time range, [start, end) as unix timestamps."""
+
+    # "reddit:<subreddit>" or "twitter"
+    source: str
+    start: float
+    end: float
+    # Reddit listing position to walk from, see BackfillChunkResult.next_after
+    after: Optional[str] = None
+
+    @property
+    def key(self) -> str:
+        return f"{self.source}@{self.start:.0f}-{self.end:.0f}"
+
+
+@dataclass
+class BackfillChunkResult:
+    # Items handed to the analyzers
+    items: int
+    # False if the source couldn't cover the whole chunk (e.g. older than
+    # Reddit's listing or Twitter's search window), with the reason
+    complete: bool = True
+    incomplete_reason: Optional[str] = None
+    # Reddit listing position at the start of the chunk, where the walk for
+    # the chunk just before it can continue
+    next_after: Optional[str] = None
+
+
+@dataclass
+class BackfillRequest:
+    sources: List[str]
+    start: float
+    end: float
+    chunk_seconds: float = DEFAULT_CHUNK_SECONDS
+    # Chunk workflows running at the same time
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY
+    # Analyzer partitions to send the content to
+    partitions: int = DEFAULT_PARTITIONS
+    analysis_items_per_minute: float = DEFAULT_ANALYSIS_ITEMS_PER_MINUTE
+
+
+@dataclass
+class BackfillProgress:
+    """Checkpoint carried across continue-as-new."""
+
+    completed: List[str] = field(default_factory=list)
+    # Error message of each failed chunk, by chunk key
+    failed: Dict[str, str] = field(default_factory=dict)
+    items: int = 0
+    # Listing positions for chunks not started yet, by cursor_key of the
+    # chunk's source and end
+    cursors: Dict[str, str] = field(default_factory=dict)
+
+
+def cursor_key(source: str, boundary: float) -> str:
+    return f"{source}@{boundary:.0f}"
+
+
+def split_chunks(request: BackfillRequest) -> List[BackfillChunk]:
+    """
+    Split a backfill into chunks, newest time range first with every source
+    interleaved, so an interrupted backfill still covers the most recent data.
+    """
+    chunks = []
+    end = request.end
+    while end > request.start:
+        start = max(request.start, end - request.chunk_seconds)
+        chunks.extend(BackfillChunk(source, start, end) for source in request.sources)
+        end = start
+    return chunks
+
+
+def pending_chunks(
+    request: BackfillRequest, progress: Optional[BackfillProgress] = None
+) -> List[BackfillChunk]:
+    """Chunks of a backfill that have neither completed nor failed, in split_chunks order."""
+    progress = progress or BackfillProgress()
+    done = set(progress.completed) | set(progress.failed)
+    return [chunk for chunk in split_chunks(request) if chunk.key not in done]
+
+
+def chunk_lanes(chunks: List[BackfillChunk]) -> List[List[BackfillChunk]]:
+    """
+    Group chunks into lanes that run one chunk after the other.
+    
+    The chunks of a Reddit source share a lane, newest first, so each one
+    continues the listing walk where the previous one stopped instead of
+    walking it again from the newest post. Every other chunk is a lane of its
+    own.
+    """
+    lanes: List[List[BackfillChunk]] = []
+    by_source: Dict[str, List[BackfillChunk]] = {}
+    for chunk in chunks:
+        if parse_source(chunk.source)[0] != "reddit":
+            lanes.append([chunk])
+        elif chunk.source in by_source:
+            by_source[chunk.source].append(chunk)
+        else:
+            by_source[chunk.source] = [chunk]
+            lanes.append(by_source[chunk.source])
+    return lanes
+
+
+async def run_chunks(
+    request: BackfillRequest,
+    progress: BackfillProgress,
+    run_chunk: Callable[[BackfillChunk], Awaitable[Optional[BackfillChunkResult]]],
+    limit: Optional[int] = None,
+) -> None:
+    """
+    Run the pending chunks of a backfill in lanes (see chunk_lanes) and
+    checkpoint them in progress.
+    
+    Each chunk is run with the listing position where the previous chunk of
+    its lane stopped. Only chunks that cover their whole range are completed;
+    when a Reddit listing ends before a chunk, the older chunks of the
+    subreddit are failed along with it, as the listing can't reach them either.
+    
+    Args:
+        run_chunk: Runs one chunk; returns None if it failed, after recording
+            the failure in progress.failed
+        limit: Most chunks to run, the newest first
+    """
+    pending = pending_chunks(request, progress)
+    
+    async def run_lane(lane: List[BackfillChunk]) -> None:
+        for chunk in lane:
+            if chunk.key in progress.failed:
+                continue
+            # Kept until the chunk completes, so a resumed backfill can use it
+            after = progress.cursors.get(cursor_key(chunk.source, chunk.end))
+            result = await run_chunk(replace(chunk, after=after))
+            if result is None:
+                continue
+            progress.items += result.items
+            if not result.complete:
+                progress.failed[chunk.key] = result.incomplete_reason or "Chunk only partly covered"
+                if parse_source(chunk.source)[0] == "reddit":
+                    for older in pending:
+                        if older.source == chunk.source and older.end <= chunk.start:
+                            progress.failed[older.key] = f"Out of reach like {chunk.key}"
+                continue
+            progress.completed.append(chunk.key)
+            progress.cursors.pop(cursor_key(chunk.source, chunk.end), None)
+            if result.next_after:
+                progress.cursors[cursor_key(chunk.source, chunk.start)] = result.next_after
+    
+    await asyncio.gather(*(run_lane(lane) for lane in chunk_lanes(pending[:limit])))
+
+
+def resume_progress(progress: BackfillProgress) -> BackfillProgress:
+    """Progress to start a backfill again from, retrying its failed chunks."""
+    return replace(progress, failed={})
+
+
+def parse_source(source: str) -> Tuple[str, Optional[str]]:
+    """Split "platform:name" into (platform, name); name is None if absent."""
+    platform, _, name = source.partition(":")
+    return platform, name or None
+
+
+@activity.defn
+async def scrape_backfill_chunk(chunk: BackfillChunk) -> ScrapedData:
+    """Scrape the content of one backfill chunk."""
+    platform, name = parse_source(chunk.source)
+    if platform == "reddit":
+        from reddit import DEFAULT_SUBREDDIT, scrape_reddit_range
+
+        return await scrape_reddit_range(
+            name or DEFAULT_SUBREDDIT, chunk.start, chunk.end, after=chunk.after
+        )
+    if platform == "twitter":
+        from twitter import search_twitter_range
+
+        return await search_twitter_range(chunk.start, chunk.end)
+    raise ApplicationError(f"Unknown backfill source {chunk.source!r}", non_retryable=True)
+
+
+def _parse_time(value: str) -> float:
+    """Parse an ISO date or datetime, UTC unless it has an offset."""
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+async def _start_backfill(args: argparse.Namespace) -> None:
+    from temporalio.client import Client
+
+    from codec import build_data_converter
+    from workflows import BackfillWorkflow
+
+    client = await Client.connect(
+        os.getenv("TEMPORAL_HOST", "temporal:7233"), data_converter=build_data_converter()
+    )
+    request = BackfillRequest(
+        sources=[source.strip() for source in args.sources.split(",") if source.strip()],
+        start=_parse_time(args.start),
+        end=_parse_time(args.end),
+        chunk_seconds=args.chunk_hours * 60 * 60,
+        max_concurrency=args.concurrency,
+        partitions=partitions_from_env(),
+        analysis_items_per_minute=args.analysis_rate,
+    )
+    progress = None
+    if args.resume:
+        # Completed chunks of the earlier backfill are skipped, failed ones retried
+        previous = client.get_workflow_handle_for(BackfillWorkflow.run, args.resume)
+        progress = resume_progress(await previous.result())
+    workflow_id = args.id or f"backfill-{args.start}-{args.end}"
+    handle = await client.start_workflow(
+        BackfillWorkflow.run,
+        args=[request, progress],
+        id=workflow_id,
+        task_queue=os.getenv("TASK_QUEUE", "reddit-tasks"),
+    )
+    print(f"Started backfill {handle.id} with {len(pending_chunks(request, progress))} chunks")
+    if args.wait:
+        progress = await handle.result()
+        print(f"Completed {len(progress.completed)} chunks, {len(progress.failed)} failed, {progress.items} items")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Start a historical backfill")
+    parser.add_argument("--sources", default="reddit:programming,twitter",
+                        help='Comma separated, e.g. "reddit:programming,reddit:python,twitter"')
+    parser.add_argument("--start", required=True, help="ISO date or datetime (UTC)")
+    parser.add_argument("--end", required=True, help="ISO date or datetime (UTC)")
+    parser.add_argument("--chunk-hours", type=float, default=DEFAULT_CHUNK_SECONDS / 3600)
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_MAX_CONCURRENCY)
+    parser.add_argument("--analysis-rate", type=float, default=DEFAULT_ANALYSIS_ITEMS_PER_MINUTE,
+                        help="Items per minute sent to the sentiment analyzers")
+    parser.add_argument("--resume", metavar="WORKFLOW_ID",
+                        help="Skip the chunks a finished backfill completed and retry its failed ones")
+    parser.add_argument("--id", help="Workflow id (defaults to one derived from the range)")
+    parser.add_argument("--wait", action="store_true", help="Wait for the backfill to finish")
+    asyncio.run(_start_backfill(parser.parse_args()))
@@ -0,0 +1,223 @@
+import logging
+import os
+import sys
+from typing import Any, Dict, List, Optional, Sequence, Type
+
+from pydantic import BaseModel
+from temporalio.api.common.v1 import Payload
+from temporalio.converter import (
+    BinaryNullPayloadConverter,
+    BinaryPlainPayloadConverter,
+    BinaryProtoPayloadConverter,
+    CompositePayloadConverter,
+    DataConverter,
+    EncodingPayloadConverter,
+    JSONPlainPayloadConverter,
+    JSONProtoPayloadConverter,
+    PayloadCodec,
+)
+from temporalio.worker.workflow_sandbox import SandboxedWorkflowRunner, SandboxRestrictions
+
+from data import AnalyzedContent, Author, Content, Reply, ScrapedData, SentimentResults
+
+# Imported here rather than when the converter is built: workflows build their
+# payload converter inside the sandbox, where importing msgpack (which reads
+# os.environ) is restricted.
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+MSGPACK_ENCODING = "binary/msgpack"
+ZSTD_ENCODING = "binary/zstd"
+
+# Bump when the wire layout of the records below changes in a way that is not
+# "append a field at the end of the model".
+ENCODING_VERSION = 1
+SUPPORTED_ENCODING_VERSIONS = {1}
+
+# Payloads smaller than this are not worth the zstd frame overhead.
+COMPRESSION_MIN_BYTES = 1024
+
+# Data models are packed as msgpack ext types holding their field values in
+# declaration order, so field names are not repeated for every item.
+RECORD_TYPES: Dict[int, Type[BaseModel]] = {
+    1: Author,
+    2: Reply,
+    3: Content,
+    4: ScrapedData,
+    5: AnalyzedContent,
+    6: SentimentResults,
+}
+_RECORD_CODES = {model: code for code, model in RECORD_TYPES.items()}
+_RECORD_FIELDS = {model: tuple(model.model_fields) for model in RECORD_TYPES.values()}
+
+
+class MsgpackPayloadConverter(EncodingPayloadConverter):
+    """Compact msgpack encoding for the data models and plain JSON-like values."""
+
+    def __init__(self) -> None:
+        if msgpack is None:
+            raise ImportError("msgpack is required for the msgpack payload converter")
+        self._msgpack = msgpack
+
+    @property
+    def encoding(self) -> str:
+        return MSGPACK_ENCODING
+
+    def to_payload(self, value: Any) -> Optional[Payload]:
+        try:
+            data = self._msgpack.packb(value, default=self._pack_record, use_bin_type=True)
+        except (TypeError, ValueError):
+            # Let the JSON converter after us handle anything msgpack can't
+            return None
+        return Payload(
+            metadata={
+                "encoding": self.encoding.encode(),
+                "encoding-version": str(ENCODING_VERSION).encode(),
+            },
+            data=data,
+        )
+
+    def from_payload(self, payload: Payload, type_hint: Optional[Type] = None) -> Any:
+        version = int(payload.metadata.get("encoding-version", b"1"))
+        if version not in SUPPORTED_ENCODING_VERSIONS:
+            raise RuntimeError(f"Unsupported {MSGPACK_ENCODING} encoding version {version}")
+
+        value = self._msgpack.unpackb(
+            payload.data, ext_hook=self._unpack_record, raw=False, strict_map_key=False
+        )
+        if (
+            isinstance(value, dict)
+            and isinstance(type_hint, type)
+            and issubclass(type_hint, BaseModel)
+        ):
+            return type_hint.model_validate(value)
+        return value
+
+    def _pack_record(self, value: Any) -> Any:
+        code = _RECORD_CODES.get(type(value))
+        if code is not None:
+            values = [getattr(value, field) for field in _RECORD_FIELDS[type(value)]]
+            return self._msgpack.ExtType(
+                code, self._msgpack.packb(values, default=self._pack_record, use_bin_type=True)
+            )
+        if isinstance(value, BaseModel):
+            return value.model_dump()
+        if isinstance(value, (set, frozenset, tuple)):
+            return list(value)
+        raise TypeError(f"Cannot encode {type(value).__name__} as msgpack")
+
+    def _unpack_record(self, code: int, data: bytes) -> Any:
+        model = RECORD_TYPES.get(code)
+        if model is None:
+            return self._msgpack.ExtType(code, data)
+        values: List[Any] = self._msgpack.unpackb(
+            data, ext_hook=self._unpack_record, raw=False, strict_map_key=False
+        )
+        fields = dict(zip(_RECORD_FIELDS[model], values))
+        platform = fields.get("platform")
+        if isinstance(platform, str):
+            # A handful of platform names repeat on every item
+            fields["platform"] = sys.intern(platform)
+        return model.model_validate(fields)
+
+
+class MsgpackPayloadConverterSet(CompositePayloadConverter):
+    """Default converters with msgpack ahead of JSON; JSON still decodes old payloads."""
+
+    def __init__(self) -> None:
+        super().__init__(
+            BinaryNullPayloadConverter(),
+            BinaryPlainPayloadConverter(),
+            JSONProtoPayloadConverter(),
+            BinaryProtoPayloadConverter(),
+            MsgpackPayloadConverter(),
+            JSONPlainPayloadConverter(),
+        )
+
+
+class ZstdPayloadCodec(PayloadCodec):
+    """Compresses payloads above COMPRESSION_MIN_BYTES with zstd."""
+
+    def __init__(self, level: int = 3, min_bytes: int = COMPRESSION_MIN_BYTES) -> None:
+        import zstandard
+
+        self._compressor = zstandard.ZstdCompressor(level=level)
+        self._decompressor = zstandard.ZstdDecompressor()
+        self._min_bytes = min_bytes
+
+    async def encode(self, payloads: Sequence[Payload]) -> List[Payload]:
+        encoded = []
+        for payload in payloads:
+            serialized = payload.SerializeToString()
+            if len(serialized) < self._min_bytes:
+                encoded.append(payload)
+                continue
+            encoded.append(Payload(
+                metadata={
+                    "encoding": ZSTD_ENCODING.encode(),
+                    "encoding-version": str(ENCODING_VERSION).encode(),
+                },
+                data=self._compressor.compress(serialized),
+            ))
+        return encoded
+
+    async def decode(self, payloads: Sequence[Payload]) -> List[Payload]:
+        decoded = []
+        for payload in payloads:
+            if payload.metadata.get("encoding", b"").decode() != ZSTD_ENCODING:
+                decoded.append(payload)
+                continue
+            decoded.append(Payload.FromString(self._decompressor.decompress(payload.data)))
+        return decoded
+
+
+def build_data_converter() -> DataConverter:
+    """
+    Build the data converter shared by the worker and its client.
+
+    PAYLOAD_ENCODING selects "msgpack" (default) or "json"; PAYLOAD_COMPRESSION
+    selects "zstd" or "none" (default). Both sides of the wire must use the same
+    settings, but payloads written with the default JSON converter remain
+    readable either way.
+    """
+    encoding = os.getenv("PAYLOAD_ENCODING", "msgpack")
+    compression = os.getenv("PAYLOAD_COMPRESSION", "none")
+
+    payload_converter_class = DataConverter.default.payload_converter_class
+    if encoding == "msgpack":
+        if msgpack is not None:
+            payload_converter_class = MsgpackPayloadConverterSet
+        else:
+            logger.warning("msgpack is not installed, falling back to JSON payloads")
+
+    payload_codec = None
+    if compression == "zstd":
+        try:
+            payload_codec = ZstdPayloadCodec()
+        except ImportError:
+            logger.warning("zstandard is not installed, payloads will not be compressed")
+
+    logger.info(
+        f"Using payload converter {payload_converter_class.__name__} "
+        f"with {'zstd' if payload_codec else 'no'} compression"
+    )
+    return DataConverter(
+        payload_converter_class=payload_converter_class,
+        payload_codec=payload_codec,
+    )
+
+
+def build_workflow_runner() -> SandboxedWorkflowRunner:
+    """
+    Workflow sandbox for workers and replayers using build_data_converter.
+
+    msgpack is passed through so the payload converter built inside the
+    sandbox uses the already imported module.
+    """
+    return SandboxedWorkflowRunner(
+        restrictions=SandboxRestrictions.default.with_passthrough_modules("msgpack")
+    )
@@ -0,0 +1,279 @@
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Deque, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class LimiterConfig:
+    """Bounds and tuning for one adaptive concurrency limit."""
+
+    initial_limit: float = 4
+    min_limit: float = 1
+    max_limit: float = 32
+    # Completed requests used for the latency and error rate of each decision
+    window: int = 20
+    # The limit shrinks when window p95 latency exceeds this multiple of the
+    # best window median seen recently (the latency of an unloaded service)
+    latency_tolerance: float = 2.0
+    # ... or when more than this fraction of the window failed
+    max_error_rate: float = 0.1
+    # Limit multiplier on overload (429, 503 and timeouts)
+    backoff_ratio: float = 0.5
+    # Limit multiplier when latency or errors are merely unhealthy
+    soft_backoff_ratio: float = 0.9
+
+
+DEFAULT_CONFIGS: Dict[str, LimiterConfig] = {
+    "openai": LimiterConfig(initial_limit=4, max_limit=32),
+    "reddit": LimiterConfig(initial_limit=2, max_limit=8),
+    "sheets": LimiterConfig(initial_limit=1, max_limit=4),
+}
+
+
+def config_from_env(name: str) -> LimiterConfig:
+    """
+    Build the config for a limiter, applying environment overrides such as
+    OPENAI_CONCURRENCY_INITIAL, OPENAI_CONCURRENCY_MIN and OPENAI_CONCURRENCY_MAX.
+    """
+    default = DEFAULT_CONFIGS.get(name, LimiterConfig())
+    prefix = f"{name.upper()}_CONCURRENCY_"
+    return LimiterConfig(
+        initial_limit=float(os.getenv(prefix + "INITIAL", default.initial_limit)),
+        min_limit=float(os.getenv(prefix + "MIN", default.min_limit)),
+        max_limit=float(os.getenv(prefix + "MAX", default.max_limit)),
+        window=default.window,
+        latency_tolerance=float(os.getenv(prefix + "LATENCY_TOLERANCE", default.latency_tolerance)),
+        max_error_rate=default.max_error_rate,
+        backoff_ratio=default.backoff_ratio,
+        soft_backoff_ratio=default.soft_backoff_ratio,
+    )
+
+
+# HTTP statuses meaning the service is overloaded or throttling us
+OVERLOAD_STATUS_CODES = {429, 503}
+
+
+def is_overload_error(error: BaseException) -> bool:
+    """
+    Whether an error means the service is overloaded: a timeout or a 429/503.
+
+    Works across openai, gspread, asyncprawcore and tweepy errors, which
+    expose the status either directly or on their response.
+    """
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError)):
+        return True
+    # e.g. openai.APITimeoutError, httpx.ReadTimeout
+    if "timeout" in type(error).__name__.lower():
+        return True
+    return error_status(error) in OVERLOAD_STATUS_CODES
+
+
+def is_rejected_request(error: BaseException) -> bool:
+    """
+    Whether the service rejected a request itself (a 4xx other than 429), so
+    sending it again unchanged fails the same way.
+    """
+    status = error_status(error)
+    return status is not None and 400 <= status < 500 and status not in OVERLOAD_STATUS_CODES
+
+
+def error_status(error: BaseException) -> Optional[int]:
+    """HTTP status of an error, set directly or on its response, if any."""
+    status = getattr(error, "status_code", None)
+    response = getattr(error, "response", None)
+    if status is None and response is not None:
+        status = getattr(response, "status_code", None) or getattr(response, "status", None)
+    return status if isinstance(status, int) else None
+
+
+def _percentile(values: list, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, math.ceil(fraction * len(ordered)) - 1)]
+
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency limit driven by observed latency and errors.
+
+    While the window p95 latency and error rate stay healthy and requests are
+    actually using the limit, it grows by about one per window. Overload errors
+    cut it by backoff_ratio at once; unhealthy windows trim it gently. After a
+    decrease, further decreases wait until the requests started before it have
+    finished, so one burst of 429s only counts once.
+    """
+
+    def __init__(self, name: str, config: Optional[LimiterConfig] = None):
+        self.name = name
+        self.config = config or LimiterConfig()
+        self.limit = self._clamp(self.config.initial_limit)
+        self.in_flight = 0
+        self._condition: Optional[asyncio.Condition] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._samples: Deque[Tuple[float, bool]] = deque(maxlen=self.config.window)
+        # Window medians, the lowest of which approximates unloaded latency
+        self._medians: Deque[float] = deque(maxlen=10)
+        self._since_decision = 0
+        self._saturated = False
+        self._started = 0
+        self._decrease_fence = 0
+        self.overloads_total = 0
+        self.errors_total = 0
+        self.requests_total = 0
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """
+        Hold one unit of concurrency for the duration of a request.
+
+        Exceptions raised inside are recorded and re-raised.
+        """
+        await self.acquire()
+        self._started += 1
+        sequence = self._started
+        start = time.monotonic()
+        try:
+            yield
+        except BaseException as e:
+            if isinstance(e, asyncio.CancelledError):
+                await self._release()
+                raise
+            await self._release(time.monotonic() - start, e, sequence)
+            raise
+        await self._release(time.monotonic() - start, None, sequence)
+
+    async def acquire(self) -> None:
+        condition = self._get_condition()
+        async with condition:
+            await condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    def stats(self) -> Dict[str, Any]:
+        latencies = [latency for latency, _ in self._samples]
+        return {
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "p95_seconds": round(_percentile(latencies, 0.95), 3) if latencies else None,
+            "baseline_seconds": round(min(self._medians), 3) if self._medians else None,
+            "requests_total": self.requests_total,
+            "errors_total": self.errors_total,
+            "overloads_total": self.overloads_total,
+        }
+
+    def _get_condition(self) -> asyncio.Condition:
+        # Created lazily, and again for a new event loop, so the limiter can be
+        # built outside a loop and outlive one (e.g. across asyncio.run calls)
+        loop = asyncio.get_running_loop()
+        if self._condition is None or self._loop is not loop:
+            self._condition = asyncio.Condition()
+            self._loop = loop
+        return self._condition
+
+    async def _release(
+        self,
+        latency: Optional[float] = None,
+        error: Optional[BaseException] = None,
+        sequence: int = 0,
+    ) -> None:
+        condition = self._get_condition()
+        async with condition:
+            # Whether requests were queued on the limit, not far below it
+            saturated = self.in_flight >= int(self.limit)
+            self.in_flight -= 1
+            if latency is not None:
+                self._record(latency, error, sequence, saturated)
+            condition.notify_all()
+
+    def _record(
+        self, latency: float, error: Optional[BaseException], sequence: int, saturated: bool
+    ) -> None:
+        self.requests_total += 1
+        self.errors_total += error is not None
+        self._samples.append((latency, error is None))
+        self._since_decision += 1
+        self._saturated = self._saturated or saturated
+
+        if error is not None and is_overload_error(error):
+            self.overloads_total += 1
+            if sequence > self._decrease_fence:
+                self._decrease(self.config.backoff_ratio, f"overload ({type(error).__name__})")
+            return
+
+        # Judge latency and errors once per window of new samples
+        if self._since_decision < self.config.window:
+            return
+        self._since_decision = 0
+        saturated, self._saturated = self._saturated, False
+
+        latencies = [sample_latency for sample_latency, _ in self._samples]
+        self._medians.append(_percentile(latencies, 0.5))
+        p95 = _percentile(latencies, 0.95)
+        error_rate = sum(1 for _, ok in self._samples if not ok) / len(self._samples)
+        baseline = min(self._medians)
+
+        if error_rate > self.config.max_error_rate:
+            self._decrease(self.config.soft_backoff_ratio, f"error rate {error_rate:.0%}")
+        elif p95 > baseline * self.config.latency_tolerance:
+            self._decrease(
+                self.config.soft_backoff_ratio,
+                f"p95 {p95:.2f}s over {self.config.latency_tolerance}x baseline {baseline:.2f}s",
+            )
+        elif saturated:
+            self._set_limit(self.limit + 1, "healthy")
+
+    def _decrease(self, ratio: float, reason: str) -> None:
+        self._decrease_fence = self._started
+        self._set_limit(self.limit * ratio, reason)
+
+    def _set_limit(self, limit: float, reason: str) -> None:
+        limit = self._clamp(limit)
+        if int(limit) != int(self.limit):
+            logger.info(
+                f"Concurrency limit for {self.name} {int(self.limit)} -> {int(limit)}: {reason}"
+            )
+        self.limit = limit
+        _publish(self)
+
+    def _clamp(self, limit: float) -> float:
+        return max(self.config.min_limit, min(self.config.max_limit, limit))
+
+
+_limiters: Dict[str, AdaptiveLimiter] = {}
+_gauge = None
+
+
+def get_limiter(name: str) -> AdaptiveLimiter:
+    """Return the process-wide limiter for a service, creating it on first use."""
+    if name not in _limiters:
+        _limiters[name] = AdaptiveLimiter(name, config_from_env(name))
+        _publish(_limiters[name])
+    return _limiters[name]
+
+
+def all_limiter_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: limiter.stats() for name, limiter in sorted(_limiters.items())}
+
+
+def set_metric_meter(meter: Any) -> None:
+    """
+    Report every limit as the adaptive_concurrency_limit gauge of a Temporal
+    metric meter (e.g. runtime.metric_meter), tagged with the limiter name.
+    """
+    global _gauge
+    _gauge = meter.create_gauge_float(
+        "adaptive_concurrency_limit", "Current adaptive concurrency limit"
+    )
+    for limiter in _limiters.values():
+        _publish(limiter)
+
+
+def _publish(limiter: AdaptiveLimiter) -> None:
+    if _gauge is not None:
+        _gauge.set(limiter.limit, {"limiter": limiter.name})
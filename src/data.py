@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Dict, List, Optional
 from datetime import datetime
 
 class Author(BaseModel):
@@ -37,4 +37,28 @@ class ScrapedData(BaseModel):
     platform: str = Field(..., description="Platform identifier (reddit/twitter)")
     timestamp: float = Field(default_factory=lambda: datetime.now().timestamp())
     items: List[Content]
-    metadata: Optional[dict] = None 
\ No newline at end of file
+    metadata: Optional[dict] = None
+
+
+class AnalyzedContent(BaseModel):
+    """Compact sentiment analysis result for one content item"""
+    id: str
+    platform: str = Field(..., description="Platform identifier (reddit/twitter)")
+    source: Optional[str] = None  # Subreddit or search query the item came from
+    title: Optional[str] = None
+    text: Optional[str] = None
+    created_at: Optional[float] = None
+    url: Optional[str] = None
+    sentiment_score: Optional[float] = None
+    summary: Optional[str] = None
+    sentiment_analysis: Optional[dict] = None  # Full LLM analysis
+    content: Optional[Content] = None  # Only set when full content is requested
+
+
+class SentimentResults(BaseModel):
+    """Sentiment analysis results for one batch of scraped content"""
+    platform: str = Field(..., description="Platform identifier (reddit/twitter)")
+    analyzed_posts: List[AnalyzedContent] = Field(default_factory=list)
+    distribution: Dict[str, int] = Field(default_factory=dict)  # positive/neutral/negative counts
+    average_sentiment: float = 0.5
+    metadata: Optional[dict] = None  # original_metadata and analysis_timestamp
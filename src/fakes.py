@@ -0,0 +1,313 @@
+"""
+Local stand-ins for external services, for tests and local runs.
+
+None of these talk to the network. They implement only the parts of the real
+client APIs this project uses.
+"""
+import asyncio
+import json
+import re
+import zlib
+from typing import Any, Dict, List, Optional
+
+from temporalio import activity
+
+from backfill import BackfillChunk, parse_source
+from data import AnalyzedContent, Author, Content, ScrapedData, SentimentResults
+
+_CELL_RANGE = re.compile(r"^(?:[^!]+!)?([A-Z]+)(\d+)(?::([A-Z]+)(\d+))?$")
+
+
+def _column_number(letters: str) -> int:
+    number = 0
+    for letter in letters:
+        number = number * 26 + ord(letter) - ord("A") + 1
+    return number
+
+
+class FakeWorksheet:
+    """In-memory gspread Worksheet holding rows of cell values."""
+
+    def __init__(self, title: str = "Sheet1", rows: Optional[List[List[Any]]] = None):
+        self.title = title
+        self.rows: List[List[Any]] = [list(row) for row in rows or []]
+        # Number of API calls made, to check batching behaviour
+        self.calls: Dict[str, int] = {}
+
+    def _count(self, name: str) -> None:
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    def get_all_values(self) -> List[List[Any]]:
+        self._count("get_all_values")
+        return [list(row) for row in self.rows]
+
+    def col_values(self, col: int) -> List[Any]:
+        self._count("col_values")
+        values = [row[col - 1] if len(row) >= col else "" for row in self.rows]
+        # gspread drops trailing empty cells
+        while values and values[-1] in ("", None):
+            values.pop()
+        return values
+
+    def append_row(self, values: List[Any], **kwargs: Any) -> Dict[str, Any]:
+        self._count("append_row")
+        return self._append([values])
+
+    def append_rows(self, values: List[List[Any]], **kwargs: Any) -> Dict[str, Any]:
+        self._count("append_rows")
+        return self._append(values)
+
+    def batch_update(self, data: List[Dict[str, Any]], **kwargs: Any) -> Dict[str, Any]:
+        self._count("batch_update")
+        for update in data:
+            match = _CELL_RANGE.match(update["range"])
+            if not match:
+                raise ValueError(f"Unsupported range {update['range']}")
+            first_col = _column_number(match.group(1))
+            first_row = int(match.group(2))
+            for row_offset, values in enumerate(update["values"]):
+                row_number = first_row + row_offset
+                while len(self.rows) < row_number:
+                    self.rows.append([])
+                row = self.rows[row_number - 1]
+                end = first_col - 1 + len(values)
+                if len(row) < end:
+                    row.extend([""] * (end - len(row)))
+                row[first_col - 1:end] = list(values)
+        return {"totalUpdatedRows": len(data)}
+
+    def _append(self, values: List[List[Any]]) -> Dict[str, Any]:
+        first_row = len(self.rows) + 1
+        self.rows.extend(list(row) for row in values)
+        last_row = len(self.rows)
+        width = max((len(row) for row in values), default=1)
+        last_col = chr(ord("A") + width - 1)
+        return {
+            "updates": {
+                "updatedRange": f"{self.title}!A{first_row}:{last_col}{last_row}",
+                "updatedRows": len(values),
+            }
+        }
+
+
+class FakeSpreadsheet:
+    def __init__(self, key: str):
+        self.id = key
+        self.sheet1 = FakeWorksheet()
+
+
+class FakeGspreadClient:
+    """Stands in for the client returned by gspread.authorize."""
+
+    def __init__(self):
+        self.spreadsheets: Dict[str, FakeSpreadsheet] = {}
+
+    def open_by_key(self, key: str) -> FakeSpreadsheet:
+        if key not in self.spreadsheets:
+            self.spreadsheets[key] = FakeSpreadsheet(key)
+        return self.spreadsheets[key]
+
+
+# Stand-in activities, registered under the names of the real ones so a test
+# worker can run the backfill and analysis workflows without any credentials,
+# e.g. Worker(..., activities=FAKE_ACTIVITIES).
+
+# Seconds between the items generated by fake_scrape_backfill_chunk
+FAKE_ITEM_INTERVAL = 60 * 60
+
+# Oldest time the fake Reddit listing reaches back to, like the ~1000 posts
+# Reddit lists per subreddit
+reddit_listing_start = 0.0
+
+# Results received by fake_store_results_in_sheets, in order
+stored_results: List[SentimentResults] = []
+
+
+def _fake_score(content_id: str) -> float:
+    return (zlib.crc32(content_id.encode()) % 101) / 100
+
+
+@activity.defn(name="scrape_backfill_chunk")
+async def fake_scrape_backfill_chunk(chunk: BackfillChunk) -> ScrapedData:
+    """
+    One deterministic item per FAKE_ITEM_INTERVAL of the chunk. The listing
+    position it was given is kept in the metadata as "after".
+    """
+    platform, name = parse_source(chunk.source)
+    reddit = platform == "reddit"
+    items = []
+    created_at = max(chunk.start, reddit_listing_start) if reddit else chunk.start
+    while created_at < chunk.end:
+        content_id = f"{name or platform}-{created_at:.0f}"
+        items.append(Content(
+            id=content_id,
+            title=f"Backfilled post {content_id}",
+            text="Stand-in content",
+            author=Author(id="fake", name="fake"),
+            created_at=created_at,
+            platform=platform,
+        ))
+        created_at += FAKE_ITEM_INTERVAL
+    metadata = {
+        "subreddit": name,
+        "start": chunk.start,
+        "end": chunk.end,
+        "after": chunk.after,
+        "complete": not reddit or chunk.start >= reddit_listing_start,
+    }
+    metadata["incomplete_reason"] = None if metadata["complete"] else "Older than the fake listing"
+    if reddit:
+        metadata["next_after"] = f"t3_{items[0].id}" if items else chunk.after
+    return ScrapedData(platform=platform, items=items, metadata=metadata)
+
+
+@activity.defn(name="analyze_sentiment")
+async def fake_analyze_sentiment(
+    scraped_data: ScrapedData, include_content: bool = False
+) -> SentimentResults:
+    """Scores each item from a hash of its id instead of calling OpenAI."""
+    posts = [
+        AnalyzedContent(
+            id=content.id,
+            platform=content.platform,
+            source=(scraped_data.metadata or {}).get("subreddit") or content.platform,
+            title=content.title,
+            text=content.text,
+            created_at=content.created_at,
+            sentiment_score=_fake_score(content.id),
+            summary="Stand-in analysis",
+            content=content if include_content else None,
+        )
+        for content in scraped_data.items
+    ]
+    scores = [post.sentiment_score for post in posts]
+    return SentimentResults(
+        analyzed_posts=posts,
+        distribution={
+            "positive": sum(1 for score in scores if score > 0.6),
+            "neutral": sum(1 for score in scores if 0.4 <= score <= 0.6),
+            "negative": sum(1 for score in scores if score < 0.4),
+        },
+        average_sentiment=sum(scores) / len(scores) if scores else 0.5,
+        platform=scraped_data.platform,
+        metadata={
+            "original_metadata": scraped_data.metadata,
+            "analysis_timestamp": scraped_data.timestamp,
+        },
+    )
+
+
+@activity.defn(name="store_results_in_sheets")
+async def fake_store_results_in_sheets(sentiment_results: SentimentResults) -> bool:
+    stored_results.append(sentiment_results)
+    return True
+
+
+FAKE_ACTIVITIES = [
+    fake_scrape_backfill_chunk,
+    fake_analyze_sentiment,
+    fake_store_results_in_sheets,
+]
+
+
+class SaturatingChatServer:
+    """
+    Local OpenAI-compatible chat completions endpoint that saturates like a
+    real one, to exercise concurrency.AdaptiveLimiter.
+
+    Up to capacity requests are served in base_latency seconds. Beyond that
+    latency grows with the load, and requests over queue_limit are rejected
+    with 429. Point the OpenAI client at it with base_url=server.base_url (or
+    OPENAI_BASE_URL).
+    """
+
+    def __init__(
+        self,
+        capacity: int = 8,
+        base_latency: float = 0.05,
+        queue_limit: int = 16,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        self.capacity = capacity
+        self.base_latency = base_latency
+        self.queue_limit = queue_limit
+        self.host = host
+        self.port = port
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.responses: Dict[int, int] = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def close(self) -> None:
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            await reader.readline()  # request line
+            length = 0
+            while True:
+                header = (await reader.readline()).decode().strip()
+                if not header:
+                    break
+                name, _, value = header.partition(":")
+                if name.lower() == "content-length":
+                    length = int(value)
+            await reader.readexactly(length)
+
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            try:
+                if self.in_flight > self.queue_limit:
+                    status, body = 429, {"error": {"message": "Rate limit reached", "type": "requests"}}
+                else:
+                    await asyncio.sleep(
+                        self.base_latency * max(1.0, self.in_flight / self.capacity)
+                    )
+                    status, body = 200, self._completion()
+            finally:
+                self.in_flight -= 1
+
+            self.responses[status] = self.responses.get(status, 0) + 1
+            payload = json.dumps(body).encode()
+            reason = "OK" if status == 200 else "Too Many Requests"
+            writer.write(
+                f"HTTP/1.1 {status} {reason}\r\n"
+                f"Content-Type: application/json\r\n"
+                f"Content-Length: {len(payload)}\r\n"
+                f"Connection: close\r\n\r\n".encode() + payload
+            )
+            await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _completion() -> Dict[str, Any]:
+        analysis = {
+            "sentiment_analysis": {"sentiment_score": 0.5, "overall_sentiment": "neutral"},
+            "summary": "Stand-in analysis",
+        }
+        return {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": 0,
+            "model": "fake",
+            "choices": [{
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {"role": "assistant", "content": json.dumps(analysis)},
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        }
@@ -0,0 +1,48 @@
+import os
+import zlib
+from typing import Dict, List
+
+from data import Content, ScrapedData
+
+# Used from inside workflows: the partition of an item must never depend on
+# anything but its platform and id (Python's hash() is salted per process).
+
+ANALYZER_ID_PREFIX = "sentiment-analyzer"
+# Workflow id of the single analyzer used before analysis was partitioned
+LEGACY_ANALYZER_ID = "sentiment-analyzer"
+DEFAULT_PARTITIONS = 4
+
+
+def partitions_from_env() -> int:
+    """Number of analyzer partitions, from ANALYZER_PARTITIONS."""
+    partitions = int(os.getenv("ANALYZER_PARTITIONS", DEFAULT_PARTITIONS))
+    # Zero would leave content with no analyzer (and divide by zero)
+    if partitions < 1:
+        raise ValueError(f"ANALYZER_PARTITIONS must be at least 1, got {partitions}")
+    return partitions
+
+
+def analyzer_id(partition: int) -> str:
+    """Workflow id of the sentiment analyzer owning a partition."""
+    return f"{ANALYZER_ID_PREFIX}-{partition}"
+
+
+def partition_for(platform: str, content_id: str, partitions: int) -> int:
+    """Stable partition of a content item."""
+    return zlib.crc32(f"{platform}:{content_id}".encode()) % partitions
+
+
+def split_by_partition(scraped_data: ScrapedData, partitions: int) -> Dict[int, ScrapedData]:
+    """
+    Split scraped data into one ScrapedData per partition that has items.
+
+    Platform, timestamp and metadata are kept on every part.
+    """
+    items: Dict[int, List[Content]] = {}
+    for content in scraped_data.items:
+        partition = partition_for(content.platform, content.id, partitions)
+        items.setdefault(partition, []).append(content)
+    return {
+        partition: scraped_data.model_copy(update={"items": partition_items})
+        for partition, partition_items in items.items()
+    }
@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+import argparse
+import asyncio
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import socket
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+# The admin endpoint only listens on loopback; reach it with `docker exec` or
+# from the same host. Set PROFILER_PORT=off to disable it.
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+# Longest profile or capture a single command can request
+MAX_SECONDS = 600
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+def _fold(frame) -> str:
+    """Return a frame's stack, outermost first, as a folded flamegraph stack."""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+def sample_stacks(seconds: float, interval: float = 0.005) -> str:
+    """
+    Sample the stacks of every thread for the given time.
+
+    Runs in its own thread so it also sees the event loop while it is busy.
+
+    Returns:
+        Folded stacks ("thread;outer;...;inner count" per line), the input
+        format of flamegraph.pl, inferno and speedscope
+    """
+    counts: Counter = Counter()
+    own_id = threading.get_ident()
+    names = {}
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        names.update({thread.ident: thread.name for thread in threading.enumerate()})
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id != own_id:
+                thread_name = names.get(thread_id, str(thread_id)).replace(" ", "_")
+                counts[f"{thread_name};{_fold(frame)}"] += 1
+        time.sleep(interval)
+    return "".join(f"{stack} {count}\n" for stack, count in counts.most_common())
+
+
+async def profile_calls(seconds: float, limit: int = 40) -> str:
+    """
+    Run cProfile on the event loop thread for the given time.
+
+    Only code running on the event loop is profiled, not executor threads; use
+    sample_stacks for those (e.g. Sheets writes).
+
+    Returns:
+        The top functions by cumulative time, as printed by pstats
+    """
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        profiler.disable()
+
+    output = io.StringIO()
+    stats = pstats.Stats(profiler, stream=output)
+    stats.sort_stats("cumulative").print_stats(limit)
+    return output.getvalue()
+
+
+def list_tasks(stack_limit: int = 10) -> str:
+    """List the running asyncio tasks with where each one is suspended."""
+    lines = []
+    tasks = sorted(asyncio.all_tasks(), key=lambda task: task.get_name())
+    for task in tasks:
+        coro = task.get_coro()
+        name = getattr(coro, "__qualname__", repr(coro))
+        lines.append(f"{task.get_name()} {name}")
+        for frame in task.get_stack(limit=stack_limit):
+            code = frame.f_code
+            lines.append(
+                f"    {os.path.basename(code.co_filename)}:{frame.f_lineno} {code.co_name}"
+            )
+    lines.append(f"{len(tasks)} tasks")
+    return "\n".join(lines) + "\n"
+
+
+class _SlowCallbackHandler(logging.Handler):
+    """Collects the "Executing ... took ... seconds" warnings of asyncio debug mode."""
+
+    def __init__(self):
+        super().__init__(level=logging.WARNING)
+        self.records: List[str] = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        message = record.getMessage()
+        if message.startswith("Executing "):
+            self.records.append(message)
+
+
+async def capture_slow_callbacks(seconds: float, threshold: float = 0.1) -> str:
+    """
+    Report callbacks that block the event loop for longer than threshold.
+
+    Temporarily turns on asyncio debug mode, which times every callback; it is
+    restored afterwards since it slows the loop down.
+    """
+    loop = asyncio.get_running_loop()
+    asyncio_logger = logging.getLogger("asyncio")
+    handler = _SlowCallbackHandler()
+    previous_debug = loop.get_debug()
+    previous_threshold = loop.slow_callback_duration
+
+    asyncio_logger.addHandler(handler)
+    loop.slow_callback_duration = threshold
+    loop.set_debug(True)
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        loop.set_debug(previous_debug)
+        loop.slow_callback_duration = previous_threshold
+        asyncio_logger.removeHandler(handler)
+
+    lines = handler.records + [
+        f"{len(handler.records)} callbacks over {threshold:.3f}s in {seconds:.0f}s"
+    ]
+    return "\n".join(lines) + "\n"
+
+
+HELP = """Commands:
+  sample SECONDS [INTERVAL]     folded stacks of all threads (flamegraph input)
+  profile SECONDS [LIMIT]       cProfile of the event loop, top functions
+  tasks                         running asyncio tasks and their stacks
+  limits                        adaptive concurrency limits and their latency
+  slow SECONDS [THRESHOLD]      event loop callbacks slower than THRESHOLD seconds
+"""
+
+
+class ProfilingServer:
+    """
+    Local admin endpoint for profiling the running worker.
+
+    Each connection sends one command line (see HELP) and receives the text
+    output, after which the connection is closed. Only one capture runs at a
+    time.
+    """
+
+    def __init__(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT):
+        self.host = host
+        self.port = port
+        self._busy = asyncio.Lock()
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        logger.info(f"Profiling endpoint listening on {self.host}:{self.port}")
+
+    async def close(self) -> None:
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def run_command(self, line: str) -> str:
+        parts = line.split()
+        if not parts or parts[0] == "help":
+            return HELP
+        command, args = parts[0], parts[1:]
+
+        if command == "tasks":
+            return list_tasks()
+        if command == "limits":
+            from concurrency import all_limiter_stats
+
+            return json.dumps(all_limiter_stats(), indent=2) + "\n"
+        if command not in ("sample", "profile", "slow"):
+            return f"error: unknown command {command!r}\n{HELP}"
+
+        try:
+            seconds = float(args[0]) if args else 10.0
+            extra = float(args[1]) if len(args) > 1 else None
+        except ValueError:
+            return f"error: invalid arguments {' '.join(args)!r}\n"
+        if not 0 < seconds <= MAX_SECONDS:
+            return f"error: SECONDS must be between 0 and {MAX_SECONDS}\n"
+
+        if self._busy.locked():
+            return "error: another capture is already running\n"
+        async with self._busy:
+            logger.info(f"Running profiling command: {line.strip()}")
+            if command == "sample":
+                # A dedicated thread, so a busy default executor can't delay it
+                loop = asyncio.get_running_loop()
+                with ThreadPoolExecutor(max_workers=1) as executor:
+                    return await loop.run_in_executor(
+                        executor, sample_stacks, seconds, extra or 0.005
+                    )
+            if command == "profile":
+                return await profile_calls(seconds, int(extra or 40))
+            return await capture_slow_callbacks(seconds, extra or 0.1)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            line = (await reader.readline()).decode()
+            try:
+                output = await self.run_command(line)
+            except Exception as e:
+                logger.error(f"Error running profiling command {line.strip()!r}: {e}")
+                output = f"error: {e}\n"
+            writer.write(output.encode())
+            await writer.drain()
+        finally:
+            writer.close()
+
+
+def get_profiler_port() -> Optional[int]:
+    """Return the configured admin port, or None if the endpoint is disabled."""
+    port = os.getenv("PROFILER_PORT", str(DEFAULT_PORT)).strip().lower()
+    if port in ("", "0", "off", "false"):
+        return None
+    return int(port)
+
+
+def send_command(command: str, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT) -> str:
+    """Send a command to a worker's profiling endpoint and return its output."""
+    with socket.create_connection((host, port)) as connection:
+        connection.sendall(command.encode() + b"\n")
+        chunks = []
+        while True:
+            chunk = connection.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    return b"".join(chunks).decode()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Profile a running worker through its local admin endpoint",
+        epilog=HELP,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("command", nargs="+", help="e.g. 'sample 30' or 'tasks'")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=get_profiler_port() or DEFAULT_PORT)
+    parser.add_argument("--output", help="Write the output to this file instead of stdout")
+    args = parser.parse_args()
+
+    result = send_command(" ".join(args.command), args.host, args.port)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(result)
+    else:
+        sys.stdout.write(result)
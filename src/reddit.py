@@ -1,116 +1,176 @@
 from temporalio import activity
-import asyncpraw
 import os
-from typing import List
+from typing import List, Optional
 import logging
+from concurrency import get_limiter
 from data import ScrapedData, Content, Author, Reply
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_SUBREDDIT = "programming"
 
-@activity.defn
-async def scrape_reddit() -> ScrapedData:
-    # Initialize Reddit client with asyncpraw
-    reddit = asyncpraw.Reddit(
-        client_id=os.getenv("REDDIT_CLIENT_ID"),
-        client_secret=os.getenv("REDDIT_CLIENT_SECRET"),
-        user_agent="my_reddit_scraper/1.0"
+# Number of top-level comments fetched per post. Can be overridden globally with
+# REDDIT_COMMENT_BUDGET or per subreddit with REDDIT_COMMENT_BUDGETS, e.g.
+# "programming=5,python=20".
+DEFAULT_COMMENT_BUDGET = 10
+
+
+def get_comment_budget(subreddit_name: str) -> int:
+    """Return how many top-level comments to fetch for posts in a subreddit."""
+    budgets = {}
+    for entry in os.getenv("REDDIT_COMMENT_BUDGETS", "").split(","):
+        if "=" not in entry:
+            continue
+        name, value = entry.split("=", 1)
+        try:
+            budgets[name.strip().lower()] = int(value)
+        except ValueError:
+            logger.warning(f"Ignoring invalid comment budget '{entry}'")
+    
+    default_budget = int(os.getenv("REDDIT_COMMENT_BUDGET", DEFAULT_COMMENT_BUDGET))
+    return max(0, budgets.get(subreddit_name.lower(), default_budget))
+
+
+async def build_submission_content(submission, comment_budget: int) -> Content:
+    """Build a Content item from a submission and up to comment_budget top comments."""
+    # Create author - handle deleted/None authors safely
+    author_name = "[deleted]"
+    author_id = "deleted"
+    is_mod = False
+    
+    if submission.author:
+        try:
+            author_name = str(submission.author.name)
+            # Use name as id if actual id is not available
+            author_id = str(submission.author.name)
+            is_mod = bool(submission.author.is_mod) if hasattr(submission.author, "is_mod") else False
+        except Exception as e:
+            logger.warning(f"Error fetching author details: {e}")
+    
+    author = Author(
+        id=author_id,
+        name=author_name,
+        platform_specific_data={"is_mod": is_mod} if is_mod else None
     )
     
-    subreddit = await reddit.subreddit("programming")
-    contents: List[Content] = []
+    # Process comments
+    replies: List[Reply] = []
     
-    try:
-        # Get hot posts
-        async for submission in subreddit.hot(limit=3):
-            # Create author - handle deleted/None authors safely
-            author_name = "[deleted]"
-            author_id = "deleted"
-            is_mod = False
+    # Fetch only the top comments we have budget for. One extra is
+    # requested to make up for a stickied mod comment.
+    if comment_budget > 0:
+        submission.comment_sort = "top"  # Sort comments by top
+        submission.comment_limit = comment_budget + 1
+        # Limited across concurrent scrapes on this worker, e.g. backfill chunks
+        async with get_limiter("reddit").slot():
+            await submission.load()
+        
+        # Remove "load more comments" objects without fetching them
+        await submission.comments.replace_more(limit=0)
+        
+        async for top_comment in submission.comments:
+            if len(replies) >= comment_budget:
+                break
+            if top_comment.stickied:  # Skip stickied comments
+                continue
             
-            if submission.author:
+            # Handle comment author similarly
+            comment_author_name = "[deleted]"
+            comment_author_id = "deleted"
+            
+            if top_comment.author:
                 try:
-                    author_name = str(submission.author.name)
-                    # Use name as id if actual id is not available
-                    author_id = str(submission.author.name)
-                    is_mod = bool(submission.author.is_mod) if hasattr(submission.author, "is_mod") else False
+                    comment_author_name = str(top_comment.author.name)
+                    comment_author_id = str(top_comment.author.name)
                 except Exception as e:
-                    logger.warning(f"Error fetching author details: {e}")
+                    logger.warning(f"Error fetching comment author details: {e}")
             
-            author = Author(
-                id=author_id,
-                name=author_name,
-                platform_specific_data={"is_mod": is_mod} if is_mod else None
+            comment_author = Author(
+                id=comment_author_id,
+                name=comment_author_name
             )
             
-            # Process comments
-            replies: List[Reply] = []
-            
-            # Fetch comments
-            submission.comment_sort = "top"  # Sort comments by top
-            await submission.load()  # Ensure all comments are loaded
-            
-            # Get top-level comments
-            submission.comments.replace_more(limit=0)  # Remove "load more comments" objects
-            
-            async for top_comment in submission.comments:
-                if not top_comment.stickied:  # Skip stickied comments
-                    # Handle comment author similarly
-                    comment_author_name = "[deleted]"
-                    comment_author_id = "deleted"
-                    
-                    if top_comment.author:
-                        try:
-                            comment_author_name = str(top_comment.author.name)
-                            comment_author_id = str(top_comment.author.name)
-                        except Exception as e:
-                            logger.warning(f"Error fetching comment author details: {e}")
-                    
-                    comment_author = Author(
-                        id=comment_author_id,
-                        name=comment_author_name
-                    )
-                    
-                    reply = Reply(
-                        id=top_comment.id,
-                        content=top_comment.body,
-                        author=comment_author,
-                        score=top_comment.score,
-                        created_at=top_comment.created_utc,
-                        platform="reddit",
-                        platform_specific_data={
-                            "is_stickied": top_comment.stickied,
-                            "is_edited": bool(top_comment.edited) if hasattr(top_comment, "edited") else False
-                        }
-                    )
-                    
-                    replies.append(reply)
-            
-            # Create content
-            content = Content(
-                id=submission.id,
-                title=submission.title,
-                text=submission.selftext,
-                author=author,
-                created_at=submission.created_utc,
-                score=submission.score,
-                url=submission.url,
+            reply = Reply(
+                id=top_comment.id,
+                content=top_comment.body,
+                author=comment_author,
+                score=top_comment.score,
+                created_at=top_comment.created_utc,
                 platform="reddit",
-                engagement_metrics={
-                    "score": submission.score,
-                    "upvote_ratio": submission.upvote_ratio if hasattr(submission, "upvote_ratio") else None,
-                    "num_comments": submission.num_comments
-                },
-                replies=replies[:10],  # Limit to top 10 comments
                 platform_specific_data={
-                    "is_self": submission.is_self,
-                    "over_18": submission.over_18,
-                    "spoiler": submission.spoiler if hasattr(submission, "spoiler") else False
+                    "is_stickied": top_comment.stickied,
+                    "is_edited": bool(top_comment.edited) if hasattr(top_comment, "edited") else False
                 }
             )
             
+            replies.append(reply)
+    
+    # Create content
+    content = Content(
+        id=submission.id,
+        title=submission.title,
+        text=submission.selftext,
+        author=author,
+        created_at=submission.created_utc,
+        score=submission.score,
+        url=submission.url,
+        platform="reddit",
+        engagement_metrics={
+            "score": submission.score,
+            "upvote_ratio": submission.upvote_ratio if hasattr(submission, "upvote_ratio") else None,
+            "num_comments": submission.num_comments
+        },
+        replies=replies,
+        platform_specific_data={
+            "is_self": submission.is_self,
+            "over_18": submission.over_18,
+            "spoiler": submission.spoiler if hasattr(submission, "spoiler") else False
+        }
+    )
+    
+    return content
+
+
+def create_client():
+    """Create an asyncpraw client from the REDDIT_* environment variables."""
+    # Imported here so workers without Reddit activities never load asyncpraw
+    import asyncpraw
+    
+    return asyncpraw.Reddit(
+        client_id=os.getenv("REDDIT_CLIENT_ID"),
+        client_secret=os.getenv("REDDIT_CLIENT_SECRET"),
+        user_agent="my_reddit_scraper/1.0"
+    )
+
+
+@activity.defn
+async def scrape_reddit(subreddit_name: str = DEFAULT_SUBREDDIT) -> ScrapedData:
+    # Initialize Reddit client with asyncpraw
+    reddit = create_client()
+    
+    subreddit = await reddit.subreddit(subreddit_name)
+    comment_budget = get_comment_budget(subreddit_name)
+    contents: List[Content] = []
+    
+    # Resume from the last checkpoint if this is a retry
+    heartbeat_details = activity.info().heartbeat_details
+    if heartbeat_details:
+        contents = [Content.model_validate(item) for item in heartbeat_details[0]["contents"]]
+        logger.info(f"Resuming Reddit scrape after {len(contents)} completed posts")
+    completed_ids = {content.id for content in contents}
+    
+    try:
+        # Get hot posts
+        async for submission in subreddit.hot(limit=3):
+            if submission.id in completed_ids:
+                continue
+            
+            content = await build_submission_content(submission, comment_budget)
             contents.append(content)
-            logger.info(f"Scraped Reddit post {submission.id} with {len(replies)} comments")
+            logger.info(f"Scraped Reddit post {submission.id} with {len(content.replies)} comments")
+            
+            # Checkpoint progress so a retry doesn't reload the posts done so far
+            activity.heartbeat({"contents": [item.model_dump() for item in contents]})
     
     except Exception as e:
         logger.error(f"Error scraping Reddit: {e}")
@@ -124,10 +184,74 @@ async def scrape_reddit() -> ScrapedData:
         platform="reddit",
         items=contents,
         metadata={
-            "subreddit": "programming",
-            "sort": "hot"
+            "subreddit": subreddit_name,
+            "sort": "hot",
+            "comment_budget": comment_budget
         }
     )
     
     logger.info(f"Successfully scraped {len(contents)} Reddit posts")
     return scraped_data
+
+
+async def scrape_reddit_range(
+    subreddit_name: str, start: float, end: float, after: Optional[str] = None
+) -> ScrapedData:
+    """
+    Scrape the posts of a subreddit created in [start, end), as unix timestamps.
+    
+    Walks the "new" listing backwards, from the newest post or from the
+    listing position after. Reddit only lists about the latest 1000 posts of a
+    subreddit; when the listing ends before reaching start, the metadata has
+    "complete" set to False and the reason in "incomplete_reason".
+    "next_after" is the listing position to continue from for the range just
+    before start. Must be called from an activity, which is heartbeated after
+    every post.
+    """
+    reddit = create_client()
+    comment_budget = get_comment_budget(subreddit_name)
+    contents: List[Content] = []
+    complete = False
+    next_after = after
+    
+    try:
+        subreddit = await reddit.subreddit(subreddit_name)
+        params = {"after": after} if after else None
+        async for submission in subreddit.new(limit=None, params=params):
+            if submission.created_utc < start:
+                complete = True
+                break
+            next_after = submission.fullname
+            if submission.created_utc >= end:
+                activity.heartbeat()
+                continue
+            
+            contents.append(await build_submission_content(submission, comment_budget))
+            activity.heartbeat()
+    finally:
+        await reddit.close()
+    
+    if not complete:
+        logger.warning(
+            f"Reddit listing of r/{subreddit_name} ended before {start:.0f}, "
+            f"the range is only partly covered"
+        )
+    
+    logger.info(
+        f"Scraped {len(contents)} Reddit posts from r/{subreddit_name} "
+        f"between {start:.0f} and {end:.0f}"
+    )
+    return ScrapedData(
+        platform="reddit",
+        items=contents,
+        metadata={
+            "subreddit": subreddit_name,
+            "sort": "new",
+            "comment_budget": comment_budget,
+            "start": start,
+            "end": end,
+            "complete": complete,
+            "incomplete_reason": None if complete else "Reddit's listing ends before the chunk",
+            "next_after": next_after
+        }
+    )
@@ -0,0 +1,264 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = "data/results.db"
+
+# Rows are upserted in chunks so a single huge batch never holds the write lock
+# for long; WAL mode lets readers keep querying while a chunk commits.
+UPSERT_CHUNK_SIZE = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS analyzed_posts (
+    platform TEXT NOT NULL,
+    content_id TEXT NOT NULL,
+    source TEXT,
+    title TEXT,
+    text TEXT,
+    summary TEXT,
+    sentiment_score REAL,
+    created_at REAL,
+    analyzed_at REAL NOT NULL,
+    analysis TEXT,
+    PRIMARY KEY (platform, content_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_posts_analyzed_at ON analyzed_posts (analyzed_at);
+CREATE INDEX IF NOT EXISTS idx_posts_platform_time ON analyzed_posts (platform, analyzed_at);
+CREATE INDEX IF NOT EXISTS idx_posts_score ON analyzed_posts (sentiment_score);
+"""
+
+_UPSERT = """
+INSERT INTO analyzed_posts (
+    platform, content_id, source, title, text, summary,
+    sentiment_score, created_at, analyzed_at, analysis
+) VALUES (
+    :platform, :content_id, :source, :title, :text, :summary,
+    :sentiment_score, :created_at, :analyzed_at, :analysis
+)
+ON CONFLICT (platform, content_id) DO UPDATE SET
+    source = excluded.source,
+    title = excluded.title,
+    text = excluded.text,
+    summary = COALESCE(excluded.summary, analyzed_posts.summary),
+    sentiment_score = COALESCE(excluded.sentiment_score, analyzed_posts.sentiment_score),
+    created_at = excluded.created_at,
+    analyzed_at = CASE
+        WHEN excluded.sentiment_score IS NULL AND analyzed_posts.sentiment_score IS NOT NULL
+        THEN analyzed_posts.analyzed_at
+        ELSE excluded.analyzed_at
+    END,
+    analysis = COALESCE(excluded.analysis, analyzed_posts.analysis)
+"""
+
+_COLUMNS = [
+    "platform", "content_id", "source", "title", "text", "summary",
+    "sentiment_score", "created_at", "analyzed_at",
+]
+
+
+class ResultStore:
+    """Embedded SQLite store for analyzed posts, keyed by platform and content id."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.getenv("RESULTS_DB_PATH", DEFAULT_DB_PATH)
+        if self.path != ":memory:":
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+
+        # Activities run sink writes in executor threads, so the connection is
+        # shared across threads and guarded by a lock.
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        logger.info(f"Opened results store at {self.path}")
+
+    def upsert(self, records: Iterable[Dict[str, Any]]) -> int:
+        """
+        Insert or update analyzed posts in batches.
+
+        A failed analysis (no sentiment score) keeps the score, summary,
+        analysis and analysis time of an earlier successful one.
+
+        Args:
+            records: Flat records as produced by sinks.extract_records
+
+        Returns:
+            int: Number of records written
+        """
+        rows = [self._to_row(record) for record in records]
+        with self._lock:
+            for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+                with self._conn:
+                    self._conn.executemany(_UPSERT, rows[start:start + UPSERT_CHUNK_SIZE])
+        return len(rows)
+
+    def sentiment_trend(
+        self,
+        platform: Optional[str] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        bucket_seconds: int = 3600,
+    ) -> List[Dict[str, Any]]:
+        """Average sentiment and post count per time bucket, oldest first."""
+        where, params = self._time_filter(platform, since, until)
+        query = f"""
+            SELECT CAST(analyzed_at / ? AS INTEGER) * ? AS bucket,
+                   COUNT(*) AS posts,
+                   AVG(sentiment_score) AS average_sentiment
+            FROM analyzed_posts {where}
+            GROUP BY bucket
+            ORDER BY bucket
+        """
+        with self._lock:
+            cursor = self._conn.execute(query, [bucket_seconds, bucket_seconds, *params])
+            return [dict(row) for row in cursor.fetchall()]
+
+    def top_posts(
+        self,
+        platform: Optional[str] = None,
+        since: Optional[float] = None,
+        limit: int = 10,
+        most_negative: bool = False,
+    ) -> List[Dict[str, Any]]:
+        """Most positive (or most negative) posts, served from the score index."""
+        where, params = self._time_filter(platform, since, None)
+        order = "ASC" if most_negative else "DESC"
+        query = f"""
+            SELECT {", ".join(_COLUMNS)} FROM analyzed_posts {where}
+            ORDER BY sentiment_score {order}
+            LIMIT ?
+        """
+        with self._lock:
+            cursor = self._conn.execute(query, [*params, limit])
+            return [dict(row) for row in cursor.fetchall()]
+
+    def export_daily_partitions(
+        self, out_dir: str, since: Optional[float] = None, until: Optional[float] = None
+    ) -> List[str]:
+        """
+        Export analyzed posts as one Parquet file per UTC day.
+
+        Files are written to ``out_dir/date=YYYY-MM-DD/part-0.parquet`` so the
+        output can be read directly as a hive-partitioned Arrow dataset.
+
+        Returns:
+            List[str]: Paths of the files written
+        """
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise RuntimeError("pyarrow is required for Parquet export") from e
+
+        where, params = self._time_filter(None, since, until)
+        with self._lock:
+            cursor = self._conn.execute(
+                f"""
+                SELECT DISTINCT date(analyzed_at, 'unixepoch') AS day
+                FROM analyzed_posts {where} ORDER BY day
+                """,
+                params,
+            )
+            days = [row["day"] for row in cursor.fetchall()]
+
+        written = []
+        for day in days:
+            day_start = datetime.strptime(day, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+            day_end = day_start + timedelta(days=1)
+            start = max(day_start.timestamp(), since) if since is not None else day_start.timestamp()
+            end = min(day_end.timestamp(), until) if until is not None else day_end.timestamp()
+            with self._lock:
+                cursor = self._conn.execute(
+                    f"""
+                    SELECT {", ".join(_COLUMNS)} FROM analyzed_posts
+                    WHERE analyzed_at >= ? AND analyzed_at < ?
+                    ORDER BY analyzed_at
+                    """,
+                    [start, end],
+                )
+                rows = cursor.fetchall()
+
+            table = pa.Table.from_pydict({
+                column: [row[column] for row in rows] for column in _COLUMNS
+            })
+            partition_dir = Path(out_dir) / f"date={day}"
+            partition_dir.mkdir(parents=True, exist_ok=True)
+            path = partition_dir / "part-0.parquet"
+            pq.write_table(table, path)
+            written.append(str(path))
+            logger.info(f"Exported {len(rows)} posts to {path}")
+
+        return written
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    @staticmethod
+    def _to_row(record: Dict[str, Any]) -> Dict[str, Any]:
+        analysis = record.get("analysis")
+        return {
+            "platform": record["platform"],
+            "content_id": str(record["content_id"]),
+            "source": record.get("source"),
+            "title": record.get("title"),
+            "text": record.get("text"),
+            "summary": record.get("summary"),
+            "sentiment_score": record.get("sentiment_score"),
+            "created_at": record.get("created_at"),
+            "analyzed_at": record.get("analyzed_at") or datetime.now().timestamp(),
+            "analysis": json.dumps(analysis) if analysis is not None else None,
+        }
+
+    @staticmethod
+    def _time_filter(
+        platform: Optional[str], since: Optional[float], until: Optional[float]
+    ) -> tuple:
+        clauses = []
+        params: List[Any] = []
+        if platform:
+            clauses.append("platform = ?")
+            params.append(platform)
+        if since is not None:
+            clauses.append("analyzed_at >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("analyzed_at < ?")
+            params.append(until)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return where, params
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    parser = argparse.ArgumentParser(description="Export analyzed posts to daily Parquet files")
+    parser.add_argument("out_dir", help="Directory to write date=YYYY-MM-DD partitions to")
+    parser.add_argument("--db", default=None, help="Path to the results database")
+    parser.add_argument("--days", type=int, default=None, help="Only export the last N days")
+    args = parser.parse_args()
+
+    since = None
+    if args.days is not None:
+        since = (datetime.now(timezone.utc) - timedelta(days=args.days)).timestamp()
+
+    store = ResultStore(args.db)
+    try:
+        for path in store.export_daily_partitions(args.out_dir, since=since):
+            print(path)
+    finally:
+        store.close()
@@ -0,0 +1,141 @@
+import os
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import Deque, Dict, Iterable, List, Optional, Set
+
+# This module is used from inside workflows, so it must stay deterministic:
+# no clocks, no randomness of its own and no I/O outside policy_from_env.
+
+# Polls per scraper workflow run before continuing as new, which keeps the
+# event history of the never-ending polling loops bounded
+MAX_POLLS_PER_RUN = 500
+
+
+@dataclass
+class PollPolicy:
+    """Bounds and tuning for the adaptive polling interval of one source."""
+
+    min_interval_seconds: float = 30
+    max_interval_seconds: float = 3600
+    initial_interval_seconds: float = 300
+    # A poll returning at least this many unseen items counts as busy; keep it
+    # at or below the number of items one poll can return
+    busy_threshold: int = 5
+    # Interval multiplier after a busy poll
+    speedup_factor: float = 0.5
+    # Interval multiplier after an empty, failed or rate-limited poll
+    backoff_factor: float = 2.0
+    # Random spread applied to every interval, as a fraction of it
+    jitter_ratio: float = 0.1
+
+
+DEFAULT_POLICIES: Dict[str, PollPolicy] = {
+    "reddit": PollPolicy(
+        min_interval_seconds=30,
+        max_interval_seconds=30 * 60,
+        initial_interval_seconds=60,
+        # scrape_reddit reads at most 3 hot posts per poll
+        busy_threshold=2,
+    ),
+    "twitter": PollPolicy(
+        min_interval_seconds=60,
+        max_interval_seconds=2 * 60 * 60,
+        initial_interval_seconds=5 * 60,
+    ),
+}
+
+
+def policy_from_env(source: str) -> PollPolicy:
+    """
+    Build the policy for a source, applying environment overrides such as
+    REDDIT_POLL_MIN_SECONDS, REDDIT_POLL_MAX_SECONDS, REDDIT_POLL_INITIAL_SECONDS
+    and REDDIT_POLL_JITTER.
+    """
+    default = DEFAULT_POLICIES.get(source, PollPolicy())
+    prefix = f"{source.upper()}_POLL_"
+    return PollPolicy(
+        min_interval_seconds=float(os.getenv(prefix + "MIN_SECONDS", default.min_interval_seconds)),
+        max_interval_seconds=float(os.getenv(prefix + "MAX_SECONDS", default.max_interval_seconds)),
+        initial_interval_seconds=float(
+            os.getenv(prefix + "INITIAL_SECONDS", default.initial_interval_seconds)
+        ),
+        busy_threshold=int(os.getenv(prefix + "BUSY_THRESHOLD", default.busy_threshold)),
+        speedup_factor=default.speedup_factor,
+        backoff_factor=default.backoff_factor,
+        jitter_ratio=float(os.getenv(prefix + "JITTER", default.jitter_ratio)),
+    )
+
+
+class AdaptivePoller:
+    """
+    Computes the delay before the next poll from the outcome of the last one.
+
+    Busy polls shorten the interval, empty or rate-limited polls back off
+    exponentially, and anything in between keeps the current interval.
+    """
+
+    def __init__(self, policy: PollPolicy, interval_seconds: Optional[float] = None):
+        self.policy = policy
+        if interval_seconds is None:
+            interval_seconds = policy.initial_interval_seconds
+        self.interval = self._clamp(interval_seconds)
+
+    def next_interval(self, new_items: int, rate_limited: bool, random_value: float) -> timedelta:
+        """
+        Args:
+            new_items: Number of previously unseen items the poll returned
+            rate_limited: Whether the poll failed or hit a rate limit
+            random_value: Uniform value in [0, 1), e.g. workflow.random().random()
+
+        Returns:
+            timedelta: How long to wait before polling again
+        """
+        if rate_limited or new_items == 0:
+            self.interval = self._clamp(self.interval * self.policy.backoff_factor)
+        elif new_items >= self.policy.busy_threshold:
+            self.interval = self._clamp(self.interval * self.policy.speedup_factor)
+
+        jitter = self.policy.jitter_ratio * (2 * random_value - 1)
+        return timedelta(seconds=self._clamp(self.interval * (1 + jitter)))
+
+    def _clamp(self, seconds: float) -> float:
+        return min(self.policy.max_interval_seconds, max(self.policy.min_interval_seconds, seconds))
+
+
+class RecentIds:
+    """Bounded set of recently seen content ids, oldest evicted first."""
+
+    def __init__(self, ids: Iterable[str] = (), max_size: int = 2000):
+        self._order: Deque[str] = deque()
+        self._ids: Set[str] = set()
+        self._max_size = max_size
+        self.add_new(ids)
+
+    def add_new(self, ids: Iterable[str]) -> int:
+        """Record ids and return how many of them had not been seen before."""
+        new = 0
+        for content_id in ids:
+            if content_id in self._ids:
+                continue
+            new += 1
+            self._ids.add(content_id)
+            self._order.append(content_id)
+            if len(self._order) > self._max_size:
+                self._ids.discard(self._order.popleft())
+        return new
+
+    def to_list(self) -> List[str]:
+        """The remembered ids, oldest first."""
+        return list(self._order)
+
+
+@dataclass
+class PollerState:
+    """Polling state of a scraper workflow, carried across continue-as-new."""
+
+    interval_seconds: Optional[float] = None
+    # Recently seen content ids, oldest first
+    seen_ids: List[str] = field(default_factory=list)
+    # Newest content id seen per query shard (Twitter)
+    cursors: Dict[str, str] = field(default_factory=dict)
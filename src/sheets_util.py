@@ -1,16 +1,48 @@
-import gspread
 import os
 import json
 import logging
+import re
 import traceback
 from datetime import datetime
-from oauth2client.service_account import ServiceAccountCredentials
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
+
+from pydantic import BaseModel
 
 logger = logging.getLogger(__name__)
 
+# Column holding the row key ("platform:content_id", or "SUMMARY:platform:partition"
+# for summary rows) used to update rows in place instead of appending duplicates.
+KEY_COLUMN = 6
+KEY_COLUMN_LETTER = "F"
+SCORE_COLUMN = 4
+
+# Summary of a post whose analysis failed; its score cell is left blank
+FAILED_ANALYSIS_SUMMARY = "Analysis failed"
+
+_UPDATED_RANGE_START = re.compile(r"![A-Z]+(\d+)")
+
+
 class SheetsClient:
-    def __init__(self):
+    def __init__(self, client=None, sheet_id: Optional[str] = None):
+        """
+        Args:
+            client: Already authorized gspread client (e.g. fakes.FakeGspreadClient);
+                when omitted, one is created from GOOGLE_CREDENTIALS_JSON
+            sheet_id: Spreadsheet key, defaults to GOOGLE_SHEET_ID
+        """
+        self._sheet = None
+        # Sheet row number per row key, loaded on the first upsert
+        self._row_index: Optional[Dict[str, int]] = None
+        
+        if client is not None:
+            self.client = client
+            self.sheet_id = sheet_id or os.getenv("GOOGLE_SHEET_ID")
+            return
+        
+        # Imported here so building rows doesn't load the Google client libraries
+        import gspread
+        from oauth2client.service_account import ServiceAccountCredentials
+        
         # Load credentials from environment variable
         creds_json = os.getenv("GOOGLE_CREDENTIALS_JSON")
         if not creds_json:
@@ -19,7 +51,7 @@ class SheetsClient:
         try:
             # Parse credentials from environment variable
             creds_info = json.loads(creds_json)
-            self.sheet_id = os.getenv("GOOGLE_SHEET_ID")
+            self.sheet_id = sheet_id or os.getenv("GOOGLE_SHEET_ID")
             if not self.sheet_id:
                 raise ValueError("GOOGLE_SHEET_ID environment variable not set")
             
@@ -39,35 +71,114 @@ class SheetsClient:
             logger.error(f"Traceback: {traceback.format_exc()}")
             raise
     
-    def append_sentiment_results(self, results: Dict[str, Any]) -> bool:
+    @property
+    def sheet(self):
+        """The first worksheet of the configured spreadsheet, opened once."""
+        if self._sheet is None:
+            logger.info(f"Attempting to open sheet with ID: {self.sheet_id}")
+            self._sheet = self.client.open_by_key(self.sheet_id).sheet1
+            logger.info(f"Successfully opened Google Sheet")
+        return self._sheet
+    
+    def append_rows(self, rows: List[List[Any]]) -> None:
+        """
+        Append rows to the sheet in a single API call.
+        
+        Args:
+            rows: Rows as built by build_sentiment_rows
+        """
+        if rows:
+            self.sheet.append_rows(rows)
+            logger.info(f"Appended {len(rows)} rows to Google Sheet")
+    
+    def reload_index(self) -> None:
+        """Rebuild the row key index from the sheet, e.g. after manual edits."""
+        keys = self.sheet.col_values(KEY_COLUMN)
+        self._row_index = {key: row for row, key in enumerate(keys, start=1) if key}
+        logger.info(f"Loaded {len(self._row_index)} row keys from Google Sheet")
+    
+    def upsert_rows(self, rows: List[List[Any]]) -> None:
+        """
+        Update rows whose key is already in the sheet and append the rest.
+        
+        Existing rows are rewritten with one batch update and new rows added
+        with one bulk append. Within a batch the last row for a key wins.
+        Rows of failed analyses (see is_failed_row) never replace another row,
+        so a failed re-analysis keeps the earlier result of the post.
+        
+        Args:
+            rows: Rows as built by build_sentiment_rows
+        """
+        if not rows:
+            return
+        if self._row_index is None:
+            self.reload_index()
+        
+        latest: Dict[str, List[Any]] = {}
+        unkeyed: List[List[Any]] = []
+        for row in rows:
+            key = row[KEY_COLUMN - 1] if len(row) >= KEY_COLUMN else None
+            if key:
+                if not (is_failed_row(row) and key in latest):
+                    latest[key] = row
+            else:
+                unkeyed.append(row)
+        
+        updates = []
+        new_rows = []
+        for key, row in latest.items():
+            row_number = self._row_index.get(key)
+            if row_number is None:
+                new_rows.append(row)
+            elif not is_failed_row(row):
+                updates.append({
+                    "range": f"A{row_number}:{KEY_COLUMN_LETTER}{row_number}",
+                    "values": [row],
+                })
+        
+        if updates:
+            self.sheet.batch_update(updates)
+            logger.info(f"Updated {len(updates)} rows in Google Sheet")
+        
+        new_rows.extend(unkeyed)
+        if new_rows:
+            response = self.sheet.append_rows(new_rows)
+            self._index_appended_rows(new_rows, response)
+            logger.info(f"Appended {len(new_rows)} rows to Google Sheet")
+    
+    def _index_appended_rows(self, rows: List[List[Any]], response: Any) -> None:
+        """Record the row numbers the sheet assigned to appended rows."""
+        updated_range = ((response or {}).get("updates") or {}).get("updatedRange", "")
+        match = _UPDATED_RANGE_START.search(updated_range)
+        if not match:
+            # Can't tell where the rows landed; fall back to re-reading the keys
+            self.reload_index()
+            return
+        first_row = int(match.group(1))
+        for offset, row in enumerate(rows):
+            if len(row) >= KEY_COLUMN and row[KEY_COLUMN - 1]:
+                self._row_index[row[KEY_COLUMN - 1]] = first_row + offset
+    
+    def append_sentiment_results(self, results: Any) -> bool:
         """
         Append sentiment analysis results to the Google Sheet.
         
         Args:
-            results: Dictionary containing sentiment analysis results
+            results: Results returned by analyze_sentiment, or a dict of them
             
         Returns:
             bool: True if successful, False otherwise
         """
         try:
-            # Open the sheet
-            logger.info(f"Attempting to open sheet with ID: {self.sheet_id}")
-            sheet = self.client.open_by_key(self.sheet_id).sheet1
-            logger.info(f"Successfully opened Google Sheet")
-            
             # Get the timestamp
             timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             
             # Log the structure of the results for debugging
+            if isinstance(results, BaseModel):
+                results = results.model_dump(exclude_none=True)
             logger.info(f"Results structure: {json.dumps(results, default=str)[:200]}...")
             
-            # Handle the case where results is a list (from the new structure)
-            if isinstance(results, list):
-                for result_item in results:
-                    self._process_result_item(result_item, sheet, timestamp)
-            else:
-                # Handle the original case where results is a dictionary
-                self._process_result_item(results, sheet, timestamp)
+            self.append_rows(build_sentiment_rows(results, timestamp))
             
             logger.info(f"Successfully appended rows to Google Sheet")
             return True
@@ -76,51 +187,96 @@ class SheetsClient:
             logger.error(f"Traceback: {traceback.format_exc()}")
             return False
 
-    def _process_result_item(self, result_item: Dict[str, Any], sheet, timestamp: str) -> None:
-        """
-        Process a single result item and append its data to the sheet.
+
+def is_failed_row(row: List[Any]) -> bool:
+    """Whether a post row is for an analysis that failed, i.e. has no score."""
+    return (
+        len(row) >= KEY_COLUMN
+        and row[KEY_COLUMN - 1] != ""
+        and not str(row[KEY_COLUMN - 1]).startswith("SUMMARY:")
+        and row[SCORE_COLUMN - 1] in (None, "")
+    )
+
+
+def build_sentiment_rows(results: Any, timestamp: str) -> List[List[Any]]:
+    """
+    Build the sheet rows for sentiment analysis results.
+    
+    Args:
+        results: Results returned by analyze_sentiment (SentimentResults or a
+            dict in the older layout), or a list of them
+        timestamp: Timestamp string
         
-        Args:
-            result_item: Dictionary containing sentiment analysis results
-            sheet: Google Sheet to append to
-            timestamp: Timestamp string
-        """
-        # For each post in the results
-        for post in result_item.get("analyzed_posts", []):
-            logger.info(f"Processing post: {post.get('id', 'unknown')}")
-            
-            # Prepare row data
-            source = post.get("platform", "unknown")
-            content = post.get("title", post.get("text", "No content"))
-            
-            # Extract sentiment score and summary from platform_specific_data
-            platform_specific_data = post.get("platform_specific_data", {})
-            sentiment_analysis = platform_specific_data.get("sentiment_analysis", {})
-            
-            # Get sentiment score
-            sentiment_score = sentiment_analysis.get("sentiment_score", 0)
-            logger.info(f"Extracted sentiment score: {sentiment_score} from post {post.get('id', 'unknown')}")
-            
-            # Get summary
-            summary = platform_specific_data.get("summary", "No summary available")
-            
-            # Prepare the row to append
-            row = [timestamp, source, 
-                   (content[:100] + "...") if content else "No content", 
-                   sentiment_score, summary]
-            logger.info(f"Appending row: {row}")
-            sheet.append_row(row)
-            logger.info(f"Successfully appended row for post {post.get('id', 'unknown')}")
-        
-        # Also add the overall sentiment
-        row = [
-            timestamp,
-            "SUMMARY",
-            f"Distribution: pos={result_item.get('distribution', {}).get('positive', 0)}, " +
-            f"neu={result_item.get('distribution', {}).get('neutral', 0)}, " +
-            f"neg={result_item.get('distribution', {}).get('negative', 0)}",
-            result_item.get("average_sentiment", 0),
-            "Average sentiment score"
-        ]
-        logger.info(f"Appending summary row: {row}")
-        sheet.append_row(row) 
\ No newline at end of file
+    Returns:
+        List[List[Any]]: One row per analyzed post plus a summary row per result
+    """
+    # Handle the case where results is a list (from the new structure)
+    result_items = results if isinstance(results, list) else [results]
+    result_items = [
+        item.model_dump(exclude_none=True) if isinstance(item, BaseModel) else item
+        for item in result_items
+    ]
+    
+    rows = []
+    for result_item in result_items:
+        rows.extend(_result_item_rows(result_item, timestamp))
+    return rows
+
+
+def _result_item_rows(result_item: Dict[str, Any], timestamp: str) -> List[List[Any]]:
+    """
+    Build the rows for a single result item.
+    
+    Args:
+        result_item: Dictionary containing sentiment analysis results
+        timestamp: Timestamp string
+    """
+    rows = []
+    
+    # For each post in the results
+    for post in result_item.get("analyzed_posts", []):
+        # Prepare row data
+        source = post.get("platform", "unknown")
+        content = post.get("title") or post.get("text") or "No content"
+        
+        # Extract sentiment score and summary, falling back to the older
+        # layout where they are nested in platform_specific_data
+        platform_specific_data = post.get("platform_specific_data") or {}
+        sentiment_analysis = platform_specific_data.get("sentiment_analysis", {})
+        
+        # Get sentiment score
+        sentiment_score = post.get("sentiment_score")
+        if sentiment_score is None:
+            sentiment_score = sentiment_analysis.get("sentiment_score")
+        
+        # Get summary; a failed analysis has neither, and its blank score
+        # keeps upsert_rows from overwriting an earlier result
+        if sentiment_score is None:
+            sentiment_score = ""
+            summary = FAILED_ANALYSIS_SUMMARY
+        else:
+            summary = post.get("summary") or platform_specific_data.get("summary", "No summary available")
+        
+        # Prepare the row to append, keyed by platform and content id
+        key = f"{source}:{post['id']}" if post.get("id") else ""
+        rows.append([timestamp, source, 
+                     (content[:100] + "...") if content else "No content", 
+                     sentiment_score, summary, key])
+    
+    # Also add the overall sentiment, one row per platform and analyzer
+    # partition so partitions don't overwrite each other's summary
+    platform = result_item.get("platform", "unknown")
+    original_metadata = (result_item.get("metadata") or {}).get("original_metadata") or {}
+    partition = original_metadata.get("analyzer_partition")
+    summary_key = f"SUMMARY:{platform}" if partition is None else f"SUMMARY:{platform}:{partition}"
+    rows.append([
+        timestamp,
+        "SUMMARY",
+        f"Distribution: pos={result_item.get('distribution', {}).get('positive', 0)}, " +
+        f"neu={result_item.get('distribution', {}).get('neutral', 0)}, " +
+        f"neg={result_item.get('distribution', {}).get('negative', 0)}",
+        result_item.get("average_sentiment", 0),
+        "Average sentiment score",
+        summary_key
+    ])
+    return rows
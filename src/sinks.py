@@ -0,0 +1,263 @@
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple, Union
+
+from data import SentimentResults
+
+logger = logging.getLogger(__name__)
+
+# Comma separated list of sinks, in the order they are written to. The first
+# sink is the primary store; the rest are downstream mirrors.
+DEFAULT_SINKS = "sqlite,aggregates,sheets"
+
+
+class ResultSink(ABC):
+    """Destination for sentiment analysis results produced by analyze_sentiment."""
+
+    name = "base"
+
+    # AnalyzedContent fields this sink reads from each analyzed post
+    fields: Tuple[str, ...] = ("id", "platform")
+
+    @abstractmethod
+    def write(self, sentiment_results: SentimentResults) -> bool:
+        """
+        Persist one batch of sentiment analysis results.
+
+        Args:
+            sentiment_results: Results returned by analyze_sentiment
+
+        Returns:
+            bool: True if successful, False otherwise
+        """
+
+    def close(self) -> None:
+        pass
+
+
+class SQLiteSink(ResultSink):
+    """Durable local store with indexed queries, see results_store.ResultStore."""
+
+    name = "sqlite"
+    fields = (
+        "id", "platform", "source", "title", "text", "summary",
+        "sentiment_score", "created_at", "sentiment_analysis",
+    )
+
+    def __init__(self, path: Optional[str] = None):
+        from results_store import ResultStore
+
+        self.store = ResultStore(path)
+
+    def write(self, sentiment_results: SentimentResults) -> bool:
+        written = self.store.upsert(extract_records(sentiment_results))
+        logger.info(f"Upserted {written} posts into the results store")
+        return True
+
+    def close(self) -> None:
+        self.store.close()
+
+
+class SheetsSink(ResultSink):
+    """
+    Mirror of the results in Google Sheets, written behind through a local spool.
+
+    write() only appends rows to the spool; the flusher from
+    create_sheets_flusher drains it to Sheets in large batches, so a slow or
+    quota-limited Sheets API never holds up analysis.
+    """
+
+    name = "sheets"
+    fields = ("id", "platform", "title", "text", "sentiment_score", "summary")
+
+    def __init__(self):
+        from spool import get_spool
+
+        self.spool = get_spool()
+
+    def write(self, sentiment_results: SentimentResults) -> bool:
+        from sheets_util import build_sentiment_rows
+
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        rows = build_sentiment_rows(sentiment_results, timestamp)
+        self.spool.append(rows)
+        logger.info(f"Spooled {len(rows)} rows for Google Sheets")
+        return True
+
+
+def create_sheets_flusher():
+    """Create the background flusher draining the sheets spool to Google Sheets."""
+    from concurrency import get_limiter
+    from spool import DEFAULT_MAX_REJECTIONS, SpoolFlusher, get_spool
+
+    # "upsert" keeps one row per post and platform summary; "append" adds a
+    # new row for every analysis, as the sheet originally did.
+    upsert = os.getenv("SHEETS_WRITE_MODE", "upsert") == "upsert"
+    client = None
+
+    def write_batch(rows: List[List[Any]]) -> None:
+        nonlocal client
+        if client is None:
+            # Created on first use so missing credentials are retried by the flusher
+            from sheets_util import SheetsClient
+
+            client = SheetsClient()
+        if upsert:
+            client.upsert_rows(rows)
+        else:
+            client.append_rows(rows)
+
+    return SpoolFlusher(
+        get_spool(),
+        write_batch,
+        batch_size=int(os.getenv("SHEETS_FLUSH_BATCH_SIZE", 500)),
+        limiter=get_limiter("sheets"),
+        max_rejections=int(os.getenv("SHEETS_FLUSH_MAX_REJECTIONS", DEFAULT_MAX_REJECTIONS)),
+    )
+
+
+class AggregateSink(ResultSink):
+    """Feeds rolling sentiment aggregates, see aggregates.SentimentAggregator."""
+
+    name = "aggregates"
+    fields = ("platform", "source", "sentiment_score")
+
+    # Snapshots are written at most this often; the engine itself is updated
+    # on every batch.
+    SNAPSHOT_INTERVAL_SECONDS = 60
+
+    def __init__(self, snapshot_path: Optional[str] = None):
+        from aggregates import DEFAULT_SNAPSHOT_PATH, SentimentAggregator
+
+        self.snapshot_path = snapshot_path or os.getenv(
+            "AGGREGATES_SNAPSHOT_PATH", DEFAULT_SNAPSHOT_PATH
+        )
+        self.aggregator = SentimentAggregator.load(self.snapshot_path)
+        self._last_snapshot = time.monotonic()
+
+    def write(self, sentiment_results: SentimentResults) -> bool:
+        added = self.aggregator.update_records(extract_records(sentiment_results))
+        logger.info(f"Added {added} scores to rolling sentiment aggregates")
+        if time.monotonic() - self._last_snapshot >= self.SNAPSHOT_INTERVAL_SECONDS:
+            self.aggregator.save(self.snapshot_path)
+            self._last_snapshot = time.monotonic()
+        return True
+
+    def close(self) -> None:
+        self.aggregator.save(self.snapshot_path)
+
+
+SINK_TYPES = {
+    SQLiteSink.name: SQLiteSink,
+    AggregateSink.name: AggregateSink,
+    SheetsSink.name: SheetsSink,
+}
+
+_sinks: Optional[List[ResultSink]] = None
+
+
+def configured_sink_names() -> List[str]:
+    """Names of the sinks selected with RESULT_SINKS."""
+    names = os.getenv("RESULT_SINKS", DEFAULT_SINKS)
+    return [name.strip() for name in names.split(",") if name.strip()]
+
+
+def primary_sink_name() -> Optional[str]:
+    """Name of the primary store, the first sink selected with RESULT_SINKS."""
+    names = configured_sink_names()
+    return names[0] if names else None
+
+
+def get_sinks() -> List[ResultSink]:
+    """
+    Return the configured sinks, creating them once per worker process.
+
+    Sinks are selected with the RESULT_SINKS environment variable. A sink that
+    fails to initialize (e.g. missing Google credentials) is skipped with an
+    error so the remaining sinks keep working.
+    """
+    global _sinks
+    if _sinks is None:
+        sinks = []
+        for name in configured_sink_names():
+            sink_type = SINK_TYPES.get(name)
+            if sink_type is None:
+                logger.error(f"Unknown result sink '{name}', skipping")
+                continue
+            try:
+                sinks.append(sink_type())
+                logger.info(f"Initialized result sink '{name}'")
+            except Exception as e:
+                logger.error(f"Error initializing result sink '{name}': {e}")
+        _sinks = sinks
+    return _sinks
+
+
+def close_sinks() -> None:
+    """Close the sinks created by get_sinks, e.g. to write a final snapshot on shutdown."""
+    global _sinks
+    for sink in _sinks or []:
+        try:
+            sink.close()
+        except Exception as e:
+            logger.error(f"Error closing result sink '{sink.name}': {e}")
+    _sinks = None
+
+
+def required_fields() -> Set[str]:
+    """Union of the AnalyzedContent fields read by the configured sinks."""
+    fields = set(ResultSink.fields)
+    for name in configured_sink_names():
+        sink_type = SINK_TYPES.get(name)
+        if sink_type is not None:
+            fields.update(sink_type.fields)
+    return fields
+
+
+def extract_records(sentiment_results: Union[SentimentResults, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Flatten analyzed posts into records keyed by platform and content id.
+
+    Args:
+        sentiment_results: Results returned by analyze_sentiment, or a dict
+            in the older layout
+
+    Returns:
+        List[Dict[str, Any]]: One flat record per analyzed post
+    """
+    if isinstance(sentiment_results, SentimentResults):
+        # Fields outside the sink projection are None; drop them so the
+        # fallbacks below apply as for the dict layout
+        sentiment_results = sentiment_results.model_dump(exclude_none=True)
+    platform = sentiment_results.get("platform", "unknown")
+    metadata = sentiment_results.get("metadata") or {}
+    original_metadata = metadata.get("original_metadata") or {}
+    source = original_metadata.get("subreddit") or original_metadata.get("query")
+    analyzed_at = metadata.get("analysis_timestamp") or datetime.now().timestamp()
+
+    records = []
+    for post in sentiment_results.get("analyzed_posts", []):
+        # Older results nest the analysis in the full content's platform_specific_data
+        platform_specific_data = post.get("platform_specific_data") or {}
+        sentiment_analysis = (
+            post.get("sentiment_analysis")
+            or platform_specific_data.get("sentiment_analysis")
+            or {}
+        )
+        sentiment_score = post.get("sentiment_score", sentiment_analysis.get("sentiment_score"))
+        records.append({
+            "platform": post.get("platform", platform),
+            "content_id": str(post.get("id", "")),
+            "source": post.get("source") or platform_specific_data.get("query") or source,
+            "title": post.get("title"),
+            "text": post.get("text"),
+            "summary": post.get("summary", platform_specific_data.get("summary")),
+            "sentiment_score": sentiment_score,
+            "created_at": post.get("created_at"),
+            "analyzed_at": analyzed_at,
+            "analysis": sentiment_analysis or None,
+        })
+    return records
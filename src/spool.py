@@ -0,0 +1,245 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, List, Optional, Tuple
+
+from concurrency import AdaptiveLimiter, is_rejected_request
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SPOOL_PATH = "data/sheets_spool.db"
+
+# Upper bound on rows waiting for Google Sheets. Once reached, new rows are
+# rejected with SpoolFullError rather than letting the spool grow without limit.
+DEFAULT_MAX_ROWS = 200_000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS spool (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    enqueued_at REAL NOT NULL,
+    row TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS dead_letter (
+    seq INTEGER PRIMARY KEY,
+    enqueued_at REAL NOT NULL,
+    failed_at REAL NOT NULL,
+    error TEXT NOT NULL,
+    row TEXT NOT NULL
+);
+"""
+
+# Times Sheets may reject the same batch (e.g. a 400 for the sheet's cell
+# limit) before its rows are moved to the dead-letter table
+DEFAULT_MAX_REJECTIONS = 5
+
+
+class SpoolFullError(Exception):
+    """Raised when the spool already holds its maximum number of rows."""
+
+
+class RowSpool:
+    """
+    Durable append-only queue of sheet rows, drained in insertion order.
+
+    Rows are removed only after they have been acknowledged, so a crash between
+    writing to Sheets and acknowledging can replay a batch but never loses one.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_rows: Optional[int] = None):
+        self.path = path or os.getenv("SHEETS_SPOOL_PATH", DEFAULT_SPOOL_PATH)
+        self.max_rows = max_rows or int(os.getenv("SHEETS_SPOOL_MAX_ROWS", DEFAULT_MAX_ROWS))
+        if self.path != ":memory:":
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        # auto_vacuum only takes effect on a fresh database, before any table
+        # exists; it lets acknowledged pages be returned to the filesystem.
+        self._conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def append(self, rows: List[List[Any]]) -> None:
+        """Append rows atomically, raising SpoolFullError if they don't fit."""
+        if not rows:
+            return
+        now = datetime.now().timestamp()
+        with self._lock:
+            pending = self._pending()
+            if pending + len(rows) > self.max_rows:
+                raise SpoolFullError(
+                    f"Sheets spool is full ({pending} pending rows, limit {self.max_rows})"
+                )
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT INTO spool (enqueued_at, row) VALUES (?, ?)",
+                    [(now, json.dumps(row, default=str)) for row in rows],
+                )
+
+    def peek(self, limit: int) -> List[Tuple[int, List[Any]]]:
+        """Return up to limit of the oldest rows with their sequence numbers."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "SELECT seq, row FROM spool ORDER BY seq LIMIT ?", (limit,)
+            )
+            return [(seq, json.loads(row)) for seq, row in cursor.fetchall()]
+
+    def ack(self, last_seq: int) -> None:
+        """Drop every row up to and including last_seq."""
+        with self._lock:
+            with self._conn:
+                self._conn.execute("DELETE FROM spool WHERE seq <= ?", (last_seq,))
+            self._conn.execute("PRAGMA incremental_vacuum")
+
+    def dead_letter(self, last_seq: int, error: str) -> None:
+        """Move every row up to and including last_seq to the dead-letter table."""
+        now = datetime.now().timestamp()
+        with self._lock:
+            with self._conn:
+                self._conn.execute(
+                    """
+                    INSERT INTO dead_letter (seq, enqueued_at, failed_at, error, row)
+                    SELECT seq, enqueued_at, ?, ?, row FROM spool WHERE seq <= ?
+                    """,
+                    (now, error, last_seq),
+                )
+                self._conn.execute("DELETE FROM spool WHERE seq <= ?", (last_seq,))
+
+    def dead_letters(self) -> List[Tuple[int, str, List[Any]]]:
+        """Rows in the dead-letter table with their sequence numbers and errors."""
+        with self._lock:
+            cursor = self._conn.execute("SELECT seq, error, row FROM dead_letter ORDER BY seq")
+            return [(seq, error, json.loads(row)) for seq, error, row in cursor.fetchall()]
+
+    def requeue_dead_letters(self) -> int:
+        """Move dead-lettered rows back to the end of the spool, e.g. after fixing the sheet."""
+        with self._lock:
+            with self._conn:
+                moved = self._conn.execute(
+                    """
+                    INSERT INTO spool (enqueued_at, row)
+                    SELECT enqueued_at, row FROM dead_letter ORDER BY seq
+                    """
+                ).rowcount
+                self._conn.execute("DELETE FROM dead_letter")
+            return moved
+
+    def pending(self) -> int:
+        with self._lock:
+            return self._pending()
+
+    def _pending(self) -> int:
+        # Rows are only ever removed from the front, so the seq range is exact
+        # and avoids a full COUNT(*) scan.
+        low, high = self._conn.execute("SELECT MIN(seq), MAX(seq) FROM spool").fetchone()
+        return 0 if low is None else high - low + 1
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_spool: Optional[RowSpool] = None
+_spool_lock = threading.Lock()
+
+
+def get_spool() -> RowSpool:
+    """Return the process-wide spool shared by the sheets sink and the flusher."""
+    global _spool
+    with _spool_lock:
+        if _spool is None:
+            _spool = RowSpool()
+        return _spool
+
+
+class SpoolFlusher:
+    """
+    Background task draining a spool to a batch writer in large ordered batches.
+
+    Failed batches are retried with exponential backoff; nothing behind a failed
+    batch is written until it succeeds, which preserves row order. A batch the
+    service keeps rejecting (see concurrency.is_rejected_request) is moved to
+    the dead-letter table after max_rejections attempts, so it can't block
+    the rows behind it.
+    """
+
+    def __init__(
+        self,
+        spool: RowSpool,
+        write_batch: Callable[[List[List[Any]]], None],
+        batch_size: int = 500,
+        idle_interval: float = 5.0,
+        max_backoff: float = 300.0,
+        limiter: Optional[AdaptiveLimiter] = None,
+        max_rejections: int = DEFAULT_MAX_REJECTIONS,
+    ):
+        self.spool = spool
+        self.write_batch = write_batch
+        self.batch_size = batch_size
+        self.idle_interval = idle_interval
+        self.max_backoff = max_backoff
+        # Tracks write latency and errors, shared with other Sheets writers
+        self.limiter = limiter
+        self.max_rejections = max_rejections
+        # Rejections of the batch starting at _rejected_seq
+        self._rejected_seq: Optional[int] = None
+        self._rejections = 0
+
+    async def flush_once(self) -> int:
+        """
+        Write and acknowledge one batch.
+
+        Returns:
+            int: Number of rows taken off the spool, written or dead-lettered
+        """
+        loop = asyncio.get_event_loop()
+        batch = await loop.run_in_executor(None, self.spool.peek, self.batch_size)
+        if not batch:
+            return 0
+        rows = [row for _, row in batch]
+        try:
+            if self.limiter:
+                async with self.limiter.slot():
+                    await loop.run_in_executor(None, self.write_batch, rows)
+            else:
+                await loop.run_in_executor(None, self.write_batch, rows)
+        except Exception as e:
+            if not is_rejected_request(e):
+                raise
+            if self._rejected_seq != batch[0][0]:
+                self._rejected_seq, self._rejections = batch[0][0], 0
+            self._rejections += 1
+            if self._rejections < self.max_rejections:
+                raise
+            logger.error(
+                f"Moving {len(rows)} spooled rows to the dead-letter table after "
+                f"{self._rejections} rejections: {e}"
+            )
+            await loop.run_in_executor(None, self.spool.dead_letter, batch[-1][0], str(e))
+            self._rejected_seq, self._rejections = None, 0
+            return len(rows)
+        await loop.run_in_executor(None, self.spool.ack, batch[-1][0])
+        return len(rows)
+
+    async def run(self) -> None:
+        backoff = self.idle_interval
+        while True:
+            try:
+                flushed = await self.flush_once()
+                backoff = self.idle_interval
+                if flushed:
+                    logger.info(
+                        f"Flushed {flushed} spooled rows, {self.spool.pending()} still pending"
+                    )
+                    # Keep draining without waiting while there is a backlog
+                    continue
+            except Exception as e:
+                backoff = min(self.max_backoff, backoff * 2)
+                logger.error(f"Error flushing spooled rows, retrying in {backoff:.0f}s: {e}")
+            await asyncio.sleep(backoff)
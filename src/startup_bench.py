@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Modules the worker imports at startup, measured one at a time in a fresh
+# interpreter so earlier imports don't hide the cost of later ones.
+MODULES = [
+    "codec",
+    "workflows",
+    "activities",
+    "reddit",
+    "twitter",
+    "sheets_util",
+    "worker",
+]
+
+# Heavy client libraries that should only load when their activities run
+HEAVY_MODULES = ["openai", "tweepy", "asyncpraw", "gspread", "oauth2client", "numpy"]
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{
+    "seconds": elapsed,
+    "loaded": [name for name in {heavy!r} if name in sys.modules],
+}}))
+"""
+
+
+def measure(module: str, repeat: int) -> dict:
+    """Import a module in fresh interpreters and return the median import time."""
+    src_dir = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, PYTHONPATH=src_dir)
+    timings = []
+    loaded = []
+    for _ in range(repeat):
+        result = subprocess.run(
+            [sys.executable, "-c", _PROBE.format(module=module, heavy=HEAVY_MODULES)],
+            capture_output=True, text=True, env=env, cwd=src_dir,
+        )
+        if result.returncode != 0:
+            return {"module": module, "error": result.stderr.strip().splitlines()[-1]}
+        sample = json.loads(result.stdout.strip().splitlines()[-1])
+        timings.append(sample["seconds"])
+        loaded = sample["loaded"]
+    return {
+        "module": module,
+        "median_ms": round(statistics.median(timings) * 1000, 1),
+        "heavy_modules_loaded": loaded,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure worker import (startup) time")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("modules", nargs="*", default=MODULES)
+    args = parser.parse_args()
+
+    for module in args.modules:
+        result = measure(module, args.repeat)
+        if "error" in result:
+            print(f"{module:<14} error: {result['error']}")
+        else:
+            heavy = ", ".join(result["heavy_modules_loaded"]) or "-"
+            print(f"{module:<14} {result['median_ms']:>8.1f} ms   heavy: {heavy}")
@@ -0,0 +1,21 @@
+from temporalio import workflow
+
+# Every activity group has its own task queue, so a worker running only some
+# groups (see WORKER_ACTIVITY_GROUPS) never receives activities it hasn't
+# registered. Used from inside workflows: the queue names only depend on the
+# workflow's own task queue.
+
+REDDIT = "reddit"
+TWITTER = "twitter"
+ANALYSIS = "analysis"
+BACKFILL = "backfill"
+
+
+def group_task_queue(task_queue: str, group: str) -> str:
+    """Task queue of an activity group, next to the given workflow task queue."""
+    return f"{task_queue}-{group}"
+
+
+def activity_task_queue(group: str) -> str:
+    """Task queue of an activity group, for the calling workflow."""
+    return group_task_queue(workflow.info().task_queue, group)
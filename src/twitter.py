@@ -1,112 +1,315 @@
 from temporalio import activity
 import os
-from typing import List
+from typing import Any, Dict, List, Optional, Tuple
 import logging
-import tweepy
 import asyncio
 import random
+from datetime import datetime, timezone
 from data import ScrapedData, Content, Author
 
 logger = logging.getLogger(__name__)
 
-@activity.defn
-async def scrape_twitter() -> ScrapedData:
-    """Activity that scrapes Twitter (X) for recent popular tweets."""
-    # Initialize Twitter client with tweepy
-    bearer_token = os.getenv("TWITTER_BEARER_TOKEN")
-    if not bearer_token:
-        logger.error("TWITTER_BEARER_TOKEN is not set in environment variables")
-        return ScrapedData(platform="twitter", items=[])
-    
-    # Create a client instance
-    client = tweepy.Client(bearer_token=bearer_token)
-    
-    # Since tweepy is synchronous, we'll run it in an executor
-    loop = asyncio.get_event_loop()
+# Topics tracked when TWITTER_TOPICS is not set. TWITTER_TOPICS takes a comma
+# separated list of terms, e.g. "tech,programming,AI,rust,python".
+DEFAULT_TOPICS = ["tech", "programming", "AI", "technology", "software"]
+
+# Recent search queries are limited to 512 characters; terms are grouped into
+# OR queries of at most this many terms so each shard stays well within it.
+MAX_TERMS_PER_QUERY = 5
+MAX_QUERY_LENGTH = 512
+
+# Fields requested with every search
+TWEET_FIELDS = ["created_at", "public_metrics", "author_id", "conversation_id"]
+EXPANSIONS = ["author_id", "referenced_tweets.id"]
+USER_FIELDS = ["username", "name"]
+
+# Pages of up to 100 tweets fetched per query and time range during backfills
+DEFAULT_BACKFILL_PAGES = 5
+
+# Shared client and connection pool for all searches made by this worker. tweepy
+# and aiohttp are imported on first use so other worker profiles skip them.
+_client: Optional[Any] = None
+
+
+def get_topics() -> List[str]:
+    """Return the configured topic terms."""
+    topics = os.getenv("TWITTER_TOPICS")
+    if not topics:
+        return list(DEFAULT_TOPICS)
+    return [topic.strip() for topic in topics.split(",") if topic.strip()]
+
+
+def build_queries(
+    topics: List[str],
+    max_terms: int = MAX_TERMS_PER_QUERY,
+    max_length: int = MAX_QUERY_LENGTH,
+) -> List[str]:
+    """
+    Split topic terms into OR queries that are searched concurrently.
+
+    The split is stable for a given topic list, so each query string can be
+    used as the key of its since_id cursor across polls.
+    """
+    queries = []
+    current: List[str] = []
+    for topic in topics:
+        term = f'"{topic}"' if " " in topic else topic
+        candidate = " OR ".join(current + [term])
+        if current and (len(current) >= max_terms or len(candidate) > max_length):
+            queries.append(" OR ".join(current))
+            current = []
+        current.append(term)
+    if current:
+        queries.append(" OR ".join(current))
+    return queries
+
+
+def tweet_contents(search_result: Any, query: str) -> List[Content]:
+    """Convert a search response into Content items tagged with their query."""
+    contents: List[Content] = []
+
+    if search_result.data:
+        # Create user lookup dict
+        users = {user.id: user for user in search_result.includes.get("users", [])}
+
+        for tweet in search_result.data:
+            # Get author info
+            user = users.get(tweet.author_id)
+            author = Author(
+                id=str(tweet.author_id),
+                name=user.username if user else str(tweet.author_id),
+                platform_specific_data={
+                    "display_name": user.name if user else None
+                }
+            )
+
+            # Create content
+            content = Content(
+                id=str(tweet.id),
+                text=tweet.text,
+                author=author,
+                created_at=tweet.created_at.timestamp(),
+                platform="twitter",
+                engagement_metrics={
+                    "retweet_count": tweet.public_metrics.get("retweet_count", 0),
+                    "like_count": tweet.public_metrics.get("like_count", 0),
+                    "reply_count": tweet.public_metrics.get("reply_count", 0),
+                    "quote_count": tweet.public_metrics.get("quote_count", 0)
+                },
+                platform_specific_data={
+                    "conversation_id": tweet.conversation_id,
+                    "referenced_tweets": [
+                        {"type": ref.type, "id": ref.id}
+                        for ref in tweet.referenced_tweets
+                    ] if tweet.referenced_tweets else None,
+                    "query": query
+                }
+            )
+
+            contents.append(content)
+
+    return contents
+
+
+def get_client(bearer_token: str) -> Any:
+    """Return the shared tweepy AsyncClient, reopening its session if needed."""
+    import aiohttp
+    from tweepy.asynchronous import AsyncClient
     
-    # Define search parameters - looking for technology-related tweets
-    query = "tech OR programming OR AI OR technology OR software"
+    global _client
+    if _client is None or _client.bearer_token != bearer_token:
+        _client = AsyncClient(bearer_token=bearer_token)
+    if _client.session is None or _client.session.closed:
+        _client.session = aiohttp.ClientSession()
+    return _client
+
+
+async def search_query(
+    client: Any, query: str, since_id: Optional[str]
+) -> Tuple[List[Content], Optional[str], bool]:
+    """
+    Search one query shard with retries.
+
+    Returns:
+        Tuple of the tweets found, the newest tweet id (the next cursor) and
+        whether the search gave up because of rate limiting
+    """
+    import tweepy
     
     # Implement retry logic with exponential backoff
     max_retries = 3
     base_delay = 2  # seconds
-    
+
     for retry in range(max_retries):
         try:
-            # Execute the search using an executor to avoid blocking
-            search_result = await loop.run_in_executor(
-                None, 
-                lambda: client.search_recent_tweets(
-                    query=query,
-                    max_results=10,
-                    tweet_fields=["created_at", "public_metrics", "author_id", "conversation_id"],
-                    expansions=["author_id", "referenced_tweets.id"],
-                    user_fields=["username", "name"]
-                )
+            search_result = await client.search_recent_tweets(
+                query=query,
+                max_results=10,
+                since_id=since_id,
+                tweet_fields=TWEET_FIELDS,
+                expansions=EXPANSIONS,
+                user_fields=USER_FIELDS
             )
-            
-            contents: List[Content] = []
-            
-            if search_result.data:
-                # Create user lookup dict
-                users = {user.id: user for user in search_result.includes.get("users", [])}
-                
-                for tweet in search_result.data:
-                    # Get author info
-                    user = users.get(tweet.author_id)
-                    author = Author(
-                        id=str(tweet.author_id),
-                        name=user.username if user else str(tweet.author_id),
-                        platform_specific_data={
-                            "display_name": user.name if user else None
-                        }
-                    )
-                    
-                    # Create content
-                    content = Content(
-                        id=str(tweet.id),
-                        text=tweet.text,
-                        author=author,
-                        created_at=tweet.created_at.timestamp(),
-                        platform="twitter",
-                        engagement_metrics={
-                            "retweet_count": tweet.public_metrics.get("retweet_count", 0),
-                            "like_count": tweet.public_metrics.get("like_count", 0),
-                            "reply_count": tweet.public_metrics.get("reply_count", 0),
-                            "quote_count": tweet.public_metrics.get("quote_count", 0)
-                        },
-                        platform_specific_data={
-                            "conversation_id": tweet.conversation_id,
-                            "referenced_tweets": [
-                                {"type": ref.type, "id": ref.id}
-                                for ref in tweet.referenced_tweets
-                            ] if tweet.referenced_tweets else None
-                        }
-                    )
-                    
-                    contents.append(content)
-            
-            scraped_data = ScrapedData(
-                platform="twitter",
-                items=contents,
-                metadata={
-                    "query": query,
-                    "search_type": "recent"
-                }
-            )
-            
-            logger.info(f"Scraped {len(contents)} tweets from Twitter")
-            return scraped_data
-        
+
+            contents = tweet_contents(search_result, query)
+            newest_id = search_result.meta.get("newest_id") if search_result.meta else None
+            return contents, newest_id or since_id, False
+
         except tweepy.TooManyRequests as e:
             if retry < max_retries - 1:
                 # Calculate exponential backoff with jitter
                 delay = (base_delay ** (retry + 1)) + (random.random() * 2)
-                logger.warning(f"Twitter rate limit exceeded. Retrying in {delay:.2f} seconds...")
+                logger.warning(f"Twitter rate limit exceeded for '{query}'. Retrying in {delay:.2f} seconds...")
                 await asyncio.sleep(delay)
             else:
-                logger.error(f"Twitter rate limiting error after {max_retries} retries: {e}")
-                return ScrapedData(platform="twitter", items=[])
+                logger.error(f"Twitter rate limiting error for '{query}' after {max_retries} retries: {e}")
+                return [], since_id, True
+        except tweepy.BadRequest as e:
+            if since_id is None:
+                logger.error(f"Twitter rejected query '{query}': {e}")
+                return [], None, False
+            # since_id falls outside the recent search window; start over
+            logger.warning(f"Dropping stale cursor for '{query}': {e}")
+            since_id = None
         except Exception as e:
-            logger.error(f"Error scraping Twitter: {e}")
-            return ScrapedData(platform="twitter", items=[]) 
\ No newline at end of file
+            logger.error(f"Error searching Twitter for '{query}': {e}")
+            return [], since_id, False
+
+    return [], since_id, False
+
+
+@activity.defn
+async def scrape_twitter(cursors: Optional[Dict[str, str]] = None) -> ScrapedData:
+    """
+    Activity that searches Twitter (X) for recent tweets on the tracked topics.
+
+    Each query shard is searched concurrently and only returns tweets newer
+    than its cursor. The updated cursors are returned in the metadata so the
+    calling workflow can pass them to the next poll.
+    """
+    bearer_token = os.getenv("TWITTER_BEARER_TOKEN")
+    if not bearer_token:
+        logger.error("TWITTER_BEARER_TOKEN is not set in environment variables")
+        return ScrapedData(platform="twitter", items=[])
+
+    client = get_client(bearer_token)
+    cursors = cursors or {}
+    queries = build_queries(get_topics())
+
+    results = await asyncio.gather(
+        *(search_query(client, query, cursors.get(query)) for query in queries)
+    )
+
+    # Merge the shards, dropping tweets matched by more than one query
+    contents: List[Content] = []
+    seen_ids = set()
+    new_cursors: Dict[str, str] = {}
+    rate_limited = False
+    for query, (query_contents, newest_id, query_rate_limited) in zip(queries, results):
+        for content in query_contents:
+            if content.id not in seen_ids:
+                seen_ids.add(content.id)
+                contents.append(content)
+        if newest_id:
+            new_cursors[query] = newest_id
+        rate_limited = rate_limited or query_rate_limited
+
+    scraped_data = ScrapedData(
+        platform="twitter",
+        items=contents,
+        metadata={
+            "query": " OR ".join(queries),
+            "queries": queries,
+            "search_type": "recent",
+            "cursors": new_cursors,
+            "rate_limited": rate_limited
+        }
+    )
+
+    logger.info(f"Scraped {len(contents)} tweets from Twitter across {len(queries)} queries")
+    return scraped_data
+
+
+async def search_twitter_range(
+    start: float, end: float, max_pages: int = DEFAULT_BACKFILL_PAGES
+) -> ScrapedData:
+    """
+    Search tweets on the tracked topics created in [start, end), as unix timestamps.
+    
+    Recent search only covers the last 7 days; set TWITTER_FULL_ARCHIVE to use
+    full-archive search if the app has access to it. A range the search
+    rejects, or with more than max_pages pages for a query, comes back with
+    "complete" set to False and the reason in "incomplete_reason" in the
+    metadata. Rate limits are raised so the calling activity is retried with
+    backoff. Must be called from an activity, which is heartbeated after
+    every page.
+    """
+    import tweepy
+    
+    bearer_token = os.getenv("TWITTER_BEARER_TOKEN")
+    if not bearer_token:
+        logger.error("TWITTER_BEARER_TOKEN is not set in environment variables")
+        return ScrapedData(platform="twitter", items=[], metadata={
+            "complete": False, "incomplete_reason": "TWITTER_BEARER_TOKEN is not set"
+        })
+    
+    client = get_client(bearer_token)
+    search = client.search_all_tweets if os.getenv("TWITTER_FULL_ARCHIVE") else client.search_recent_tweets
+    queries = build_queries(get_topics())
+    contents: List[Content] = []
+    seen_ids = set()
+    incomplete_reason = None
+    
+    for query in queries:
+        next_token = None
+        for _ in range(max_pages):
+            try:
+                search_result = await search(
+                    query=query,
+                    start_time=datetime.fromtimestamp(start, tz=timezone.utc),
+                    end_time=datetime.fromtimestamp(end, tz=timezone.utc),
+                    max_results=100,
+                    next_token=next_token,
+                    tweet_fields=TWEET_FIELDS,
+                    expansions=EXPANSIONS,
+                    user_fields=USER_FIELDS
+                )
+            except tweepy.BadRequest as e:
+                # Usually a range outside the search window
+                logger.error(f"Twitter rejected backfill search for '{query}': {e}")
+                incomplete_reason = f"Twitter rejected the search for '{query}': {e}"
+                break
+            
+            for content in tweet_contents(search_result, query):
+                if content.id not in seen_ids:
+                    seen_ids.add(content.id)
+                    contents.append(content)
+            activity.heartbeat()
+            
+            next_token = (search_result.meta or {}).get("next_token")
+            if not next_token:
+                break
+        else:
+            # Pages remain; the range has to be split into smaller chunks
+            logger.warning(f"Stopped backfill search for '{query}' after {max_pages} pages")
+            incomplete_reason = (
+                f"More than {max_pages} pages of tweets for '{query}', use smaller chunks"
+            )
+    
+    logger.info(
+        f"Scraped {len(contents)} tweets between {start:.0f} and {end:.0f} "
+        f"across {len(queries)} queries"
+    )
+    return ScrapedData(
+        platform="twitter",
+        items=contents,
+        metadata={
+            "query": " OR ".join(queries),
+            "queries": queries,
+            "search_type": "all" if os.getenv("TWITTER_FULL_ARCHIVE") else "recent",
+            "start": start,
+            "end": end,
+            "complete": incomplete_reason is None,
+            "incomplete_reason": incomplete_reason
+        }
+    )
@@ -1,12 +1,26 @@
 import asyncio
+import importlib
 import os
 import logging
-from temporalio.client import Client
+from typing import Any, Callable, List, Sequence
+from temporalio.client import Client, WorkflowExecutionStatus
+from temporalio.runtime import PrometheusConfig, Runtime, TelemetryConfig
+from temporalio.exceptions import WorkflowAlreadyStartedError
+from temporalio.service import RPCError, RPCStatusCode
 from temporalio.worker import Worker
-from workflows import RedditScraperWorkflow, SentimentAnalyzerWorkflow, TwitterScraperWorkflow
-from activities import analyze_sentiment, store_results_in_sheets
-from reddit import scrape_reddit
-from twitter import scrape_twitter
+from workflows import (
+    BackfillChunkWorkflow, BackfillWorkflow, RedditScraperWorkflow,
+    SentimentAnalyzerWorkflow, TwitterScraperWorkflow,
+)
+from codec import build_data_converter, build_workflow_runner
+from scheduling import policy_from_env
+from partitioning import analyzer_id, partitions_from_env
+from sinks import close_sinks, configured_sink_names, create_sheets_flusher
+from analysis_scheduler import budget_from_env
+from profiling import ProfilingServer, get_profiler_port
+from concurrency import set_metric_meter
+import task_queues
+from task_queues import group_task_queue
 
 # Configure logging
 logging.basicConfig(
@@ -15,56 +29,201 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Activities registered for each group, as (module, function name). Only the
+# modules of the groups in WORKER_ACTIVITY_GROUPS are imported, so e.g. an
+# analysis-only worker never loads the Reddit or Twitter clients. Each group
+# is polled on its own task queue, see task_queues.
+ACTIVITY_GROUPS = {
+    task_queues.REDDIT: [("reddit", "scrape_reddit")],
+    task_queues.TWITTER: [("twitter", "scrape_twitter")],
+    task_queues.ANALYSIS: [
+        ("activities", "analyze_sentiment"),
+        ("activities", "store_results_in_sheets"),
+    ],
+    task_queues.BACKFILL: [("backfill", "scrape_backfill_chunk")],
+}
+
+WORKFLOWS = [
+    RedditScraperWorkflow, SentimentAnalyzerWorkflow, TwitterScraperWorkflow,
+    BackfillWorkflow, BackfillChunkWorkflow,
+]
+
+DEFAULT_TASK_QUEUE = "reddit-tasks"
+
+
+def get_activity_groups() -> List[str]:
+    """Return the activity groups this worker runs (all of them by default)."""
+    groups = os.getenv("WORKER_ACTIVITY_GROUPS")
+    if not groups:
+        return list(ACTIVITY_GROUPS)
+    selected = [group.strip() for group in groups.split(",") if group.strip()]
+    unknown = [group for group in selected if group not in ACTIVITY_GROUPS]
+    if unknown:
+        raise ValueError(f"Unknown activity groups: {', '.join(unknown)}")
+    return selected
+
+
+def load_activities(groups: Sequence[str]) -> List[Callable]:
+    """Import the activity functions of the given groups."""
+    activities = []
+    for group in groups:
+        for module_name, function_name in ACTIVITY_GROUPS[group]:
+            activities.append(getattr(importlib.import_module(module_name), function_name))
+    return activities
+
+
+def build_workers(client: Client, task_queue: str, groups: Sequence[str]) -> List[Worker]:
+    """
+    Build the workflow worker on task_queue and one activity worker per group
+    on the group's own queue.
+    
+    A worker running every group also serves activities on task_queue itself,
+    where activities scheduled before the queues were split are waiting.
+    """
+    workers = [Worker(
+        client,
+        task_queue=task_queue,
+        workflows=WORKFLOWS,
+        activities=load_activities(groups) if set(groups) == set(ACTIVITY_GROUPS) else [],
+        workflow_runner=build_workflow_runner()
+    )]
+    for group in groups:
+        workers.append(Worker(
+            client,
+            task_queue=group_task_queue(task_queue, group),
+            activities=load_activities([group]),
+        ))
+    return workers
+
+
+async def ensure_workflow(client: Client, run: Callable, workflow_id: str, args: List[Any], task_queue: str) -> bool:
+    """
+    Start a workflow unless an execution with this id is already running.
+    
+    Returns:
+        True if the workflow was started, False if it was already running
+    """
+    try:
+        description = await client.get_workflow_handle(workflow_id).describe()
+        if description.status == WorkflowExecutionStatus.RUNNING:
+            logger.info(f"Workflow {workflow_id} already running")
+            return False
+    except RPCError as e:
+        if e.status != RPCStatusCode.NOT_FOUND:
+            raise
+    
+    try:
+        await client.start_workflow(run, args=args, id=workflow_id, task_queue=task_queue)
+    except WorkflowAlreadyStartedError:
+        # Another worker started it between the describe and the start
+        logger.info(f"Workflow {workflow_id} already running")
+        return False
+    logger.info(f"Started workflow {workflow_id}")
+    return True
+
 async def main():
     logger.info("Worker starting up...")
     try:
+        # Fail before connecting if the partition count is unusable
+        partitions = partitions_from_env()
+        
+        # Export worker and adaptive concurrency metrics when configured
+        runtime = None
+        prometheus_address = os.getenv("PROMETHEUS_BIND_ADDRESS")
+        if prometheus_address:
+            runtime = Runtime(
+                telemetry=TelemetryConfig(metrics=PrometheusConfig(bind_address=prometheus_address))
+            )
+            set_metric_meter(runtime.metric_meter)
+            logger.info(f"Serving Prometheus metrics on {prometheus_address}")
+        
         # Create client connected to server
-        client = await Client.connect(os.getenv("TEMPORAL_HOST", "temporal:7233"))
+        client = await Client.connect(
+            os.getenv("TEMPORAL_HOST", "temporal:7233"),
+            data_converter=build_data_converter(),
+            runtime=runtime
+        )
         logger.info("Connected to Temporal server")
 
-        # Run the worker
-        worker = Worker(
-            client,
-            task_queue="reddit-tasks",
-            workflows=[RedditScraperWorkflow, SentimentAnalyzerWorkflow, TwitterScraperWorkflow],
-            activities=[scrape_reddit, analyze_sentiment, scrape_twitter, store_results_in_sheets]
-        )
+        task_queue = os.getenv("TASK_QUEUE", DEFAULT_TASK_QUEUE)
+        groups = get_activity_groups()
+        logger.info(f"Running activity groups: {', '.join(groups)}")
         
-        # Start both workflows when the worker starts
+        workers = build_workers(client, task_queue, groups)
+        
+        # Start the workflows that aren't already running. Each start is
+        # independent so one failure doesn't keep the others from starting.
         async def start_workflows():
+            # Start the sentiment analyzer partitions first
+            bootstrap = [
+                (SentimentAnalyzerWorkflow.run, analyzer_id(partition),
+                 [partition, partitions, budget_from_env(partitions)])
+                for partition in range(partitions)
+            ]
+            bootstrap += [
+                (RedditScraperWorkflow.run, "reddit-scraper", [policy_from_env("reddit"), partitions]),
+                (TwitterScraperWorkflow.run, "twitter-scraper", [policy_from_env("twitter"), partitions]),
+            ]
+            for run, workflow_id, args in bootstrap:
+                try:
+                    await ensure_workflow(client, run, workflow_id, args, task_queue)
+                except Exception as e:
+                    logger.error(f"Error starting workflow {workflow_id}: {e}")
+        
+        async def rebalance_workflows():
+            """Apply the current partition count to workflows that were already running"""
+            for scraper_id in ("reddit-scraper", "twitter-scraper"):
+                try:
+                    await client.get_workflow_handle(scraper_id).signal("set_partitions", partitions)
+                except Exception as e:
+                    logger.error(f"Error updating partitions of {scraper_id}: {e}")
+            
+            # Analyzers from a previous partition count (and the old single
+            # "sentiment-analyzer") forward their queues and retire themselves;
+            # the others take their share of the (possibly changed) LLM budget
             try:
-                # Start the sentiment analyzer workflow first
-                await client.start_workflow(
-                    SentimentAnalyzerWorkflow.run,
-                    id="sentiment-analyzer",
-                    task_queue="reddit-tasks"
-                )
-                logger.info("Started sentiment analyzer workflow")
-                
-                # Then start the Reddit scraper workflow
-                await client.start_workflow(
-                    RedditScraperWorkflow.run,
-                    id="reddit-scraper",
-                    task_queue="reddit-tasks"
-                )
-                logger.info("Started Reddit scraper workflow")
-                
-                # Start the Twitter scraper workflow
-                await client.start_workflow(
-                    TwitterScraperWorkflow.run,
-                    id="twitter-scraper",
-                    task_queue="reddit-tasks"
-                )
-                logger.info("Started Twitter scraper workflow")
-                
+                budget = budget_from_env(partitions)
+                async for execution in client.list_workflows(
+                    'WorkflowType="SentimentAnalyzerWorkflow" AND ExecutionStatus="Running"'
+                ):
+                    await client.get_workflow_handle(execution.id).signal(
+                        "rebalance", args=[partitions, budget]
+                    )
+                logger.info(f"Rebalanced sentiment analyzers to {partitions} partitions")
             except Exception as e:
-                logger.error(f"Error starting workflows: {e}")
+                logger.error(f"Error rebalancing sentiment analyzers: {e}")
         
         logger.info("Starting worker...")
         # Start the workflows
         await start_workflows()
-        # Run the worker
-        await worker.run()
+        await rebalance_workflows()
+        
+        # Drain spooled rows to Google Sheets in the background
+        flusher_task = None
+        if "sheets" in configured_sink_names():
+            flusher_task = asyncio.create_task(create_sheets_flusher().run())
+        
+        # Local admin endpoint for profiling the running worker
+        profiler = None
+        profiler_port = get_profiler_port()
+        if profiler_port:
+            profiler = ProfilingServer(port=profiler_port)
+            try:
+                await profiler.start()
+            except OSError as e:
+                logger.error(f"Could not start profiling endpoint on port {profiler_port}: {e}")
+                profiler = None
+        
+        # Run the workers
+        try:
+            await asyncio.gather(*(worker.run() for worker in workers))
+        finally:
+            if flusher_task:
+                flusher_task.cancel()
+            if profiler:
+                await profiler.close()
+            # Writes the final aggregates snapshot and closes the results store
+            close_sinks()
         
     except Exception as e:
         logger.error(f"Error in main: {e}")
@@ -1,88 +1,393 @@
+import asyncio
 from datetime import timedelta
 from temporalio import workflow
 from temporalio.common import RetryPolicy
-from typing import Dict
-from data import ScrapedData
+from temporalio.exceptions import ActivityError, ApplicationError, ChildWorkflowError, FailureError
+from typing import Callable, Dict, List, Optional
+from data import ScrapedData, SentimentResults
 
 with workflow.unsafe.imports_passed_through():
     from activities import analyze_sentiment, store_results_in_sheets
     from reddit import scrape_reddit
     from twitter import scrape_twitter
+    from scheduling import (
+        AdaptivePoller, PollerState, PollPolicy, RecentIds, DEFAULT_POLICIES, MAX_POLLS_PER_RUN,
+    )
+    from partitioning import DEFAULT_PARTITIONS, LEGACY_ANALYZER_ID, analyzer_id, split_by_partition
+    from analysis_scheduler import AnalysisBudget, AnalysisScheduler
+    import task_queues
+    from task_queues import activity_task_queue
+    from backfill import (
+        ANALYZE_BATCH_SIZE, MAX_CHUNKS_PER_RUN, BackfillChunk, BackfillChunkResult,
+        BackfillProgress, BackfillRequest, pending_chunks, run_chunks, scrape_backfill_chunk,
+        split_chunks,
+    )
+
+# Scrapers started before analysis was partitioned replay their history
+# signalling the single LEGACY_ANALYZER_ID workflow; this patch marks the runs
+# that route to the partitioned analyzers instead.
+PARTITIONED_ANALYSIS_PATCH = "partitioned-analysis"
+
+# Signals to an analyzer that isn't running (e.g. one retired by a rebalance
+# this workflow hasn't heard about yet) are routed again this often, with the
+# partition count current at that time
+SIGNAL_RETRY_INTERVAL = timedelta(seconds=30)
+MAX_SIGNAL_ATTEMPTS = 10
+
+
+async def analyze_and_store(scraped_data: ScrapedData) -> SentimentResults:
+    """Analyze a batch of content, store the results and return them."""
+    # Analyze sentiment; both arguments are passed so each keeps its type
+    sentiment_results = await workflow.execute_activity(
+        analyze_sentiment,
+        args=[scraped_data, False],
+        task_queue=activity_task_queue(task_queues.ANALYSIS),
+        start_to_close_timeout=timedelta(minutes=5),
+        # Heartbeats are sent after every analyzed item
+        heartbeat_timeout=timedelta(minutes=2),
+        retry_policy=RetryPolicy(
+            initial_interval=timedelta(seconds=1),
+            maximum_interval=timedelta(minutes=1),
+            maximum_attempts=3,
+        )
+    )
+    
+    # Store the results in Google Sheets. Storing only fails while the
+    # primary store errors or the Sheets spool is full, so it is retried until
+    # it succeeds, holding analysis back instead of dropping results.
+    await workflow.execute_activity(
+        store_results_in_sheets,
+        sentiment_results,
+        task_queue=activity_task_queue(task_queues.ANALYSIS),
+        start_to_close_timeout=timedelta(minutes=2),
+        retry_policy=RetryPolicy(
+            initial_interval=timedelta(seconds=1),
+            maximum_interval=timedelta(minutes=5),
+        )
+    )
+    return sentiment_results
+
+
+async def send_to_analyzers(scraped_data: ScrapedData, partitions: Callable[[], int]) -> int:
+    """
+    Route scraped items to the analyzer partitions that own them.
+    
+    Args:
+        scraped_data: Items to route
+        partitions: Returns the current number of analyzer partitions, which
+            may change (see set_partitions) while failed signals are retried
+        
+    Returns:
+        int: Number of items dropped because no analyzer accepted them
+    """
+    pending = scraped_data
+    for attempt in range(1, MAX_SIGNAL_ATTEMPTS + 1):
+        parts = split_by_partition(pending, partitions())
+        results = await asyncio.gather(*(
+            workflow.get_external_workflow_handle(analyzer_id(partition)).signal("new_content", part)
+            for partition, part in parts.items()
+        ), return_exceptions=True)
+        
+        failed = []
+        for (partition, part), result in zip(parts.items(), results):
+            if isinstance(result, FailureError):
+                workflow.logger.warning(f"Signal to analyzer partition {partition} failed: {result}")
+                failed.extend(part.items)
+            elif isinstance(result, BaseException):
+                raise result
+        if not failed:
+            return 0
+        
+        pending = pending.model_copy(update={"items": failed})
+        if attempt < MAX_SIGNAL_ATTEMPTS:
+            await workflow.sleep(SIGNAL_RETRY_INTERVAL)
+    
+    workflow.logger.error(
+        f"Dropping {len(pending.items)} {pending.platform} items, no analyzer accepted them "
+        f"after {MAX_SIGNAL_ATTEMPTS} attempts"
+    )
+    return len(pending.items)
+
+
+async def send_scraped_content(scraped_data: ScrapedData, partitions: Callable[[], int]) -> None:
+    """Send a scraper's new content for analysis, see send_to_analyzers."""
+    if not workflow.patched(PARTITIONED_ANALYSIS_PATCH):
+        # A scraper run from before partitioning keeps using the single
+        # analyzer until it continues as new, or until that analyzer retires
+        try:
+            await workflow.get_external_workflow_handle(LEGACY_ANALYZER_ID).signal(
+                "new_content", scraped_data
+            )
+            return
+        except FailureError as e:
+            workflow.logger.info(f"Legacy analyzer unavailable, routing to partitions: {e}")
+    await send_to_analyzers(scraped_data, partitions)
+
+
+async def continue_polling_as_new(
+    policy: PollPolicy, partitions: int, poller: AdaptivePoller, seen: RecentIds,
+    cursors: Optional[Dict[str, str]] = None,
+) -> None:
+    """Continue a scraper workflow as new, carrying its polling state over."""
+    # Let in-flight signal handlers (e.g. set_partitions) finish first
+    await workflow.wait_condition(workflow.all_handlers_finished)
+    workflow.continue_as_new(args=[
+        policy,
+        partitions,
+        PollerState(poller.interval, seen.to_list(), dict(cursors or {})),
+    ])
+
 
 @workflow.defn
 class RedditScraperWorkflow:
+    def __init__(self) -> None:
+        self._partitions = DEFAULT_PARTITIONS
+    
+    @workflow.signal
+    async def set_partitions(self, partitions: int) -> None:
+        """Signal handler for changing the number of analyzer partitions"""
+        workflow.logger.info(f"Routing content to {partitions} analyzer partitions")
+        self._partitions = partitions
+    
     @workflow.run
-    async def run(self) -> None:
-        # Get the handle to the sentiment analyzer workflow (no await needed)
-        sentiment_analyzer = workflow.get_external_workflow_handle(
-            workflow_id="sentiment-analyzer"
-        )
+    async def run(
+        self,
+        policy: Optional[PollPolicy] = None,
+        partitions: int = DEFAULT_PARTITIONS,
+        state: Optional[PollerState] = None,
+    ) -> None:
+        self._partitions = partitions
+        policy = policy or DEFAULT_POLICIES["reddit"]
+        state = state or PollerState()
+        poller = AdaptivePoller(policy, state.interval_seconds)
+        seen = RecentIds(state.seen_ids)
         
-        while True:
-            # Execute the scraping activity
-            scraped_data = await workflow.execute_activity(
-                scrape_reddit,
-                start_to_close_timeout=timedelta(minutes=5),
-                retry_policy=RetryPolicy(
-                    initial_interval=timedelta(seconds=1),
-                    maximum_interval=timedelta(minutes=1),
-                    maximum_attempts=3,
+        for _ in range(MAX_POLLS_PER_RUN):
+            new_items = 0
+            rate_limited = False
+            try:
+                # Execute the scraping activity
+                scraped_data = await workflow.execute_activity(
+                    scrape_reddit,
+                    task_queue=activity_task_queue(task_queues.REDDIT),
+                    start_to_close_timeout=timedelta(minutes=5),
+                    heartbeat_timeout=timedelta(minutes=1),
+                    retry_policy=RetryPolicy(
+                        initial_interval=timedelta(seconds=1),
+                        maximum_interval=timedelta(minutes=1),
+                        maximum_attempts=3,
+                    )
                 )
-            )
-            
-            # Send the scraped data to the sentiment analyzer workflow via signal
-            await sentiment_analyzer.signal("new_content", scraped_data)
+                new_items = seen.add_new(item.id for item in scraped_data.items)
+                
+                # Send the scraped data to the sentiment analyzer partitions via signal
+                if scraped_data.items:
+                    await send_scraped_content(scraped_data, lambda: self._partitions)
+            except ActivityError as e:
+                # Treat a failed poll like a rate limit and back off
+                workflow.logger.warning(f"Reddit poll failed, backing off: {e}")
+                rate_limited = True
             
-            # Wait for 1 hour before next scrape
-            await workflow.sleep(timedelta(seconds=30))
+            # Wait before the next scrape, adapting to how busy the source is
+            interval = poller.next_interval(new_items, rate_limited, workflow.random().random())
+            workflow.logger.info(
+                f"Reddit poll found {new_items} new items, next poll in {interval}"
+            )
+            await workflow.sleep(interval)
+            if workflow.info().is_continue_as_new_suggested():
+                break
+        
+        await continue_polling_as_new(policy, self._partitions, poller, seen)
 
 @workflow.defn
 class SentimentAnalyzerWorkflow:
+    """
+    Analyzes the content of one partition, see partitioning.partition_for.
+    
+    Runs under the workflow id analyzer_id(partition). A rebalance signal with a
+    new partition count forwards queued items this analyzer no longer owns, and
+    an analyzer whose partition is no longer in range forwards everything and
+    completes. Scrapers still signalling it after that see the signal fail and
+    route the items again with their current partition count (see
+    send_to_analyzers).
+    """
+    
     def __init__(self) -> None:
-        self._content_queue: list[ScrapedData] = []
+        # Content awaiting analysis, ordered by priority and drained within
+        # the LLM budget (see analysis_scheduler.AnalysisScheduler)
+        self._scheduler = AnalysisScheduler(AnalysisBudget())
         self._processing_signal = False
         self._new_content_available = False
+        self._partition = 0
+        self._partitions = 1
+        self._rebalance_requested = False
     
     @workflow.signal
     async def new_content(self, scraped_data: ScrapedData) -> None:
         """Signal handler for receiving new content"""
-        self._content_queue.append(scraped_data)
+        self._scheduler.push(scraped_data, workflow.now().timestamp())
         self._new_content_available = True
         workflow.logger.info(
             f"Received {len(scraped_data.items)} items from {scraped_data.platform} "
             f"for analysis"
         )
     
+    @workflow.signal
+    async def rebalance(self, partitions: int, budget: Optional[AnalysisBudget] = None) -> None:
+        """
+        Signal handler for changing the number of analyzer partitions, along
+        with this partition's share of the LLM budget
+        """
+        self._partitions = partitions
+        if budget:
+            self._scheduler.set_budget(budget, workflow.now().timestamp())
+        self._rebalance_requested = True
+    
+    @workflow.query
+    def scheduler_stats(self) -> Dict:
+        """Queue size, remaining budget and number of shed items"""
+        return self._scheduler.stats(workflow.now().timestamp())
+    
+    @workflow.query
+    def deferred_items(self) -> Dict:
+        """Highest-priority items waiting for budget and recently shed items"""
+        return self._scheduler.deferred_items(workflow.now().timestamp())
+    
+    def _is_retired(self) -> bool:
+        return (
+            self._partition >= self._partitions
+            or workflow.info().workflow_id != analyzer_id(self._partition)
+        )
+    
+    async def _rebalance_queue(self) -> None:
+        """Forward queued items that now belong to other partitions."""
+        self._rebalance_requested = False
+        retired = self._is_retired()
+        # Content may keep arriving while we forward, so work on a detached queue
+        queue = self._scheduler.drain()
+        now = workflow.now().timestamp()
+        forwarded = 0
+        
+        for drained in queue:
+            for partition, part in split_by_partition(drained.scraped_data, self._partitions).items():
+                if partition == self._partition and not retired:
+                    # Kept items keep their priority and deferral deadline
+                    self._scheduler.push(part, now, drained)
+                else:
+                    await send_to_analyzers(part, lambda: self._partitions)
+                    forwarded += len(part.items)
+        
+        self._new_content_available = len(self._scheduler) > 0
+        workflow.logger.info(
+            f"Rebalanced to {self._partitions} partitions, forwarded {forwarded} items"
+        )
+    
     @workflow.run
-    async def run(self) -> None:
-        workflow.logger.info("Starting sentiment analyzer workflow")
+    async def run(
+        self, partition: int = 0, partitions: int = 1, budget: Optional[AnalysisBudget] = None
+    ) -> None:
+        self._partition = partition
+        self._partitions = partitions
+        if budget:
+            self._scheduler.budget = budget
+        workflow.logger.info(
+            f"Starting sentiment analyzer workflow for partition {partition} of {partitions}"
+        )
+        # The single analyzer started before partitioning analyzed every batch
+        # as it came, which its history must keep doing when it is replayed
+        legacy = not workflow.patched(PARTITIONED_ANALYSIS_PATCH)
         
         while True:
-            # Wait until new content is available
-            def has_content():
-                return self._new_content_available
+            # Wait until new content is available or a rebalance is requested
+            def has_work():
+                return self._new_content_available or self._rebalance_requested
             
             # Only wait if there's no content to process
-            if not self._new_content_available:
-                await workflow.wait_condition(has_content)
+            if not has_work():
+                await workflow.wait_condition(has_work)
             
-            # Process all available content
-            while self._content_queue:
-                # Reset the flag if we're about to process the last item
-                if len(self._content_queue) == 1:
-                    self._new_content_available = False
-                
-                # Get the next batch of content
-                scraped_data = self._content_queue.pop(0)
-                
-                workflow.logger.info(
-                    f"Processing {len(scraped_data.items)} items from {scraped_data.platform}"
-                )
+            if self._rebalance_requested:
+                await self._rebalance_queue()
+                if self._is_retired():
+                    # Forward anything that arrived while we were forwarding
+                    while len(self._scheduler):
+                        await self._rebalance_queue()
+                    workflow.logger.info("Analyzer partition retired after rebalance")
+                    return
+            
+            if legacy:
+                for drained in self._scheduler.drain():
+                    await self._analyze(drained.scraped_data)
+            
+            # Process available content, most important first and within budget
+            while len(self._scheduler) and not self._rebalance_requested:
+                batches = self._scheduler.next_batches(workflow.now().timestamp())
+                if not batches:
+                    # Over budget: the remaining items stay deferred until it refills
+                    await workflow.sleep(timedelta(
+                        seconds=self._scheduler.seconds_until_available(workflow.now().timestamp())
+                    ))
+                    continue
                 
-                # Analyze sentiment
-                sentiment_results = await workflow.execute_activity(
-                    analyze_sentiment,
-                    scraped_data,
+                for scraped_data in batches:
+                    await self._analyze(scraped_data)
+            
+            self._new_content_available = len(self._scheduler) > 0
+    
+    async def _analyze(self, scraped_data: ScrapedData) -> None:
+        """Analyze one batch of content and store the results."""
+        workflow.logger.info(
+            f"Processing {len(scraped_data.items)} items from {scraped_data.platform}"
+        )
+        # Lets sinks tell the partitions apart, e.g. their sheet summary rows
+        scraped_data = scraped_data.model_copy(update={
+            "metadata": {**(scraped_data.metadata or {}), "analyzer_partition": self._partition}
+        })
+        
+        sentiment_results = await analyze_and_store(scraped_data)
+        
+        # Log the results
+        workflow.logger.info(
+            f"Analyzed {len(scraped_data.items)} items from {scraped_data.platform}. "
+            f"Average sentiment: {sentiment_results.average_sentiment}, "
+            f"Distribution: {sentiment_results.distribution}"
+        )
+
+@workflow.defn
+class TwitterScraperWorkflow:
+    def __init__(self) -> None:
+        self._partitions = DEFAULT_PARTITIONS
+    
+    @workflow.signal
+    async def set_partitions(self, partitions: int) -> None:
+        """Signal handler for changing the number of analyzer partitions"""
+        workflow.logger.info(f"Routing content to {partitions} analyzer partitions")
+        self._partitions = partitions
+    
+    @workflow.run
+    async def run(
+        self,
+        policy: Optional[PollPolicy] = None,
+        partitions: int = DEFAULT_PARTITIONS,
+        state: Optional[PollerState] = None,
+    ) -> None:
+        self._partitions = partitions
+        policy = policy or DEFAULT_POLICIES["twitter"]
+        state = state or PollerState()
+        poller = AdaptivePoller(policy, state.interval_seconds)
+        seen = RecentIds(state.seen_ids)
+        # Newest tweet id seen per query shard, so each poll only fetches newer tweets
+        cursors: Dict[str, str] = dict(state.cursors)
+        
+        for _ in range(MAX_POLLS_PER_RUN):
+            new_items = 0
+            rate_limited = False
+            try:
+                # Execute the scraping activity
+                scraped_data = await workflow.execute_activity(
+                    scrape_twitter,
+                    cursors,
+                    task_queue=activity_task_queue(task_queues.TWITTER),
                     start_to_close_timeout=timedelta(minutes=5),
                     retry_policy=RetryPolicy(
                         initial_interval=timedelta(seconds=1),
@@ -90,49 +395,144 @@ class SentimentAnalyzerWorkflow:
                         maximum_attempts=3,
                     )
                 )
+                new_items = seen.add_new(item.id for item in scraped_data.items)
+                metadata = scraped_data.metadata or {}
+                rate_limited = bool(metadata.get("rate_limited"))
+                cursors.update(metadata.get("cursors") or {})
                 
-                # Store the results in Google Sheets
-                await workflow.execute_activity(
-                    store_results_in_sheets,
-                    sentiment_results,
-                    start_to_close_timeout=timedelta(minutes=2),
-                    retry_policy=RetryPolicy(
-                        initial_interval=timedelta(seconds=1),
-                        maximum_interval=timedelta(minutes=1),
-                        maximum_attempts=3,
-                    )
-                )
-                
-                # Log the results
-                workflow.logger.info(
-                    f"Analyzed {len(scraped_data.items)} items from {scraped_data.platform}. "
-                    f"Average sentiment: {sentiment_results['average_sentiment']}, "
-                    f"Distribution: {sentiment_results['distribution']}"
-                )
+                # Send the scraped data to the sentiment analyzer partitions via signal
+                if scraped_data.items:
+                    await send_scraped_content(scraped_data, lambda: self._partitions)
+            except ActivityError as e:
+                workflow.logger.warning(f"Twitter poll failed, backing off: {e}")
+                rate_limited = True
+            
+            # Wait before the next scrape - backs off on empty or rate-limited polls
+            interval = poller.next_interval(new_items, rate_limited, workflow.random().random())
+            workflow.logger.info(
+                f"Twitter poll found {new_items} new items, next poll in {interval}"
+            )
+            await workflow.sleep(interval)
+            if workflow.info().is_continue_as_new_suggested():
+                break
+        
+        await continue_polling_as_new(policy, self._partitions, poller, seen, cursors)
+
 
 @workflow.defn
-class TwitterScraperWorkflow:
+class BackfillChunkWorkflow:
+    """
+    Scrapes one backfill chunk and sends its content to the sentiment
+    analyzers, which analyze it within their LLM budget like live content.
+    """
+    
     @workflow.run
-    async def run(self) -> None:
-        # Get the handle to the sentiment analyzer workflow (no await needed)
-        sentiment_analyzer = workflow.get_external_workflow_handle(
-            workflow_id="sentiment-analyzer"
+    async def run(
+        self, chunk: BackfillChunk, partitions: int, items_per_minute: float
+    ) -> BackfillChunkResult:
+        scraped_data = await workflow.execute_activity(
+            scrape_backfill_chunk,
+            chunk,
+            task_queue=activity_task_queue(task_queues.BACKFILL),
+            start_to_close_timeout=timedelta(minutes=30),
+            heartbeat_timeout=timedelta(minutes=2),
+            retry_policy=RetryPolicy(
+                initial_interval=timedelta(seconds=5),
+                maximum_interval=timedelta(minutes=5),
+                maximum_attempts=5,
+            )
         )
+        metadata = scraped_data.metadata or {}
         
-        while True:
-            # Execute the scraping activity
-            scraped_data = await workflow.execute_activity(
-                scrape_twitter,
-                start_to_close_timeout=timedelta(minutes=5),
-                retry_policy=RetryPolicy(
-                    initial_interval=timedelta(seconds=1),
-                    maximum_interval=timedelta(minutes=1),
-                    maximum_attempts=3,
+        # Paced to items_per_minute: old content has a low priority, so the
+        # analyzers would shed it if it arrived faster than their budget
+        items = scraped_data.items
+        for start in range(0, len(items), ANALYZE_BATCH_SIZE):
+            if start:
+                await workflow.sleep(timedelta(seconds=ANALYZE_BATCH_SIZE * 60 / items_per_minute))
+            batch = scraped_data.model_copy(update={"items": items[start:start + ANALYZE_BATCH_SIZE]})
+            dropped = await send_to_analyzers(batch, lambda: partitions)
+            if dropped:
+                raise ApplicationError(
+                    f"No analyzer accepted {dropped} items of {chunk.key}", non_retryable=True
                 )
-            )
-            
-            # Send the scraped data to the sentiment analyzer workflow via signal
-            await sentiment_analyzer.signal("new_content", scraped_data)
-            
-            # Wait for 2 hours before next scrape - longer interval to avoid rate limits
-            await workflow.sleep(timedelta(minutes=1)) 
\ No newline at end of file
+        
+        workflow.logger.info(f"Sent {len(items)} backfilled items of {chunk.key} for analysis")
+        return BackfillChunkResult(
+            items=len(items),
+            complete=metadata.get("complete", True),
+            incomplete_reason=metadata.get("incomplete_reason"),
+            next_after=metadata.get("next_after"),
+        )
+
+@workflow.defn
+class BackfillWorkflow:
+    """
+    Backfills a time range for a list of sources.
+    
+    The range is split into chunks (see backfill.split_chunks) that run as
+    child workflows, at most request.max_concurrency at a time. The chunks of
+    a Reddit source run one after the other, each continuing the listing walk
+    of the previous one (see backfill.run_chunks). Completed and failed
+    chunks are checkpointed in BackfillProgress, which is carried over when
+    the workflow continues as new, so each chunk runs once per backfill.
+    """
+    
+    def __init__(self) -> None:
+        self._progress = BackfillProgress()
+        self._total_chunks = 0
+        self._running: List[str] = []
+    
+    @workflow.query
+    def progress(self) -> Dict:
+        """Chunk counts, running and failed chunks and the number of items backfilled"""
+        return {
+            "total_chunks": self._total_chunks,
+            "completed": len(self._progress.completed),
+            "failed": dict(self._progress.failed),
+            "running": list(self._running),
+            "items": self._progress.items,
+        }
+    
+    @workflow.run
+    async def run(
+        self, request: BackfillRequest, progress: Optional[BackfillProgress] = None
+    ) -> BackfillProgress:
+        if progress:
+            self._progress = progress
+        self._total_chunks = len(split_chunks(request))
+        pending = pending_chunks(request, self._progress)
+        workflow.logger.info(
+            f"Backfilling {len(pending)} of {self._total_chunks} chunks for {', '.join(request.sources)}"
+        )
+        
+        semaphore = asyncio.Semaphore(max(1, request.max_concurrency))
+        # Each running chunk gets an equal share of the analysis rate
+        items_per_minute = request.analysis_items_per_minute / max(1, request.max_concurrency)
+        
+        async def run_chunk(chunk: BackfillChunk) -> Optional[BackfillChunkResult]:
+            async with semaphore:
+                self._running.append(chunk.key)
+                try:
+                    return await workflow.execute_child_workflow(
+                        BackfillChunkWorkflow.run,
+                        args=[chunk, request.partitions, items_per_minute],
+                        id=f"{workflow.info().workflow_id}/{chunk.key}",
+                    )
+                except ChildWorkflowError as e:
+                    workflow.logger.error(f"Backfill chunk {chunk.key} failed: {e.cause or e}")
+                    self._progress.failed[chunk.key] = str(e.cause or e)
+                    return None
+                finally:
+                    self._running.remove(chunk.key)
+        
+        await run_chunks(request, self._progress, run_chunk, limit=MAX_CHUNKS_PER_RUN)
+        
+        if pending_chunks(request, self._progress):
+            workflow.continue_as_new(args=[request, self._progress])
+        
+        workflow.logger.info(
+            f"Backfill finished: {len(self._progress.completed)} chunks completed, "
+            f"{len(self._progress.failed)} failed, {self._progress.items} items"
+        )
+        return self._progress
@@ -0,0 +1,6 @@
+import sys
+from pathlib import Path
+
+# The modules in src/ import each other as top-level modules, as they do when
+# the worker runs from inside src/
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
@@ -0,0 +1,81 @@
+import json
+
+import pytest
+
+from aggregates import SentimentAggregator
+
+WINDOWS = {"1m": (60, 60), "1h": (3600, 60)}
+
+
+def record(content_id, analyzed_at, score=0.8):
+    return {
+        "platform": "reddit",
+        "source": "programming",
+        "content_id": content_id,
+        "sentiment_score": score,
+        "analyzed_at": analyzed_at,
+    }
+
+
+def test_reanalyzed_post_counts_once_per_bucket():
+    aggregator = SentimentAggregator(windows=WINDOWS)
+    assert aggregator.update_records([record("a", 1000.0), record("b", 1000.5)]) == 2
+    # The hot post "a" is analyzed again in the same minute, and again in a batch
+    assert aggregator.update_records([record("a", 1000.2), record("a", 1000.4)]) == 0
+
+    minute = aggregator.query(window="1m", now=1001.0)
+    assert minute["count"] == 2
+    assert minute["mean"] == 0.8
+
+
+def test_reanalyzed_post_moves_to_its_latest_bucket():
+    aggregator = SentimentAggregator(windows=WINDOWS)
+    aggregator.update_records([record("a", 1200.0)])
+    assert aggregator.update_records([record("a", 1230.0, score=0.2)]) == 0
+
+    # Counted once in each window, with its latest score
+    for window in ("1m", "1h"):
+        result = aggregator.query(window=window, now=1230.0)
+        assert result["count"] == 1
+        assert result["mean"] == 0.2
+
+
+def test_hot_post_counts_once_per_window():
+    aggregator = SentimentAggregator(windows=WINDOWS)
+    aggregator.update_records([record("cold", 3600.0, score=0.1)])
+    # Re-analyzed every 30 seconds for an hour
+    for step in range(120):
+        aggregator.update_records([record("hot", 3600.0 + 30 * step, score=0.9)])
+
+    hour = aggregator.query(window="1h", now=7199.0)
+    assert hour["count"] == 2
+    assert hour["mean"] == pytest.approx(0.5)
+    assert sum(hour["histogram"]) == 2
+
+
+def test_older_reanalysis_doesnt_replace_a_newer_one():
+    aggregator = SentimentAggregator(windows=WINDOWS)
+    aggregator.update_records([record("a", 1230.0, score=0.2)])
+    aggregator.update_records([record("a", 1200.0, score=0.9)])
+
+    assert aggregator.query(window="1h", now=1230.0)["mean"] == 0.2
+
+
+def test_records_without_id_are_not_deduplicated():
+    aggregator = SentimentAggregator(windows=WINDOWS)
+    aggregator.update_records([record(None, 1000.0), record(None, 1000.0)])
+
+    assert aggregator.query(window="1m", now=1000.0)["count"] == 2
+
+
+def test_snapshot_keeps_counted_posts():
+    aggregator = SentimentAggregator(windows=WINDOWS)
+    aggregator.update_records([record("a", 1000.0)])
+
+    restored = SentimentAggregator(windows=WINDOWS)
+    restored.restore(json.loads(json.dumps(aggregator.snapshot())))
+    restored.update_records([record("a", 1010.0, score=0.2)])
+
+    minute = restored.query(window="1m", now=1010.0)
+    assert minute["count"] == 1
+    assert minute["mean"] == 0.2
@@ -0,0 +1,79 @@
+import pytest
+
+from analysis_scheduler import AnalysisBudget, AnalysisScheduler, budget_from_env
+from data import Author, Content, ScrapedData
+
+
+def scraped(count, platform="reddit"):
+    return ScrapedData(platform=platform, timestamp=0, items=[
+        Content(id=str(i), text="x", author=Author(id="a"), created_at=0, platform=platform)
+        for i in range(count)
+    ])
+
+
+def test_queries_do_not_change_the_bucket():
+    scheduler = AnalysisScheduler(AnalysisBudget(requests_per_minute=60, burst=5))
+    scheduler.push(scraped(8), now=0)
+    scheduler.next_batches(now=0)
+
+    before = scheduler.stats(now=3)
+    scheduler.deferred_items(now=3)
+
+    assert scheduler.stats(now=3) == before
+    assert before["available_requests"] == 3
+    # Taking items later sees exactly the refill since the last take
+    assert sum(len(batch.items) for batch in scheduler.next_batches(now=3)) == 3
+
+
+@pytest.mark.parametrize("budget", [
+    dict(requests_per_minute=0),
+    dict(requests_per_minute=-1),
+    dict(burst=0),
+])
+def test_budget_rejects_values_that_would_stall(budget):
+    with pytest.raises(ValueError):
+        AnalysisBudget(**budget)
+
+
+def test_budget_from_env_rejects_zero_burst(monkeypatch):
+    monkeypatch.setenv("ANALYSIS_BURST", "0")
+
+    with pytest.raises(ValueError):
+        budget_from_env(4)
+
+
+def test_set_budget_applies_the_new_share():
+    scheduler = AnalysisScheduler(AnalysisBudget(requests_per_minute=60, burst=10))
+    scheduler.push(scraped(20), now=0)
+
+    scheduler.set_budget(AnalysisBudget(requests_per_minute=30, burst=4), now=0)
+
+    assert sum(len(batch.items) for batch in scheduler.next_batches(now=0)) == 4
+    assert scheduler.seconds_until_available(now=0) == 2
+
+
+def test_drained_items_pushed_back_keep_their_place():
+    scheduler = AnalysisScheduler(AnalysisBudget(max_deferral_seconds=100))
+    scheduler.push(scraped(2), now=0)
+    before = scheduler.deferred_items(now=60)["queued"]
+
+    # A rebalance keeps the items of this partition
+    for drained in scheduler.drain():
+        scheduler.push(drained.scraped_data, now=60, drained=drained)
+
+    assert scheduler.deferred_items(now=60)["queued"] == before
+    assert before[0]["waiting_seconds"] == 60
+    # They are still shed at their original deadline
+    assert scheduler.next_batches(now=101) == []
+    assert scheduler.stats(now=101)["shed_total"] == 2
+
+
+def test_new_items_pushed_with_a_drained_batch_are_queued_now():
+    scheduler = AnalysisScheduler(AnalysisBudget())
+    scheduler.push(scraped(1), now=0)
+    [drained] = scheduler.drain()
+
+    scheduler.push(scraped(2), now=60, drained=drained)
+
+    waiting = {item["id"]: item["waiting_seconds"] for item in scheduler.deferred_items(now=60)["queued"]}
+    assert waiting == {"0": 60, "1": 0}
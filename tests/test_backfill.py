@@ -0,0 +1,299 @@
+import asyncio
+import uuid
+from contextlib import asynccontextmanager
+
+import pytest
+from temporalio.client import Client
+from temporalio.testing import WorkflowEnvironment
+from temporalio.worker import Worker
+
+import fakes
+import task_queues
+from analysis_scheduler import AnalysisBudget
+from backfill import (
+    BackfillChunkResult, BackfillProgress, BackfillRequest, chunk_lanes, pending_chunks,
+    resume_progress, run_chunks, split_chunks,
+)
+from codec import build_data_converter, build_workflow_runner
+from partitioning import analyzer_id
+from task_queues import group_task_queue
+from worker import WORKFLOWS
+from workflows import BackfillWorkflow, SentimentAnalyzerWorkflow
+
+HOUR = 60 * 60
+PARTITIONS = 2
+
+
+def request(sources=("reddit:python", "twitter"), hours=4, chunk_hours=2):
+    return BackfillRequest(
+        sources=list(sources), start=0, end=hours * HOUR, chunk_seconds=chunk_hours * HOUR,
+        partitions=PARTITIONS, analysis_items_per_minute=60,
+    )
+
+
+def test_chunks_are_newest_first_with_sources_interleaved():
+    chunks = split_chunks(request(hours=5))
+
+    assert [chunk.key for chunk in chunks] == [
+        "reddit:python@10800-18000", "twitter@10800-18000",
+        "reddit:python@3600-10800", "twitter@3600-10800",
+        "reddit:python@0-3600", "twitter@0-3600",
+    ]
+
+
+def test_pending_chunks_skip_completed_and_failed_ones():
+    progress = BackfillProgress(
+        completed=["reddit:python@7200-14400"], failed={"twitter@0-7200": "out of reach"},
+    )
+
+    pending = pending_chunks(request(), progress)
+
+    assert [chunk.key for chunk in pending] == [
+        "twitter@7200-14400", "reddit:python@0-7200",
+    ]
+
+
+def test_reddit_chunks_share_a_lane_per_subreddit():
+    chunks = split_chunks(request(sources=("reddit:python", "reddit:rust", "twitter")))
+
+    lanes = [[chunk.key for chunk in lane] for lane in chunk_lanes(chunks)]
+
+    assert lanes == [
+        ["reddit:python@7200-14400", "reddit:python@0-7200"],
+        ["reddit:rust@7200-14400", "reddit:rust@0-7200"],
+        ["twitter@7200-14400"],
+        ["twitter@0-7200"],
+    ]
+
+
+def test_resume_retries_failed_chunks_and_keeps_cursors():
+    progress = BackfillProgress(
+        completed=["reddit:python@7200-14400"],
+        failed={"reddit:python@0-7200": "out of reach"},
+        items=2,
+        cursors={"reddit:python@7200": "t3_python-7200"},
+    )
+
+    resumed = resume_progress(progress)
+
+    assert resumed.failed == {}
+    assert resumed.completed == progress.completed
+    assert resumed.cursors == progress.cursors
+    assert [chunk.key for chunk in pending_chunks(request(sources=("reddit:python",)), resumed)] == [
+        "reddit:python@0-7200",
+    ]
+
+
+class ChunkRunner:
+    """Stands in for BackfillChunkWorkflow, scraping with the fake activity."""
+
+    def __init__(self, truncated=()):
+        self.truncated = set(truncated)
+        self.runs = []
+
+    async def __call__(self, chunk):
+        self.runs.append((chunk.key, chunk.after))
+        scraped_data = await fakes.fake_scrape_backfill_chunk(chunk)
+        metadata = scraped_data.metadata
+        if chunk.key in self.truncated:
+            return BackfillChunkResult(
+                items=len(scraped_data.items), complete=False, incomplete_reason="Too many pages",
+            )
+        return BackfillChunkResult(
+            items=len(scraped_data.items),
+            complete=metadata["complete"],
+            incomplete_reason=metadata["incomplete_reason"],
+            next_after=metadata.get("next_after"),
+        )
+
+
+async def test_reddit_chunks_continue_the_listing_walk():
+    runner = ChunkRunner()
+    progress = BackfillProgress()
+
+    await run_chunks(request(sources=("reddit:python",), hours=6), progress, runner)
+
+    assert runner.runs == [
+        ("reddit:python@14400-21600", None),
+        ("reddit:python@7200-14400", "t3_python-14400"),
+        ("reddit:python@0-7200", "t3_python-7200"),
+    ]
+    assert progress.items == 6
+    assert progress.failed == {}
+    # Only the cursor past the oldest chunk is left
+    assert progress.cursors == {"reddit:python@0": "t3_python-0"}
+
+
+async def test_out_of_reach_reddit_chunk_fails_the_older_ones(monkeypatch):
+    monkeypatch.setattr(fakes, "reddit_listing_start", 3 * HOUR)
+    runner = ChunkRunner()
+    progress = BackfillProgress()
+
+    await run_chunks(request(hours=6), progress, runner)
+
+    assert progress.failed == {
+        "reddit:python@7200-14400": "Older than the fake listing",
+        "reddit:python@0-7200": "Out of reach like reddit:python@7200-14400",
+    }
+    assert "reddit:python@0-7200" not in [key for key, _ in runner.runs]
+    assert sorted(progress.completed) == [
+        "reddit:python@14400-21600", "twitter@0-7200", "twitter@14400-21600", "twitter@7200-14400",
+    ]
+    assert progress.cursors == {"reddit:python@14400": "t3_python-14400"}
+
+
+async def test_truncated_twitter_chunk_fails_alone():
+    runner = ChunkRunner(truncated=["twitter@7200-14400"])
+    progress = BackfillProgress()
+
+    await run_chunks(request(sources=("twitter",), hours=6), progress, runner)
+
+    # Twitter chunks are searched independently, so older ones still run
+    assert progress.failed == {"twitter@7200-14400": "Too many pages"}
+    assert sorted(progress.completed) == ["twitter@0-7200", "twitter@14400-21600"]
+
+
+async def test_resumed_chunks_start_from_the_checkpointed_cursor(monkeypatch):
+    monkeypatch.setattr(fakes, "reddit_listing_start", 3 * HOUR)
+    backfill_request = request(sources=("reddit:python",), hours=6)
+    progress = BackfillProgress()
+    await run_chunks(backfill_request, progress, ChunkRunner())
+
+    monkeypatch.setattr(fakes, "reddit_listing_start", 0.0)
+    runner = ChunkRunner()
+    await run_chunks(backfill_request, resume_progress(progress), runner)
+
+    assert runner.runs == [
+        ("reddit:python@7200-14400", "t3_python-14400"),
+        ("reddit:python@0-7200", "t3_python-7200"),
+    ]
+
+
+async def test_limit_leaves_the_oldest_chunks_pending():
+    backfill_request = request(hours=6)
+    progress = BackfillProgress()
+
+    await run_chunks(backfill_request, progress, ChunkRunner(), limit=4)
+
+    assert [chunk.key for chunk in pending_chunks(backfill_request, progress)] == [
+        "reddit:python@0-7200", "twitter@0-7200",
+    ]
+    assert progress.cursors == {"reddit:python@7200": "t3_python-7200"}
+
+
+async def test_failed_chunk_runs_are_not_checkpointed():
+    progress = BackfillProgress()
+
+    async def run_chunk(chunk):
+        progress.failed[chunk.key] = "activity failed"
+        return None
+
+    await run_chunks(request(sources=("reddit:python",)), progress, run_chunk)
+
+    assert progress.completed == []
+    assert progress.cursors == {}
+    assert set(progress.failed) == {"reddit:python@7200-14400", "reddit:python@0-7200"}
+
+
+@pytest.fixture
+async def env():
+    try:
+        env = await WorkflowEnvironment.start_time_skipping(data_converter=build_data_converter())
+    except RuntimeError as e:
+        # The test server is downloaded on first use
+        pytest.skip(f"Temporal test server unavailable: {e}")
+    async with env:
+        yield env
+
+
+@asynccontextmanager
+async def backfill_workers(client: Client):
+    """Workers running the workflows and the fake activities, plus the analyzer partitions."""
+    task_queue = f"test-{uuid.uuid4()}"
+    workers = [
+        Worker(client, task_queue=task_queue, workflows=WORKFLOWS,
+               workflow_runner=build_workflow_runner()),
+        Worker(client, task_queue=group_task_queue(task_queue, task_queues.BACKFILL),
+               activities=[fakes.fake_scrape_backfill_chunk]),
+        Worker(client, task_queue=group_task_queue(task_queue, task_queues.ANALYSIS),
+               activities=[fakes.fake_analyze_sentiment, fakes.fake_store_results_in_sheets]),
+    ]
+    async with workers[0], workers[1], workers[2]:
+        for partition in range(PARTITIONS):
+            await client.start_workflow(
+                SentimentAnalyzerWorkflow.run,
+                args=[partition, PARTITIONS, AnalysisBudget(requests_per_minute=600, burst=50)],
+                id=analyzer_id(partition),
+                task_queue=task_queue,
+            )
+        yield task_queue
+
+
+async def run_backfill(client, task_queue, backfill_request, progress=None):
+    return await client.execute_workflow(
+        BackfillWorkflow.run,
+        args=[backfill_request, progress],
+        id=f"backfill-{uuid.uuid4()}",
+        task_queue=task_queue,
+    )
+
+
+async def stored_ids(count):
+    """Ids of the analyzed and stored items, once there are count of them."""
+    for _ in range(100):
+        ids = {post.id for result in fakes.stored_results for post in result.analyzed_posts}
+        if len(ids) >= count:
+            return ids
+        await asyncio.sleep(0.1)
+    return ids
+
+
+def stored_afters():
+    return {
+        post.id: result.metadata["original_metadata"]["after"]
+        for result in fakes.stored_results for post in result.analyzed_posts
+        if post.platform == "reddit"
+    }
+
+
+async def test_backfill_sends_every_chunk_to_the_analyzers(env, monkeypatch):
+    monkeypatch.setattr(fakes, "stored_results", [])
+    async with backfill_workers(env.client) as task_queue:
+        progress = await run_backfill(env.client, task_queue, request())
+
+        assert sorted(progress.completed) == sorted(chunk.key for chunk in split_chunks(request()))
+        assert progress.failed == {}
+        assert progress.items == 8
+        assert await stored_ids(8) == {
+            f"{name}-{hour * HOUR}" for name in ("python", "twitter") for hour in range(4)
+        }
+        # The older Reddit chunk continued the listing walk of the newer one
+        assert stored_afters() == {
+            "python-0": "t3_python-7200", "python-3600": "t3_python-7200",
+            "python-7200": None, "python-10800": None,
+        }
+
+
+async def test_backfill_resume_retries_out_of_reach_chunks(env, monkeypatch):
+    monkeypatch.setattr(fakes, "stored_results", [])
+    monkeypatch.setattr(fakes, "reddit_listing_start", 3 * HOUR)
+    backfill_request = request(hours=6)
+    async with backfill_workers(env.client) as task_queue:
+        progress = await run_backfill(env.client, task_queue, backfill_request)
+
+        # The listing ends inside the middle chunk, so it and every older
+        # Reddit chunk fail instead of being checkpointed as done
+        assert set(progress.failed) == {"reddit:python@7200-14400", "reddit:python@0-7200"}
+        assert "reddit:python@14400-21600" in progress.completed
+        assert progress.cursors == {"reddit:python@14400": "t3_python-14400"}
+
+        monkeypatch.setattr(fakes, "reddit_listing_start", 0.0)
+        resumed = await run_backfill(env.client, task_queue, backfill_request, resume_progress(progress))
+
+        assert resumed.failed == {}
+        assert sorted(resumed.completed) == sorted(chunk.key for chunk in split_chunks(backfill_request))
+        assert await stored_ids(12) >= {"python-0", "python-3600", "python-7200"}
+        # The retried chunks continued from the checkpointed listing positions
+        afters = stored_afters()
+        assert afters["python-7200"] == "t3_python-14400"
+        assert afters["python-0"] == "t3_python-7200"
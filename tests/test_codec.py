@@ -0,0 +1,154 @@
+import base64
+import logging
+
+import pytest
+from temporalio.client import WorkflowHistory
+from temporalio.worker import Replayer
+
+from analysis_scheduler import AnalysisBudget
+from backfill import BackfillChunk, BackfillProgress, BackfillRequest
+from codec import build_data_converter, build_workflow_runner
+from data import AnalyzedContent, Author, Content, ScrapedData, SentimentResults
+from scheduling import PollerState, PollPolicy
+from workflows import (
+    BackfillChunkWorkflow,
+    BackfillWorkflow,
+    RedditScraperWorkflow,
+    SentimentAnalyzerWorkflow,
+    TwitterScraperWorkflow,
+)
+
+WORKFLOWS = [
+    RedditScraperWorkflow,
+    SentimentAnalyzerWorkflow,
+    TwitterScraperWorkflow,
+    BackfillWorkflow,
+    BackfillChunkWorkflow,
+]
+
+
+async def started_history(data_converter, workflow_type, args):
+    """History of a workflow that has just started its first workflow task."""
+    payloads = await data_converter.encode(args)
+    encoded = [
+        {
+            "metadata": {
+                key: base64.b64encode(value).decode() for key, value in payload.metadata.items()
+            },
+            "data": base64.b64encode(payload.data).decode(),
+        }
+        for payload in payloads
+    ]
+    time = "2026-10-01T00:00:00Z"
+    return WorkflowHistory.from_json(f"test-{workflow_type}", {"events": [
+        {
+            "eventId": "1",
+            "eventTime": time,
+            "eventType": "EVENT_TYPE_WORKFLOW_EXECUTION_STARTED",
+            "workflowExecutionStartedEventAttributes": {
+                "workflowType": {"name": workflow_type},
+                "taskQueue": {"name": "test"},
+                "input": {"payloads": encoded},
+                "workflowTaskTimeout": "10s",
+                "originalExecutionRunId": "run",
+                "firstExecutionRunId": "run",
+                "attempt": 1,
+            },
+        },
+        {
+            "eventId": "2",
+            "eventTime": time,
+            "eventType": "EVENT_TYPE_WORKFLOW_TASK_SCHEDULED",
+            "workflowTaskScheduledEventAttributes": {
+                "taskQueue": {"name": "test"},
+                "startToCloseTimeout": "10s",
+                "attempt": 1,
+            },
+        },
+        {
+            "eventId": "3",
+            "eventTime": time,
+            "eventType": "EVENT_TYPE_WORKFLOW_TASK_STARTED",
+            "workflowTaskStartedEventAttributes": {"scheduledEventId": "2"},
+        },
+    ]})
+
+
+@pytest.mark.parametrize("encoding", ["msgpack", "json"])
+@pytest.mark.parametrize("workflow_type, args", [
+    ("SentimentAnalyzerWorkflow", [0, 4, AnalysisBudget()]),
+    ("RedditScraperWorkflow", [PollPolicy(), 4]),
+    ("TwitterScraperWorkflow", [PollPolicy(), 4]),
+    ("TwitterScraperWorkflow", [PollPolicy(), 4, PollerState(120, ["1"], {"q": "1"})]),
+    ("BackfillWorkflow", [BackfillRequest(sources=["twitter"], start=0, end=100000), None]),
+    ("BackfillWorkflow", [
+        BackfillRequest(sources=["reddit:python"], start=0, end=100000),
+        BackfillProgress(completed=["reddit:python@78400-100000"], cursors={"reddit:python@78400": "t3_x"}),
+    ]),
+    ("BackfillChunkWorkflow", [BackfillChunk("reddit:python", 0, 3600, after="t3_x"), 4, 5.0]),
+])
+async def test_workflows_start_in_sandbox(monkeypatch, caplog, encoding, workflow_type, args):
+    monkeypatch.setenv("PAYLOAD_ENCODING", encoding)
+    data_converter = build_data_converter()
+    replayer = Replayer(
+        workflows=WORKFLOWS,
+        data_converter=data_converter,
+        workflow_runner=build_workflow_runner(),
+    )
+
+    with caplog.at_level(logging.WARNING):
+        result = await replayer.replay_workflow(
+            await started_history(data_converter, workflow_type, args),
+            raise_on_replay_failure=False,
+        )
+
+    assert result.replay_failure is None
+    # A failed first workflow task is logged rather than reported as a replay failure
+    failures = [record for record in caplog.records if "Failed handling activation" in record.getMessage()]
+    assert not failures, failures[0].exc_text
+
+
+def test_msgpack_roundtrip_validates_records():
+    converter = build_data_converter().payload_converter
+    scraped = ScrapedData(
+        platform="reddit",
+        items=[Content(
+            id="1", text="hello", author=Author(id="a"), created_at=1.0, platform="reddit"
+        )],
+    )
+
+    [payload] = converter.to_payloads([scraped])
+    [decoded] = converter.from_payloads([payload], [ScrapedData])
+
+    assert payload.metadata["encoding"] == b"binary/msgpack"
+    assert decoded == scraped
+    assert isinstance(decoded.items[0].author, Author)
+
+
+def test_msgpack_rejects_invalid_records():
+    converter = build_data_converter().payload_converter
+    [payload] = converter.to_payloads([Content.model_construct(
+        id="1", title=None, text=None, author=Author(id="a"), created_at="not a time",
+        score=0, url=None, platform="reddit", engagement_metrics=None, replies=[],
+        platform_specific_data=None,
+    )])
+
+    with pytest.raises(Exception):
+        converter.from_payloads([payload], [Content])
+
+
+def test_msgpack_roundtrip_sentiment_results():
+    converter = build_data_converter().payload_converter
+    results = SentimentResults(
+        platform="reddit",
+        analyzed_posts=[AnalyzedContent(id="1", platform="reddit", sentiment_score=0.9, summary="ok")],
+        distribution={"positive": 1, "neutral": 0, "negative": 0},
+        average_sentiment=0.9,
+        metadata={"original_metadata": {"subreddit": "programming"}, "analysis_timestamp": 1.0},
+    )
+
+    [payload] = converter.to_payloads([results])
+    [decoded] = converter.from_payloads([payload], [SentimentResults])
+
+    assert decoded == results
+    assert isinstance(decoded.analyzed_posts[0], AnalyzedContent)
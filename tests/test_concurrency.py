@@ -0,0 +1,191 @@
+import asyncio
+from contextlib import nullcontext
+
+import pytest
+
+import concurrency
+from concurrency import AdaptiveLimiter, LimiterConfig, is_overload_error
+from fakes import SaturatingChatServer
+
+
+class Clock:
+    """Stands in for time.monotonic, so request latencies are exact."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+
+class RateLimited(Exception):
+    status_code = 429
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(concurrency, "time", clock)
+    return clock
+
+
+def limiter(**config):
+    return AdaptiveLimiter("test", LimiterConfig(**{"initial_limit": 4, "window": 20, **config}))
+
+
+async def request(limiter, clock, latency, error=None):
+    """One request taking latency seconds, failing with error if given."""
+    with pytest.raises(type(error)) if error else nullcontext():
+        async with limiter.slot():
+            clock.now += latency
+            if error:
+                raise error
+
+
+async def saturated_round(limiter, clock, latency, error=None):
+    """As many concurrent requests as the limit allows, all finishing together."""
+    release = asyncio.Event()
+    count = int(limiter.limit)
+
+    async def one():
+        async with limiter.slot():
+            await release.wait()
+            if error:
+                raise error
+
+    tasks = [asyncio.create_task(one()) for _ in range(count)]
+    while limiter.in_flight < count:
+        await asyncio.sleep(0)
+    clock.now += latency
+    release.set()
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    return [result for result in results if isinstance(result, BaseException)]
+
+
+async def test_limit_grows_after_a_healthy_saturated_window(clock):
+    adaptive = limiter()
+
+    while adaptive.requests_total < 20:
+        await saturated_round(adaptive, clock, 0.1)
+
+    assert adaptive.limit == 5
+
+
+async def test_limit_holds_when_requests_dont_use_it(clock):
+    adaptive = limiter()
+
+    for _ in range(40):
+        await request(adaptive, clock, 0.1)
+
+    assert adaptive.limit == 4
+
+
+async def test_high_p95_latency_trims_the_limit(clock):
+    adaptive = limiter()
+
+    for latency in [0.1] * 18 + [1.0] * 2:
+        await request(adaptive, clock, latency)
+
+    assert adaptive.limit == pytest.approx(4 * 0.9)
+
+
+async def test_high_error_rate_trims_the_limit(clock):
+    adaptive = limiter()
+
+    for index in range(20):
+        await request(adaptive, clock, 0.1, ValueError("bad") if index < 3 else None)
+
+    assert adaptive.limit == pytest.approx(4 * 0.9)
+    assert adaptive.errors_total == 3
+    assert adaptive.overloads_total == 0
+
+
+async def test_overload_halves_the_limit_once_per_burst(clock):
+    adaptive = limiter(initial_limit=8)
+
+    # Every request of the burst started before the first 429 came back
+    errors = await saturated_round(adaptive, clock, 0.1, RateLimited())
+
+    assert len(errors) == 8
+    assert adaptive.overloads_total == 8
+    assert adaptive.limit == 4
+
+    # A request started after the decrease counts again
+    await request(adaptive, clock, 0.1, RateLimited())
+
+    assert adaptive.limit == 2
+
+
+async def test_limit_stays_within_its_bounds(clock):
+    adaptive = limiter(initial_limit=2, min_limit=1, max_limit=3)
+
+    for _ in range(3):
+        await request(adaptive, clock, 0.1, RateLimited())
+    assert adaptive.limit == 1
+
+    while adaptive.requests_total < 200:
+        await saturated_round(adaptive, clock, 0.1)
+    assert adaptive.limit == 3
+
+
+def test_overload_errors():
+    class Response:
+        status = 503
+
+    class ServiceUnavailable(Exception):
+        response = Response()
+
+    assert is_overload_error(RateLimited())
+    assert is_overload_error(ServiceUnavailable())
+    assert is_overload_error(asyncio.TimeoutError())
+    assert not is_overload_error(ValueError())
+
+
+@pytest.fixture
+async def chat_server():
+    server = SaturatingChatServer(capacity=4, base_latency=0.02, queue_limit=8)
+    await server.start()
+    yield server
+    await server.close()
+
+
+async def run_completions(adaptive, server, count):
+    openai = pytest.importorskip("openai")
+    client = openai.AsyncOpenAI(base_url=server.base_url, api_key="test", max_retries=0)
+
+    async def one():
+        async with adaptive.slot():
+            await client.chat.completions.create(
+                model="gpt-4o-mini", messages=[{"role": "user", "content": "hello"}]
+            )
+
+    try:
+        return await asyncio.gather(*(one() for _ in range(count)), return_exceptions=True)
+    finally:
+        await client.close()
+
+
+async def test_limiter_backs_off_a_saturated_server(chat_server):
+    adaptive = limiter(initial_limit=32, max_limit=32)
+
+    await run_completions(adaptive, chat_server, 200)
+
+    # Bursts over the queue limit got 429s and halved the limit, which then
+    # settles around the queue limit instead of going back up
+    assert chat_server.responses.get(429, 0) > 0
+    assert adaptive.overloads_total == chat_server.responses[429]
+    assert chat_server.responses[429] < chat_server.responses[200] / 2
+    assert adaptive.limit < 2 * chat_server.queue_limit
+
+
+async def test_limiter_grows_towards_the_server_capacity(chat_server):
+    adaptive = limiter(initial_limit=1, max_limit=32)
+
+    # About one step per healthy window of 20, which stays below the queue
+    # limit; a slow window on a busy test machine may trim it again, so only
+    # growth itself is checked
+    await run_completions(adaptive, chat_server, 100)
+
+    assert chat_server.responses == {200: 100}
+    assert adaptive.limit > 1
+    assert chat_server.max_in_flight > 1
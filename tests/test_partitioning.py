@@ -0,0 +1,17 @@
+import pytest
+
+from partitioning import DEFAULT_PARTITIONS, partitions_from_env
+
+
+def test_partitions_default(monkeypatch):
+    monkeypatch.delenv("ANALYZER_PARTITIONS", raising=False)
+
+    assert partitions_from_env() == DEFAULT_PARTITIONS
+
+
+@pytest.mark.parametrize("value", ["0", "-2"])
+def test_partitions_from_env_rejects_values_below_one(monkeypatch, value):
+    monkeypatch.setenv("ANALYZER_PARTITIONS", value)
+
+    with pytest.raises(ValueError):
+        partitions_from_env()
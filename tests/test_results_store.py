@@ -0,0 +1,99 @@
+import pytest
+
+from results_store import ResultStore
+
+DAY = 24 * 60 * 60
+
+
+def record(content_id, score, analyzed_at, platform="reddit", summary="summary"):
+    return {
+        "platform": platform,
+        "content_id": content_id,
+        "source": "programming",
+        "title": f"post {content_id}",
+        "text": "text",
+        "summary": summary if score is not None else None,
+        "sentiment_score": score,
+        "created_at": analyzed_at - 10,
+        "analyzed_at": analyzed_at,
+        "analysis": {"sentiment_score": score} if score is not None else None,
+    }
+
+
+@pytest.fixture
+def store():
+    store = ResultStore(":memory:")
+    yield store
+    store.close()
+
+
+def test_upsert_keeps_one_row_per_post(store):
+    assert store.upsert([record("1", 0.2, 100), record("2", 0.4, 100)]) == 2
+
+    store.upsert([record("1", 0.8, 200, summary="updated")])
+
+    posts = {post["content_id"]: post for post in store.top_posts()}
+    assert len(posts) == 2
+    assert posts["1"]["sentiment_score"] == 0.8
+    assert posts["1"]["summary"] == "updated"
+    assert posts["1"]["analyzed_at"] == 200
+
+
+def test_failed_re_analysis_keeps_the_earlier_result(store):
+    store.upsert([record("1", 0.9, 100)])
+
+    store.upsert([record("1", None, 200)])
+
+    [post] = store.top_posts()
+    assert post["sentiment_score"] == 0.9
+    assert post["summary"] == "summary"
+    assert post["analyzed_at"] == 100
+
+
+def test_failed_first_analysis_is_stored_without_a_score(store):
+    store.upsert([record("1", None, 100)])
+    store.upsert([record("1", 0.3, 200)])
+
+    [post] = store.top_posts()
+    assert post["sentiment_score"] == 0.3
+    assert post["analyzed_at"] == 200
+
+
+def test_sentiment_trend_buckets_by_analysis_time(store):
+    store.upsert([
+        record("1", 0.2, 3600), record("2", 0.4, 3700),
+        record("3", 0.9, 7300), record("4", 0.5, 7400, platform="twitter"),
+    ])
+
+    trend = store.sentiment_trend(platform="reddit")
+
+    assert trend == [
+        {"bucket": 3600, "posts": 2, "average_sentiment": pytest.approx(0.3)},
+        {"bucket": 7200, "posts": 1, "average_sentiment": pytest.approx(0.9)},
+    ]
+    assert [bucket["bucket"] for bucket in store.sentiment_trend(since=7200)] == [7200]
+
+
+def test_top_posts_orders_by_score(store):
+    store.upsert([record(str(i), i / 10, 100 + i) for i in range(5)])
+    store.upsert([record("t", 1.0, 100, platform="twitter")])
+
+    assert [post["content_id"] for post in store.top_posts(platform="reddit", limit=2)] == ["4", "3"]
+    assert [post["content_id"] for post in store.top_posts(limit=2, most_negative=True)] == ["0", "1"]
+    assert [post["content_id"] for post in store.top_posts(since=103)] == ["4", "3"]
+
+
+def test_export_writes_one_partition_per_day(store, tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    store.upsert([record("1", 0.1, DAY + 10), record("2", 0.9, DAY + 20), record("3", 0.5, 2 * DAY + 5)])
+
+    paths = store.export_daily_partitions(str(tmp_path))
+
+    assert paths == [
+        str(tmp_path / "date=1970-01-02" / "part-0.parquet"),
+        str(tmp_path / "date=1970-01-03" / "part-0.parquet"),
+    ]
+    assert pq.read_table(paths[0]).column("content_id").to_pylist() == ["1", "2"]
+    assert pq.read_table(paths[1]).column("sentiment_score").to_pylist() == [0.5]
+    # Only the requested range is exported
+    assert len(store.export_daily_partitions(str(tmp_path / "recent"), since=2 * DAY)) == 1
@@ -0,0 +1,29 @@
+from scheduling import DEFAULT_POLICIES, AdaptivePoller, PollPolicy, RecentIds
+
+
+def test_full_reddit_poll_counts_as_busy():
+    poller = AdaptivePoller(DEFAULT_POLICIES["reddit"])
+    before = poller.interval
+
+    # scrape_reddit returns at most 3 hot posts
+    poller.next_interval(3, rate_limited=False, random_value=0.5)
+
+    assert poller.interval == before * DEFAULT_POLICIES["reddit"].speedup_factor
+
+
+def test_poller_resumes_from_saved_interval():
+    policy = PollPolicy(min_interval_seconds=10, max_interval_seconds=100, initial_interval_seconds=50)
+
+    assert AdaptivePoller(policy, 80).interval == 80
+    assert AdaptivePoller(policy, 1000).interval == 100
+    assert AdaptivePoller(policy).interval == 50
+
+
+def test_recent_ids_survive_a_round_trip():
+    seen = RecentIds(max_size=3)
+    seen.add_new(["a", "b", "c", "d"])
+
+    restored = RecentIds(seen.to_list(), max_size=3)
+
+    assert restored.to_list() == ["b", "c", "d"]
+    assert restored.add_new(["b", "d", "e"]) == 1
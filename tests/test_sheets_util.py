@@ -0,0 +1,112 @@
+from fakes import FakeGspreadClient
+from sheets_util import FAILED_ANALYSIS_SUMMARY, KEY_COLUMN, SheetsClient, build_sentiment_rows
+
+
+def results(platform="reddit", partition=None, posts=(("1", 0.9), ("2", 0.1))):
+    metadata = {"subreddit": "programming"}
+    if partition is not None:
+        metadata["analyzer_partition"] = partition
+    return {
+        "analyzed_posts": [
+            {"id": post_id, "platform": platform, "title": f"post {post_id}",
+             "sentiment_score": score, "summary": "summary"}
+            for post_id, score in posts
+        ],
+        "distribution": {"positive": 1, "neutral": 0, "negative": 1},
+        "average_sentiment": 0.5,
+        "platform": platform,
+        "metadata": {"original_metadata": metadata, "analysis_timestamp": 0},
+    }
+
+
+def sheets_client():
+    gspread_client = FakeGspreadClient()
+    return SheetsClient(client=gspread_client, sheet_id="sheet"), gspread_client.open_by_key("sheet").sheet1
+
+
+def keys(worksheet):
+    return [row[KEY_COLUMN - 1] for row in worksheet.rows]
+
+
+def test_upsert_appends_new_rows_in_one_call():
+    client, worksheet = sheets_client()
+
+    client.upsert_rows(build_sentiment_rows(results(), "t1"))
+
+    assert keys(worksheet) == ["reddit:1", "reddit:2", "SUMMARY:reddit"]
+    assert worksheet.calls == {"col_values": 1, "append_rows": 1}
+
+
+def test_re_upsert_updates_rows_in_place():
+    client, worksheet = sheets_client()
+    client.upsert_rows(build_sentiment_rows(results(), "t1"))
+
+    client.upsert_rows(build_sentiment_rows(results(posts=(("2", 0.7), ("3", 0.4))), "t2"))
+    client.upsert_rows(build_sentiment_rows(results(posts=(("2", 0.7), ("3", 0.4))), "t2"))
+
+    assert keys(worksheet) == ["reddit:1", "reddit:2", "SUMMARY:reddit", "reddit:3"]
+    rows = {row[KEY_COLUMN - 1]: row for row in worksheet.rows}
+    assert rows["reddit:1"][0] == "t1"
+    assert rows["reddit:2"][0] == "t2"
+    assert rows["reddit:2"][3] == 0.7
+    # The index is only read once; later batches are one update and at most one append
+    assert worksheet.calls == {"col_values": 1, "append_rows": 2, "batch_update": 2}
+
+
+def test_upsert_keeps_the_last_row_for_a_key_within_a_batch():
+    client, worksheet = sheets_client()
+
+    client.upsert_rows(build_sentiment_rows([
+        results(posts=(("1", 0.2),)), results(posts=(("1", 0.8),)),
+    ], "t1"))
+
+    assert keys(worksheet) == ["reddit:1", "SUMMARY:reddit"]
+    assert worksheet.rows[0][3] == 0.8
+
+
+def test_upsert_indexes_rows_already_in_the_sheet():
+    client, worksheet = sheets_client()
+    worksheet.rows = [["Timestamp", "Source", "Content", "Score", "Summary", "Key"],
+                      ["t0", "reddit", "old", 0.1, "old", "reddit:1"]]
+
+    client.upsert_rows(build_sentiment_rows(results(posts=(("1", 0.9),)), "t1"))
+
+    assert keys(worksheet) == ["Key", "reddit:1", "SUMMARY:reddit"]
+    assert worksheet.rows[1][3] == 0.9
+
+
+def test_summary_rows_are_kept_per_analyzer_partition():
+    client, worksheet = sheets_client()
+
+    client.upsert_rows(build_sentiment_rows(results(partition=0, posts=(("1", 0.9),)), "t1"))
+    client.upsert_rows(build_sentiment_rows(results(partition=1, posts=(("2", 0.1),)), "t1"))
+    client.upsert_rows(build_sentiment_rows(results(partition=0, posts=(("3", 0.5),)), "t2"))
+
+    summaries = [key for key in keys(worksheet) if key.startswith("SUMMARY:")]
+    assert summaries == ["SUMMARY:reddit:0", "SUMMARY:reddit:1"]
+
+
+def test_failed_re_analysis_keeps_the_earlier_row():
+    client, worksheet = sheets_client()
+    client.upsert_rows(build_sentiment_rows(results(posts=(("1", 0.9),)), "t1"))
+    failed = results(posts=(("1", None), ("2", None)))
+
+    client.upsert_rows(build_sentiment_rows(failed, "t2"))
+
+    rows = {row[KEY_COLUMN - 1]: row for row in worksheet.rows}
+    assert rows["reddit:1"][0] == "t1"
+    assert rows["reddit:1"][3] == 0.9
+    assert rows["reddit:1"][4] == "summary"
+    # A post with no earlier row still gets one, marked as failed
+    assert rows["reddit:2"][3] == ""
+    assert rows["reddit:2"][4] == FAILED_ANALYSIS_SUMMARY
+
+
+def test_failed_analysis_doesnt_replace_a_result_in_the_same_batch():
+    client, worksheet = sheets_client()
+
+    client.upsert_rows(build_sentiment_rows([
+        results(posts=(("1", 0.8),)), results(posts=(("1", None),)),
+    ], "t1"))
+
+    assert worksheet.rows[0][3] == 0.8
@@ -0,0 +1,104 @@
+import sqlite3
+
+import pytest
+
+import activities
+import sinks
+from aggregates import SentimentAggregator
+from data import AnalyzedContent, SentimentResults
+from sinks import ResultSink, extract_records
+from sheets_util import FAILED_ANALYSIS_SUMMARY, build_sentiment_rows
+from spool import SpoolFullError
+
+
+def sentiment_results():
+    return SentimentResults(
+        platform="reddit",
+        analyzed_posts=[
+            AnalyzedContent(id="1", platform="reddit", title="hello", sentiment_score=0.9, summary="good"),
+            # Projected without a summary or score, e.g. a failed analysis
+            AnalyzedContent(id="2", platform="reddit", text="world"),
+        ],
+        distribution={"positive": 1, "neutral": 1, "negative": 0},
+        average_sentiment=0.7,
+        metadata={"original_metadata": {"subreddit": "programming"}, "analysis_timestamp": 100.0},
+    )
+
+
+def test_extract_records_from_typed_results():
+    records = extract_records(sentiment_results())
+
+    assert [record["content_id"] for record in records] == ["1", "2"]
+    assert records[0]["source"] == "programming"
+    assert records[0]["sentiment_score"] == 0.9
+    assert records[0]["analyzed_at"] == 100.0
+    assert records[1]["sentiment_score"] is None
+
+
+def test_typed_and_dict_results_build_the_same_rows():
+    results = sentiment_results()
+
+    assert build_sentiment_rows(results, "t") == build_sentiment_rows(
+        results.model_dump(exclude_none=True), "t"
+    )
+    rows = build_sentiment_rows(results, "t")
+    # The failed analysis gets a blank score rather than a made-up 0
+    assert rows[1][3:5] == ["", FAILED_ANALYSIS_SUMMARY]
+    assert rows[-1][5] == "SUMMARY:reddit"
+
+
+class FakeSink(ResultSink):
+    def __init__(self, name, error=None):
+        self.name = name
+        self.error = error
+        self.written = []
+
+    def write(self, sentiment_results):
+        if self.error:
+            raise self.error
+        self.written.append(sentiment_results)
+        return True
+
+
+async def store_with(monkeypatch, sinks):
+    monkeypatch.setenv("RESULT_SINKS", ",".join(sink.name for sink in sinks))
+    monkeypatch.setattr(activities, "get_sinks", lambda: sinks)
+    return await activities.store_results_in_sheets(sentiment_results())
+
+
+async def test_primary_sink_failure_fails_the_activity(monkeypatch):
+    mirror = FakeSink("sheets")
+
+    with pytest.raises(sqlite3.OperationalError):
+        await store_with(monkeypatch, [FakeSink("sqlite", sqlite3.OperationalError("locked")), mirror])
+    # The mirror is written again on the retry, not before the primary store succeeds
+    assert mirror.written == []
+
+
+async def test_mirror_failure_is_best_effort(monkeypatch):
+    primary = FakeSink("sqlite")
+
+    stored = await store_with(monkeypatch, [primary, FakeSink("sheets", ValueError("quota"))])
+
+    assert stored is False
+    assert len(primary.written) == 1
+
+
+def test_close_sinks_writes_the_final_aggregates_snapshot(monkeypatch, tmp_path):
+    path = tmp_path / "aggregates.json"
+    monkeypatch.setenv("RESULT_SINKS", "aggregates")
+    monkeypatch.setenv("AGGREGATES_SNAPSHOT_PATH", str(path))
+    monkeypatch.setattr(sinks, "_sinks", None)
+    [sink] = sinks.get_sinks()
+    sink.write(sentiment_results())
+
+    sinks.close_sinks()
+
+    restored = SentimentAggregator.load(str(path))
+    assert restored.query(platform="reddit", window="1d", now=100.0)["count"] == 1
+    assert sinks._sinks is None
+
+
+async def test_full_sheets_spool_fails_the_activity(monkeypatch):
+    with pytest.raises(SpoolFullError):
+        await store_with(monkeypatch, [FakeSink("sqlite"), FakeSink("sheets", SpoolFullError("full"))])
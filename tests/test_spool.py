@@ -0,0 +1,120 @@
+import pytest
+
+from spool import RowSpool, SpoolFlusher, SpoolFullError
+
+
+class Rejected(Exception):
+    """A 4xx the sheet keeps returning, e.g. for its cell limit."""
+
+    status_code = 400
+
+
+class RateLimited(Exception):
+    status_code = 429
+
+
+class Writer:
+    """Batch writer failing with the queued errors first."""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.batches = []
+
+    def __call__(self, rows):
+        if self.errors:
+            raise self.errors.pop(0)
+        self.batches.append(rows)
+
+
+def rows(*values):
+    return [[value] for value in values]
+
+
+@pytest.fixture
+def spool(tmp_path):
+    spool = RowSpool(str(tmp_path / "spool.db"), max_rows=10)
+    yield spool
+    spool.close()
+
+
+def test_rows_are_peeked_in_insertion_order(spool):
+    spool.append(rows("a", "b"))
+    spool.append(rows("c"))
+
+    assert [row for _, row in spool.peek(10)] == rows("a", "b", "c")
+    assert [row for _, row in spool.peek(2)] == rows("a", "b")
+
+
+def test_unacknowledged_rows_are_replayed_after_a_restart(spool, tmp_path):
+    spool.append(rows("a", "b", "c"))
+    batch = spool.peek(2)
+    spool.ack(batch[0][0])
+    spool.close()
+
+    # Crashed after writing "b" but before acknowledging it
+    reopened = RowSpool(str(tmp_path / "spool.db"))
+    assert [row for _, row in reopened.peek(10)] == rows("b", "c")
+    assert reopened.pending() == 2
+    reopened.close()
+
+
+def test_append_is_bounded_and_atomic(spool):
+    spool.append(rows(*range(8)))
+
+    with pytest.raises(SpoolFullError):
+        spool.append(rows(8, 9, 10))
+
+    assert spool.pending() == 8
+    spool.append(rows(8, 9))
+    assert spool.pending() == 10
+
+
+async def test_flusher_writes_batches_in_order(spool):
+    spool.append(rows("a", "b", "c"))
+    writer = Writer()
+    flusher = SpoolFlusher(spool, writer, batch_size=2)
+
+    assert await flusher.flush_once() == 2
+    assert await flusher.flush_once() == 1
+    assert await flusher.flush_once() == 0
+
+    assert writer.batches == [rows("a", "b"), rows("c")]
+    assert spool.pending() == 0
+
+
+async def test_failed_batch_is_retried_before_later_rows(spool):
+    spool.append(rows("a", "b"))
+    writer = Writer(ConnectionError("reset"), RateLimited())
+    flusher = SpoolFlusher(spool, writer, batch_size=1, max_rejections=1)
+
+    for error in (ConnectionError, RateLimited):
+        with pytest.raises(error):
+            await flusher.flush_once()
+        assert spool.pending() == 2
+    await flusher.flush_once()
+    await flusher.flush_once()
+
+    # Transient failures never dead-letter, however often they happen
+    assert writer.batches == [rows("a"), rows("b")]
+    assert spool.dead_letters() == []
+
+
+async def test_rejected_batch_is_dead_lettered(spool):
+    spool.append(rows("a", "b", "c"))
+    writer = Writer(Rejected("cell limit"), Rejected("cell limit"))
+    flusher = SpoolFlusher(spool, writer, batch_size=2, max_rejections=2)
+
+    with pytest.raises(Rejected):
+        await flusher.flush_once()
+    assert await flusher.flush_once() == 2
+    await flusher.flush_once()
+
+    # The rows behind the rejected batch are no longer blocked
+    assert writer.batches == [rows("c")]
+    assert [(error, row) for _, error, row in spool.dead_letters()] == [
+        ("cell limit", ["a"]), ("cell limit", ["b"]),
+    ]
+
+    assert spool.requeue_dead_letters() == 2
+    assert spool.dead_letters() == []
+    assert [row for _, row in spool.peek(10)] == rows("a", "b")
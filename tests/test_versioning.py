@@ -0,0 +1,160 @@
+import base64
+import logging
+
+from temporalio.client import WorkflowHistory
+from temporalio.worker import Replayer
+
+from codec import build_data_converter, build_workflow_runner
+from data import Author, Content, ScrapedData
+from workflows import RedditScraperWorkflow
+
+TIME = "2026-10-01T00:00:00Z"
+
+
+def encode(payloads):
+    return {"payloads": [
+        {
+            "metadata": {
+                key: base64.b64encode(value).decode() for key, value in payload.metadata.items()
+            },
+            "data": base64.b64encode(payload.data).decode(),
+        }
+        for payload in payloads
+    ]}
+
+
+def workflow_task(first_id):
+    """Scheduled, started and completed events of one workflow task."""
+    return [
+        {
+            "eventId": str(first_id),
+            "eventTime": TIME,
+            "eventType": "EVENT_TYPE_WORKFLOW_TASK_SCHEDULED",
+            "workflowTaskScheduledEventAttributes": {
+                "taskQueue": {"name": "test"}, "startToCloseTimeout": "10s", "attempt": 1,
+            },
+        },
+        {
+            "eventId": str(first_id + 1),
+            "eventTime": TIME,
+            "eventType": "EVENT_TYPE_WORKFLOW_TASK_STARTED",
+            "workflowTaskStartedEventAttributes": {"scheduledEventId": str(first_id)},
+        },
+        {
+            "eventId": str(first_id + 2),
+            "eventTime": TIME,
+            "eventType": "EVENT_TYPE_WORKFLOW_TASK_COMPLETED",
+            "workflowTaskCompletedEventAttributes": {
+                "scheduledEventId": str(first_id), "startedEventId": str(first_id + 1),
+            },
+        },
+    ]
+
+
+async def legacy_reddit_scraper_history(data_converter):
+    """
+    History of a Reddit scraper started before analysis was partitioned: one
+    poll whose content was signalled to the single sentiment analyzer.
+    """
+    # Enough posts to span several partitions, i.e. several signals today
+    scraped = ScrapedData(platform="reddit", items=[
+        Content(id=f"p{i}", text="hello", author=Author(id="a"), created_at=1.0, platform="reddit")
+        for i in range(8)
+    ])
+    result = encode(await data_converter.encode([scraped]))
+    events = [{
+        "eventId": "1",
+        "eventTime": TIME,
+        "eventType": "EVENT_TYPE_WORKFLOW_EXECUTION_STARTED",
+        "workflowExecutionStartedEventAttributes": {
+            "workflowType": {"name": "RedditScraperWorkflow"},
+            "taskQueue": {"name": "test"},
+            "workflowTaskTimeout": "10s",
+            "originalExecutionRunId": "run",
+            "firstExecutionRunId": "run",
+            "attempt": 1,
+        },
+    }]
+    events += workflow_task(2)
+    events += [
+        {
+            "eventId": "5",
+            "eventTime": TIME,
+            "eventType": "EVENT_TYPE_ACTIVITY_TASK_SCHEDULED",
+            "activityTaskScheduledEventAttributes": {
+                "activityId": "1",
+                "activityType": {"name": "scrape_reddit"},
+                "taskQueue": {"name": "test"},
+                "startToCloseTimeout": "300s",
+                "workflowTaskCompletedEventId": "4",
+            },
+        },
+        {
+            "eventId": "6",
+            "eventTime": TIME,
+            "eventType": "EVENT_TYPE_ACTIVITY_TASK_STARTED",
+            "activityTaskStartedEventAttributes": {"scheduledEventId": "5", "attempt": 1},
+        },
+        {
+            "eventId": "7",
+            "eventTime": TIME,
+            "eventType": "EVENT_TYPE_ACTIVITY_TASK_COMPLETED",
+            "activityTaskCompletedEventAttributes": {
+                "result": result, "scheduledEventId": "5", "startedEventId": "6",
+            },
+        },
+    ]
+    events += workflow_task(8)
+    events += [
+        {
+            "eventId": "11",
+            "eventTime": TIME,
+            "eventType": "EVENT_TYPE_SIGNAL_EXTERNAL_WORKFLOW_EXECUTION_INITIATED",
+            "signalExternalWorkflowExecutionInitiatedEventAttributes": {
+                "workflowTaskCompletedEventId": "10",
+                "namespace": "default",
+                "workflowExecution": {"workflowId": "sentiment-analyzer"},
+                "signalName": "new_content",
+                "input": result,
+            },
+        },
+        {
+            "eventId": "12",
+            "eventTime": TIME,
+            "eventType": "EVENT_TYPE_EXTERNAL_WORKFLOW_EXECUTION_SIGNALED",
+            "externalWorkflowExecutionSignaledEventAttributes": {
+                "initiatedEventId": "11",
+                "namespace": "default",
+                "workflowExecution": {"workflowId": "sentiment-analyzer"},
+            },
+        },
+    ]
+    events += workflow_task(13)
+    events += [{
+        "eventId": "16",
+        "eventTime": TIME,
+        "eventType": "EVENT_TYPE_TIMER_STARTED",
+        "timerStartedEventAttributes": {
+            "timerId": "1", "startToFireTimeout": "60s", "workflowTaskCompletedEventId": "15",
+        },
+    }]
+    return WorkflowHistory.from_json("reddit-scraper", {"events": events})
+
+
+async def test_scraper_started_before_partitioning_replays(caplog):
+    data_converter = build_data_converter()
+    replayer = Replayer(
+        workflows=[RedditScraperWorkflow],
+        data_converter=data_converter,
+        workflow_runner=build_workflow_runner(),
+    )
+
+    with caplog.at_level(logging.WARNING):
+        result = await replayer.replay_workflow(
+            await legacy_reddit_scraper_history(data_converter),
+            raise_on_replay_failure=False,
+        )
+
+    assert result.replay_failure is None
+    failures = [record for record in caplog.records if "Failed handling activation" in record.getMessage()]
+    assert not failures, failures[0].exc_text